@@ -0,0 +1,202 @@
+"""Benchmarks: MissionControl.connect, RPC throughput, heartbeat telemetry and curio task scheduling, all against the
+curiousksp.standin kRPC server so that they run (reproducibly) without KSP.
+
+Every benchmark reports its rate, latency percentiles and the kernel stall time - how late a 1 ms ticker Task woke up
+while it ran. Save the results with --json and pass an older file to --compare to spot regressions between versions.
+
+Usage:
+    bench_missioncontrol.py [--json=<file>] [--compare=<file>] [--latency=<s>] [--quick]
+
+Options:
+    --json=<file>     Save the results (with version/platform info) to file as JSON
+    --compare=<file>  Print the change of every result against a JSON file saved by an earlier run
+    --latency=<s>     Latency injected into every stand-in kRPC call [default: 0.0005]
+    --quick           Run each benchmark for a fraction of the usual time, e.g. for a smoke test
+"""
+import json
+import platform
+import signal
+import sys
+from datetime import datetime, timezone
+
+import curio
+from docopt import docopt
+
+import curiousksp
+from curiousksp import asynkrpc
+from curiousksp.asyncrpc import AsyncClient
+from curiousksp.histogram import LogHistogram
+from curiousksp.missioncontrol import MissionControl
+from curiousksp.standin import StandInServer
+from curiousksp.telemetry import Telemetry
+
+
+async def _ticker(stalls, interval=0.001):
+    """Task (daemonic): sleep interval over and over, recording how late each wake-up is - the kernel stall time."""
+    while True:
+        start = await curio.clock()
+        await curio.sleep(interval)
+        stalls.record(max(0.0, await curio.clock() - start - interval))
+
+
+def _results(rate_unit, count, elapsed, latencies, stalls):
+    """Return the result dict of a benchmark run: rate, latency percentiles (ms) and kernel stalls (ms)."""
+    return {f"{rate_unit}_per_s": count / elapsed, "count": count,
+            "latency_p50_ms": latencies.percentile(50) * 1e3, "latency_p99_ms": latencies.percentile(99) * 1e3,
+            "latency_max_ms": latencies.max * 1e3, "stall_p99_ms": stalls.percentile(99) * 1e3,
+            "stall_max_ms": stalls.max * 1e3, "stall_total_ms": stalls.total * 1e3}
+
+
+def _mission_control(server):
+    """Return a MissionControl for the stand-in server, leaving Ctrl-C to interrupt the benchmarks."""
+    mc = MissionControl(name="bench", krpc_port=server.port, krpcs_port=server.stream_port)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    return mc
+
+
+async def bench_connect(latency, n=20):
+    """Connect (blocking krpc.connect in a thread, as the pool does) n times in a row."""
+    server = await StandInServer(latency=latency).add_space_center().start()
+    mc = _mission_control(server)
+    latencies, stalls = LogHistogram(), LogHistogram()
+    ticker = await curio.spawn(_ticker, stalls, daemon=True)
+    start = await curio.clock()
+    for _ in range(n):
+        t = await curio.clock()
+        conn = await mc.connect("bench")
+        latencies.record(await curio.clock() - t)
+        await curio.run_in_thread(conn.close)
+    elapsed = await curio.clock() - start
+    await ticker.cancel()
+    await server.stop()
+    return _results("connects", n, elapsed, latencies, stalls)
+
+
+async def bench_rpc(latency, n=2000, concurrency=1):
+    """Invoke SpaceCenter.get_UT n times from concurrency Tasks sharing one native (asynkrpc) connection."""
+    server = await StandInServer(latency=latency).add_space_center().start()
+    client = await asynkrpc.connect("bench", rpc_port=server.port)
+    latencies, stalls = LogHistogram(), LogHistogram()
+    ticker = await curio.spawn(_ticker, stalls, daemon=True)
+
+    async def caller(calls):
+        for _ in range(calls):
+            t = await curio.clock()
+            await client.invoke("SpaceCenter", "get_UT")
+            latencies.record(await curio.clock() - t)
+
+    start = await curio.clock()
+    async with curio.TaskGroup() as g:
+        for _ in range(concurrency):
+            await g.spawn(caller, n // concurrency)
+    elapsed = await curio.clock() - start
+    await ticker.cancel()
+    await client.close()
+    await server.stop()
+    return _results("rpcs", n // concurrency * concurrency, elapsed, latencies, stalls)
+
+
+async def bench_heartbeat(latency, seconds=2.0, rate=100):
+    """Run MissionControl.heartbeat on a krpc.status stream at rate Hz, latency being the interval between updates."""
+    server = await StandInServer(latency=latency, stream_interval=1 / rate).start()
+    mc = _mission_control(server)
+    conn = await mc.connect("bench")
+    # what MissionControl.start does once connected, without its connect polling and fixed run time
+    mc._telemetry = Telemetry(AsyncClient(conn, name="bench"))
+    await mc._telemetry.register("krpc.status", "krpc.get_status", rate=rate)
+    updates = mc._telemetry.subscribe("krpc.status")
+    latencies, stalls = LogHistogram(), LogHistogram()
+    ticker = await curio.spawn(_ticker, stalls, daemon=True)
+    beat = await curio.spawn(mc.heartbeat, 1 / rate, daemon=True)
+    count, start = 0, await curio.clock()
+    last = start
+    while (now := await curio.clock()) - start < seconds:
+        async with curio.ignore_after(start + seconds - now):
+            await updates.get()
+            now = await curio.clock()
+            latencies.record(now - last)
+            count, last = count + 1, now
+    elapsed = await curio.clock() - start
+    await beat.cancel()
+    await ticker.cancel()
+    await mc._telemetry.close()
+    await mc._telemetry.conn.close()
+    await curio.run_in_thread(conn.close)
+    await server.stop()
+    results = _results("updates", count, elapsed, latencies, stalls)
+    results["recorded"] = len(mc.timeseries.query("krpc.status.rpc_rate"))
+    return results
+
+
+async def bench_scheduling(tasks=100, seconds=1.0):
+    """Run tasks Tasks that only yield to the kernel, latency being the time for a Task to come round again."""
+    latencies, stalls = LogHistogram(), LogHistogram()
+    ticker = await curio.spawn(_ticker, stalls, daemon=True)
+    cycles = 0
+    deadline = await curio.clock() + seconds
+
+    async def spinner():
+        nonlocal cycles
+        last = await curio.clock()
+        while last < deadline:
+            await curio.sleep(0)
+            now = await curio.clock()
+            latencies.record(now - last)
+            cycles, last = cycles + 1, now
+
+    start = await curio.clock()
+    async with curio.TaskGroup() as g:
+        for _ in range(tasks):
+            await g.spawn(spinner)
+    elapsed = await curio.clock() - start
+    await ticker.cancel()
+    return _results("switches", cycles, elapsed, latencies, stalls)
+
+
+def run(latency=0.0005, quick=False):
+    """Run every benchmark in its own kernel and return {name: results}."""
+    scale = 0.1 if quick else 1.0
+    benchmarks = {
+        "connect": lambda: bench_connect(latency, n=max(2, int(20 * scale))),
+        "rpc_sequential": lambda: bench_rpc(latency, n=int(2000 * scale), concurrency=1),
+        "rpc_concurrent_16": lambda: bench_rpc(latency, n=int(2000 * scale), concurrency=16),
+        "heartbeat_100hz": lambda: bench_heartbeat(latency, seconds=2.0 * scale),
+        "scheduling_100_tasks": lambda: bench_scheduling(tasks=100, seconds=1.0 * scale),
+    }
+    results = {}
+    for name, bench in benchmarks.items():
+        results[name] = curio.run(bench)
+        metrics = (f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in results[name].items())
+        print(f"{name:<22} " + ", ".join(metrics))
+    return results
+
+
+def compare(results, previous):
+    """Print the change of each result against the results of an earlier run."""
+    print(f"compared to curiousksp {previous['curiousksp']} ({previous['timestamp']}):")
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            if (old := previous["results"].get(name, {}).get(metric)) is None:
+                continue
+            change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"  {name + '.' + metric:<45} {old:>12.3f} -> {value:>12.3f}  {change}")
+
+
+def main(argv=None):
+    """Run the benchmarks, then save and/or compare the results."""
+    args = docopt(__doc__, argv=argv)
+    results = run(latency=float(args["--latency"]), quick=args["--quick"])
+    report = {"curiousksp": curiousksp.__version__, "python": platform.python_version(),
+              "platform": platform.platform(), "timestamp": datetime.now(timezone.utc).isoformat(),
+              "latency_s": float(args["--latency"]), "quick": args["--quick"], "results": results}
+    if args["--compare"]:
+        with open(args["--compare"], encoding="utf8") as f:
+            compare(results, json.load(f))
+    if args["--json"]:
+        with open(args["--json"], "w", encoding="utf8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
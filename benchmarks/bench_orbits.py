@@ -0,0 +1,76 @@
+"""Benchmark: predicting orbit positions by an Orbit.PositionAt RPC per sample vs curiousksp.orbits' local propagation,
+against the curiousksp.standin kRPC server so that it runs (reproducibly) without KSP.
+
+Usage:
+    bench_orbits.py [--latency=<s>] [--orbits=<n>] [--times=<n>]
+
+Options:
+    --latency=<s>  Latency injected into every stand-in kRPC call [default: 0.0005]
+    --orbits=<n>   Number of vessel orbits predicted [default: 10]
+    --times=<n>    Number of times each orbit is predicted at [default: 100]
+"""
+import sys
+import time
+
+import curio
+import numpy as np
+from docopt import docopt
+
+from curiousksp import asynkrpc
+from curiousksp.orbits import Orbits
+from curiousksp.standin import StandInServer
+
+
+def _server(latency, orbits):
+    """Return a stand-in server with orbits vessels on assorted orbits around Kerbin."""
+    server = StandInServer(latency=latency).add_space_center()
+    sc = server.space_center
+    rng = np.random.default_rng(1)
+    for i in range(1, orbits + 1):
+        sc["orbits"][i] = {"body": 1, "a": rng.uniform(700e3, 5e6), "e": rng.uniform(0, 0.7),
+                           "inc": rng.uniform(0, 1), "lan": rng.uniform(0, 6), "argp": rng.uniform(0, 6),
+                           "m0": rng.uniform(-3, 3), "epoch": 0.0}
+        sc["vessels"][i] = dict(sc["vessels"][1], name=f"vessel {i}", orbit=i)
+    return server
+
+
+async def bench(latency, orbits=10, times=100):
+    """Predict orbits x times positions both ways and return the time taken, RPC requests made and largest error."""
+    server = await _server(latency, orbits).start()
+    client = await asynkrpc.connect("bench", rpc_port=server.port)
+    vessels = await client.invoke("SpaceCenter", "get_Vessels")
+    frame = await client.invoke("SpaceCenter", "CelestialBody_get_NonRotatingReferenceFrame",
+                                client.remote_object("SpaceCenter", "CelestialBody", 1))
+    uts = np.linspace(0, 86400, times)
+    results = {}
+
+    requests, start = client.requests, time.perf_counter()
+    remotes = [await client.invoke("SpaceCenter", "Vessel_get_Orbit", v) for v in vessels]
+    rpc = np.array([[await client.invoke("SpaceCenter", "Orbit_PositionAt", o, t, frame) for t in uts.tolist()]
+                    for o in remotes])
+    results["rpc"] = {"seconds": time.perf_counter() - start, "requests": client.requests - requests}
+
+    requests, start = client.requests, time.perf_counter()
+    local = (await Orbits.of(client, vessels)).positions(uts)
+    results["local"] = {"seconds": time.perf_counter() - start, "requests": client.requests - requests}
+    results["local"]["max_error_m"] = float(np.max(np.linalg.norm(local - rpc, axis=-1)))
+
+    await client.close()
+    await server.stop()
+    return results
+
+
+def main(argv=None):
+    """Run the benchmark and print both paths' time, requests and the speedup."""
+    args = docopt(__doc__, argv=argv)
+    orbits, times = int(args["--orbits"]), int(args["--times"])
+    results = curio.run(bench, float(args["--latency"]), orbits, times)
+    for name, metrics in results.items():
+        print(f"{name:<6} " + ", ".join(f"{k}={v:.4f}" if isinstance(v, float) else f"{k}={v}"
+                                        for k, v in metrics.items()))
+    print(f"{orbits * times} positions {results['rpc']['seconds'] / results['local']['seconds']:.0f}x faster locally")
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,48 @@
+"""Micro-benchmark: heartbeat status formatting with pint Quantities vs curiousksp.units.
+
+Run with `python benchmarks/bench_units.py`.
+"""
+import timeit
+from types import SimpleNamespace
+
+from curiousksp import ureg
+from curiousksp.missioncontrol import MissionControl
+
+status = SimpleNamespace(rpcs_executed=123456, rpc_rate=87.3, bytes_read=12345678, bytes_read_rate=2345.6,
+                         bytes_written=987654321, bytes_written_rate=34567.8, time_per_rpc_update=0.00123,
+                         poll_time_per_rpc_update=0.00023, exec_time_per_rpc_update=0.001,
+                         stream_rpcs=12, stream_rpcs_executed=3456, stream_rpc_rate=54.3,
+                         time_per_stream_update=0.000045)
+
+
+def format_status_pint(s):
+    """The heartbeat formatting as it was, building pint Quantities and calling `.to_compact()` on them."""
+    rpcs, rpcr = s.rpcs_executed, s.rpc_rate * ureg.count / ureg.second
+    iobr, iobrr = s.bytes_read * ureg.bytes, s.bytes_read_rate * ureg.bytes / ureg.second
+    iobw, iobwr = s.bytes_written * ureg.bytes, s.bytes_written_rate * ureg.bytes / ureg.second
+    rt = s.time_per_rpc_update * ureg.seconds
+    pt, et = s.poll_time_per_rpc_update * ureg.seconds, s.exec_time_per_rpc_update * ureg.seconds
+    rti = f"{rt.to_compact():~P.1f} / RPC (poll:{pt.to_compact():~P.1f}, exec:{et.to_compact():~P.1f})"
+    srpcs, srpcs_exec = s.stream_rpcs, s.stream_rpcs_executed
+    st, srpcr = s.time_per_stream_update * ureg.seconds, s.stream_rpc_rate * ureg.count / ureg.second
+    sti = f"{st.to_compact():~P.1f} / stream"
+    rpc_info = f"RPCs: {rpcs} [{rpcr.magnitude:.1f}/s]"
+    stream_info = f"SRPCs: {srpcs} [{srpcr.magnitude:.1f}/s] ({srpcs_exec} exec)"
+    return f"{rpc_info} + {stream_info}; " \
+           f"IO R: {iobr.to_compact():~P.1f} [{iobrr.to_compact():~P.1f}], " \
+           f"IO W: {iobw.to_compact():~P.1f} [{iobwr.to_compact():~P.1f}]; " \
+           f"{rti} & {sti}"
+
+
+def main(number=200):
+    """Time both formatting paths and print the per-call cost and speedup."""
+    assert format_status_pint(status) == MissionControl._format_status(status)
+    pint_t = min(timeit.repeat(lambda: format_status_pint(status), number=number, repeat=5)) / number
+    fast_t = min(timeit.repeat(lambda: MissionControl._format_status(status), number=number, repeat=5)) / number
+    print(f"pint:  {pint_t * 1e6:9.1f} µs/status")
+    print(f"units: {fast_t * 1e6:9.1f} µs/status  ({pint_t / fast_t:.0f}x faster)")
+    return {"pint": pint_t, "units": fast_t}
+
+
+if __name__ == "__main__":
+    main()
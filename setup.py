@@ -74,8 +74,8 @@ setup(
     ],
     python_requires='>=3.9.1',
     install_requires=[
-        'curio>=1.4', 'krpc>=0.4.8',
-        'docopt>=0.6.2', 'loguru>=0.5.3', 'rich>=9.9.0', "Pint>=0.16.1"
+        'curio>=1.4', 'krpc>=0.5',
+        'docopt>=0.6.2', 'loguru>=0.5.3', 'rich>=9.9.0', "Pint>=0.16.1", 'numpy>=1.19'
     ],
     extras_require={
         # eg:
@@ -4,8 +4,15 @@ __version__ = '0.1.6'
 from loguru import logger
 logger.disable("curiousksp")
 
-from pint import UnitRegistry, set_application_registry
-ureg = UnitRegistry()
-Q_ = ureg.Quantity
-# if pickling and unpickly quantities:
-# set_application_registry(ureg)
+
+# the pint UnitRegistry is slow to import and build, so only do it when `ureg`/`Q_` is first used (PEP 562)
+def __getattr__(name):
+    """Build the pint UnitRegistry on first access of `curiousksp.ureg` or `curiousksp.Q_`."""
+    if name in ("ureg", "Q_"):
+        from pint import UnitRegistry, set_application_registry
+        ureg = globals()["ureg"] = UnitRegistry()
+        globals()["Q_"] = ureg.Quantity
+        # if pickling and unpickly quantities:
+        # set_application_registry(ureg)
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,152 @@
+"""Define an awaitable proxy around krpc.client.Client that runs every RPC on a dedicated per-connection thread."""
+import threading
+from functools import partial
+
+from loguru import logger
+import curio
+
+
+class RPCExecutor:
+    """Runs calls against one krpc.client.Client, in order, on a single worker thread (the client isn't thread-safe)."""
+
+    def __init__(self, conn, name="rpc", maxsize=64, timeout=5.0):
+        """Initialise a new RPCExecutor and start its worker thread."""
+        self._conn = conn
+        self._name = name
+        # default per-call timeout in seconds, None to wait forever
+        self._timeout = timeout
+        # bounded so that a flood of callers awaits for space rather than piling up unbounded work for the thread
+        self._calls = curio.UniversalQueue(maxsize=maxsize)
+        # stats: calls completed by the worker and calls the caller gave up on (timed out/cancelled)
+        self.completed, self.abandoned = 0, 0
+        self._thread = threading.Thread(target=self._worker, name=f"{name}-executor", daemon=True)
+        self._thread.start()
+
+    @property
+    def conn(self):
+        """Return the krpc.client.Client that this executor makes calls against."""
+        return self._conn
+
+    @property
+    def pending(self):
+        """Return the number of calls waiting for the worker thread."""
+        return self._calls.qsize()
+
+    def _worker(self):
+        """[sync] Worker thread: run each queued call and hand its value/exception back via its UniversalResult."""
+        while (item := self._calls.get()) is not None:
+            func, result = item
+            try:
+                result.set_value(func(self._conn))
+            except BaseException as e:
+                result.set_exception(e)
+            self.completed += 1
+
+    async def submit(self, func, timeout=...):
+        """Task: queue func(conn) for the worker thread and await its result for up to timeout seconds."""
+        timeout = self._timeout if timeout is ... else timeout
+        result = curio.UniversalResult()
+        await self._calls.put((func, result))
+        try:
+            if timeout is None:
+                return await result.unwrap()
+            return await curio.timeout_after(timeout, result.unwrap)
+        except (curio.CancelledError, curio.TaskTimeout):
+            # the RPC is already on the wire (or queued) and can't be recalled, the worker will discard its result
+            self.abandoned += 1
+            raise
+
+    async def close(self):
+        """Task: stop the worker thread once it has finished the calls already queued."""
+        await self._calls.put(None)
+        await curio.run_in_thread(self._thread.join)
+        logger.debug(f"Stopped '{self._name}' executor [{self.completed} completed, {self.abandoned} abandoned]")
+
+
+def _resolve(obj, path):
+    """[sync] Follow the attribute path from obj - any step may itself be an RPC, e.g. a kRPC property."""
+    for name in path:
+        obj = getattr(obj, name)
+    return obj
+
+
+def _get(root, path, conn):
+    return _resolve(conn if root is None else root, path)
+
+
+def _call(root, path, args, kwargs, conn):
+    return _resolve(conn if root is None else root, path)(*args, **kwargs)
+
+
+def _set(root, path, value, conn):
+    setattr(_resolve(conn if root is None else root, path[:-1]), path[-1], value)
+
+
+class AsyncAttr:
+    """Lazy attribute path on a kRPC object: await it to read, call it (then await) to invoke the RPC."""
+
+    __slots__ = ("_executor", "_root", "_path")
+
+    def __init__(self, executor, root=None, path=()):
+        """Initialise a new AsyncAttr for path from root (None for the client itself)."""
+        self._executor = executor
+        self._root = root
+        self._path = path
+
+    def __getattr__(self, name):
+        """Return a longer attribute path, no RPC is made until it is awaited or called."""
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return AsyncAttr(self._executor, self._root, self._path + (name,))
+
+    def __await__(self):
+        """Read the attribute (e.g. a kRPC property) on the executor thread."""
+        return self._executor.submit(partial(_get, self._root, self._path)).__await__()
+
+    def __call__(self, *args, timeout=..., **kwargs):
+        """Return a coroutine that invokes the attribute (e.g. a kRPC procedure) on the executor thread."""
+        return self._executor.submit(partial(_call, self._root, self._path, args, kwargs), timeout=timeout)
+
+    async def set(self, value, timeout=...):
+        """Task: set the attribute (e.g. a kRPC property setter) on the executor thread."""
+        await self._executor.submit(partial(_set, self._root, self._path, value), timeout=timeout)
+
+    def __repr__(self):
+        """Render the attribute path for logging."""
+        return f"<AsyncAttr {'.'.join(('conn' if self._root is None else repr(self._root),) + self._path)}>"
+
+
+class AsyncClient:
+    """Awaitable proxy around krpc.client.Client, e.g. `await aconn.krpc.get_status()` or `await aconn.krpc.paused`."""
+
+    def __init__(self, conn, name="rpc", maxsize=64, timeout=5.0):
+        """Initialise a new AsyncClient with its own RPCExecutor thread for conn."""
+        self._executor = RPCExecutor(conn, name=name, maxsize=maxsize, timeout=timeout)
+
+    @property
+    def executor(self):
+        """Return the RPCExecutor that runs this client's calls."""
+        return self._executor
+
+    @property
+    def conn(self):
+        """Return the krpc.client.Client behind the proxy - only touch it from the executor thread (see run)."""
+        return self._executor.conn
+
+    def __getattr__(self, name):
+        """Return an AsyncAttr rooted at the client, e.g. `aconn.space_center`."""
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return AsyncAttr(self._executor, None, (name,))
+
+    def wrap(self, obj):
+        """Return an AsyncAttr rooted at a remote object returned by an earlier call, e.g. a Vessel."""
+        return AsyncAttr(self._executor, obj)
+
+    async def run(self, func, *args, timeout=..., **kwargs):
+        """Task: run an arbitrary blocking func(conn, *args, **kwargs) on the executor thread."""
+        return await self._executor.submit(lambda conn: func(conn, *args, **kwargs), timeout=timeout)
+
+    async def close(self):
+        """Task: stop the executor thread, the underlying connection is left open for its owner to close."""
+        await self._executor.close()
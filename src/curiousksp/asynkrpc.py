@@ -0,0 +1,395 @@
+"""A curio-native kRPC client speaking the length-prefixed protobuf wire protocol directly over curio sockets.
+
+Responses come back from the server in the order their requests were sent, so any number of requests can be in
+flight on the one connection: each caller queues a Result, a single reader Task resolves them oldest first.
+"""
+from collections import deque
+
+from loguru import logger
+import curio
+from krpc.decoder import Decoder
+from krpc.encoder import Encoder
+from krpc.error import ConnectionError as KRPCConnectionError, RPCError
+from krpc.types import Types
+from krpc.utils import snake_case
+import krpc.schema.KRPC_pb2 as KRPC
+
+
+def _varint(value):
+    """Return the (unsigned) protobuf varint encoding of value."""
+    data = bytearray()
+    while value > 0x7f:
+        data.append(value & 0x7f | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+async def send_frame(stream, data):
+    """Task: write data (an encoded protobuf message) to stream, prefixed by its varint encoded size."""
+    await stream.write(_varint(len(data)) + data)
+
+
+async def receive_frame(stream):
+    """Task: read a varint size prefixed frame from stream and return its (still encoded) data."""
+    size, shift = 0, 0
+    while True:
+        b = (await stream.read_exactly(1))[0]
+        size |= (b & 0x7f) << shift
+        if not b & 0x80:
+            break
+        shift += 7
+    return await stream.read_exactly(size) if size else b""
+
+
+async def send_message(stream, message):
+    """Task: write a protobuf message to stream, prefixed by its varint encoded size."""
+    await stream.write(Encoder.encode_message_with_size(message))
+
+
+async def receive_message(stream, typ):
+    """Task: read a varint size prefixed protobuf message of type typ from stream."""
+    return Decoder.decode_message(await receive_frame(stream), typ)
+
+
+class Client:
+    """A kRPC RPC connection on which many requests can be outstanding at once."""
+
+    # the procedures needed before (or without) the service schema has been loaded
+    _builtin_types = Types()
+    _builtin_procedures = {("KRPC", "GetServices"): ([], _builtin_types.services_type),
+                           ("KRPC", "GetStatus"): ([], _builtin_types.status_type),
+                           ("KRPC", "GetClientID"): ([], _builtin_types.bytes_type)}
+
+    def __init__(self, sock, name=None, client_id=b""):
+        """Initialise a new Client on a curio socket that has completed the kRPC connection handshake."""
+        self._sock = sock
+        self._stream = sock.as_stream()
+        self._name = name
+        self._client_id = client_id
+        # results for the requests awaiting a response, oldest on the left
+        self._pending = deque()
+        # writes of whole request frames must not interleave
+        self._write_lock = curio.Lock()
+        self._reader_task = None
+        # checks a schema loaded from a schemacache.SchemaCache against the server's, see load_cached_services
+        self._revalidate_task = None
+        # set when the reader fails - every later request fails fast with it
+        self._error = None
+        # (service, procedure) -> ([param TypeBase, ...], return TypeBase or None)
+        self._procedures = dict(self._builtin_procedures)
+        self._types = Types()
+        # stats: requests sent and the most requests in flight at once
+        self.requests, self.max_in_flight = 0, 0
+
+    @property
+    def name(self):
+        """Return the client name registered with the kRPC server."""
+        return self._name
+
+    @property
+    def client_id(self):
+        """Return the client identifier the kRPC server assigned in the handshake."""
+        return self._client_id
+
+    @property
+    def in_flight(self):
+        """Return the number of requests awaiting a response."""
+        return len(self._pending)
+
+    @property
+    def procedures(self):
+        """Return the (service, procedure) names that this client can encode and decode calls for."""
+        return list(self._procedures)
+
+    async def _start(self):
+        """Task: spawn the daemonic reader Task that resolves responses."""
+        self._reader_task = await curio.spawn(self._reader, daemon=True)
+
+    async def _reader(self):
+        """Task (daemonic): read each Response from the server and resolve the oldest outstanding request."""
+        try:
+            while True:
+                response = await receive_message(self._stream, KRPC.Response)
+                await self._pending.popleft().set_value(response)
+        except curio.CancelledError:
+            raise
+        except Exception as e:
+            # the connection is broken/closed - fail everything still waiting and anything sent after
+            logger.debug(f"'{self._name}' kRPC reader stopped: {e!r}")
+            self._error = ConnectionError(f"kRPC connection lost: {e!r}")
+            while self._pending:
+                await self._pending.popleft().set_exception(self._error)
+
+    async def request(self, *calls):
+        """Task: send a Request holding calls (KRPC.ProcedureCall`s) and return its list of KRPC.ProcedureResult`s."""
+        if self._error:
+            raise self._error
+        message = KRPC.Request()
+        message.calls.extend(calls)
+        result = curio.Result()
+        # a half-written frame would corrupt the connection for every other request, don't allow cancelling here
+        async with curio.disable_cancellation():
+            async with self._write_lock:
+                # the reader may have failed (and drained the pending results) while this waited for the lock
+                if self._error:
+                    raise self._error
+                self._pending.append(result)
+                self.requests += 1
+                self.max_in_flight = max(self.max_in_flight, len(self._pending))
+                try:
+                    await send_message(self._stream, message)
+                except BaseException as e:
+                    # no response is coming for it - and part of the frame may be on the wire already, so the server
+                    # can no longer make sense of the stream: break the connection rather than send anything after it
+                    if result in self._pending:
+                        self._pending.remove(result)
+                    await self._abort(ConnectionError(f"kRPC connection broken by a failed send: {e!r}"))
+                    raise
+        response = await result.unwrap()
+        if response.HasField("error"):
+            raise self._build_error(response.error)
+        return list(response.results)
+
+    def build_call(self, service, procedure, *args):
+        """Return (KRPC.ProcedureCall, return TypeBase or None) for service.procedure(*args), encoding args."""
+        try:
+            param_types, return_type = self._procedures[(service, procedure)]
+        except KeyError:
+            raise ValueError(f"Unknown kRPC procedure '{service}.{procedure}' - are the services loaded?") from None
+        if len(args) > len(param_types):
+            raise TypeError(f"{service}.{procedure}() takes {len(param_types)} arguments, got {len(args)}")
+        call = KRPC.ProcedureCall(service=service, procedure=procedure)
+        for i, (value, typ) in enumerate(zip(args, param_types)):
+            call.arguments.add(position=i, value=Encoder.encode(value, typ))
+        return call, return_type
+
+    def decode_result(self, result, return_type):
+        """Return the decoded value of a KRPC.ProcedureResult, raising its error if it has one."""
+        if result.HasField("error"):
+            raise self._build_error(result.error)
+        if return_type is None:
+            return None
+        return Decoder.decode(self, result.value, return_type)
+
+    def remote_object(self, service, cls, object_id):
+        """Return the service.cls remote object of object_id, e.g. to pass a vessel known by its id to invoke."""
+        return self._types.class_type(service, cls).python_type(self, object_id)
+
+    async def invoke(self, service, procedure, *args):
+        """Task: call service.procedure(*args) and return its decoded result."""
+        call, return_type = self.build_call(service, procedure, *args)
+        result, = await self.request(call)
+        return self.decode_result(result, return_type)
+
+    def batch(self):
+        """Return a Batch that collects calls within an async with block and sends them as one request on exit."""
+        return Batch(self)
+
+    async def get_status(self):
+        """Task: return the KRPC.Status of the server."""
+        return await self.invoke("KRPC", "GetStatus")
+
+    def load_services(self, services):
+        """Register the procedures (and enumerations) of a KRPC.Services message so that they can be invoked."""
+        for service in services.services:
+            for enumeration in service.enumerations:
+                typ = self._types.enumeration_type(service.name, enumeration.name)
+                if typ.python_type is None:
+                    typ.set_values({snake_case(v.name): {"value": v.value, "doc": ""} for v in enumeration.values})
+            for procedure in service.procedures:
+                param_types = [self._types.as_type(p.type) for p in procedure.parameters]
+                return_type = None
+                if not Types.is_none_type(procedure.return_type):
+                    return_type = self._types.as_type(procedure.return_type)
+                self._procedures[(service.name, procedure.name)] = (param_types, return_type)
+
+    async def fetch_services(self):
+        """Task: download the KRPC.Services schema from the server and load it, returning the message."""
+        services = await self.invoke("KRPC", "GetServices")
+        self.load_services(services)
+        return services
+
+    async def load_cached_services(self, cache):
+        """Task: load the service schema for the server's version from cache (a schemacache.SchemaCache).
+
+        If it isn't cached it is fetched and cached, if it is the schema is fetched in the background once a session
+        per server version and the cache (and this client) updated should it have changed.
+        """
+        version = (await self.get_status()).version
+        services, digest = await curio.run_in_thread(cache.load, version)
+        if services is None:
+            services = await self.fetch_services()
+            await curio.run_in_thread(cache.store, version, services)
+            cache.validated.add(version)
+            return services
+        self.load_services(services)
+        if version not in cache.validated:
+            cache.validated.add(version)
+            self._revalidate_task = await curio.spawn(self._revalidate, cache, version, digest, daemon=True)
+        return services
+
+    async def _revalidate(self, cache, version, digest):
+        """Task (daemonic): fetch the schema and, if it has changed from the cached one, cache and load it."""
+        try:
+            services = await self.invoke("KRPC", "GetServices")
+        except (OSError, RPCError) as e:
+            logger.debug(f"'{self._name}' couldn't check the cached kRPC service schema: {e!r}")
+            return
+        if await curio.run_in_thread(cache.store, version, services) != digest:
+            logger.info(f"The kRPC service schema of server {version} has changed - updated the cached schema")
+            self.load_services(services)
+
+    @staticmethod
+    def _build_error(error):
+        """Return a krpc.error.RPCError for a KRPC.Error message."""
+        name = f"{error.service}.{error.name}: " if error.service and error.name else ""
+        return RPCError(f"{name}{error.description}")
+
+    async def _abort(self, error):
+        """Task: stop the reader Task, fail the pending requests and every later one with error, close the socket."""
+        self._error = error
+        if self._reader_task:
+            await self._reader_task.cancel()
+            self._reader_task = None
+        # no response will arrive for them now - e.g. a Reconnector closing a hung connection retries them elsewhere
+        while self._pending:
+            await self._pending.popleft().set_exception(self._error)
+        await self._sock.close()
+
+    async def close(self):
+        """Task: stop the reader Task, fail the requests still awaiting a response and close the connection."""
+        if self._revalidate_task:
+            await self._revalidate_task.cancel()
+            self._revalidate_task = None
+        await self._abort(self._error or ConnectionError("kRPC connection closed"))
+
+    async def __aenter__(self):
+        """Return the Client for async with support."""
+        return self
+
+    async def __aexit__(self, *args):
+        """Close the Client at the end of an async with block."""
+        await self.close()
+
+    def __repr__(self):
+        """Render the Client for logging."""
+        return f"<asynkrpc.Client '{self._name}' [in_flight={self.in_flight}, requests={self.requests}]>"
+
+
+class BatchCall:
+    """Placeholder for the result of one call in a Batch - its value is available once the Batch has been sent."""
+
+    __slots__ = ("service", "procedure", "_done", "_value", "_error")
+
+    def __init__(self, service, procedure):
+        """Initialise a new unresolved BatchCall."""
+        self.service, self.procedure = service, procedure
+        self._done, self._value, self._error = False, None, None
+
+    def _resolve(self, value=None, error=None):
+        self._done, self._value, self._error = True, value, error
+
+    @property
+    def done(self):
+        """Return True once the Batch holding this call has been sent and its result decoded."""
+        return self._done
+
+    @property
+    def value(self):
+        """Return the decoded result, raising the call's error if it failed."""
+        if not self._done:
+            raise RuntimeError(f"{self.service}.{self.procedure} has not been sent yet - await the Batch first")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def __repr__(self):
+        """Render the BatchCall for logging."""
+        state = ("error" if self._error is not None else "done") if self._done else "pending"
+        return f"<BatchCall {self.service}.{self.procedure} [{state}]>"
+
+
+class Batch:
+    """Collects calls and sends them to the server as a single Request (one round trip), resolving them in order.
+
+    e.g.::
+
+        async with client.batch() as b:
+            ut = b.add("SpaceCenter", "get_UT")
+            vessel = b.add("SpaceCenter", "get_ActiveVessel")
+        print(ut.value, vessel.value)
+    """
+
+    def __init__(self, client):
+        """Initialise a new empty Batch for client."""
+        self._client = client
+        # [(KRPC.ProcedureCall, return TypeBase or None, BatchCall), ...] in the order they were added
+        self._calls = []
+
+    def __len__(self):
+        """Return the number of calls collected and not yet sent."""
+        return len(self._calls)
+
+    def add(self, service, procedure, *args):
+        """Encode service.procedure(*args) into the batch and return its BatchCall placeholder."""
+        call, return_type = self._client.build_call(service, procedure, *args)
+        placeholder = BatchCall(service, procedure)
+        self._calls.append((call, return_type, placeholder))
+        return placeholder
+
+    async def send(self):
+        """Task: send the collected calls as one request, resolve their placeholders and return them in order."""
+        calls, self._calls = self._calls, []
+        if not calls:
+            return []
+        results = await self._client.request(*(call for call, _, _ in calls))
+        for (_, return_type, placeholder), result in zip(calls, results):
+            try:
+                placeholder._resolve(value=self._client.decode_result(result, return_type))
+            except RPCError as e:
+                placeholder._resolve(error=e)
+        return [placeholder for _, _, placeholder in calls]
+
+    async def values(self):
+        """Task: send the collected calls and return their values in order, raising the first error."""
+        return [placeholder.value for placeholder in await self.send()]
+
+    async def __aenter__(self):
+        """Return the Batch to collect calls in an async with block."""
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """Send the collected calls at the end of the block, unless it raised."""
+        if exc_type is None:
+            await self.send()
+
+
+async def connect(name=None, address="127.0.0.1", rpc_port=50000, services=True, schema_cache=None):
+    """Task: open a kRPC RPC connection, do the handshake and (if services) load the service schema.
+
+    The schema is downloaded, or loaded from schema_cache (a schemacache.SchemaCache) if one is given.
+    """
+    sock = await curio.open_connection(address, rpc_port)
+    try:
+        stream = sock.as_stream()
+        request = KRPC.ConnectionRequest(type=KRPC.ConnectionRequest.RPC, client_name=name or "")
+        await send_message(stream, request)
+        response = await receive_message(stream, KRPC.ConnectionResponse)
+        if response.status != KRPC.ConnectionResponse.OK:
+            raise KRPCConnectionError(response.message)
+    except BaseException:
+        await sock.close()
+        raise
+    client = Client(sock, name=name, client_id=response.client_identifier)
+    await client._start()
+    if services:
+        try:
+            if schema_cache is None:
+                await client.fetch_services()
+            else:
+                await client.load_cached_services(schema_cache)
+        except BaseException:
+            await client.close()
+            raise
+    return client
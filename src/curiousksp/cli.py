@@ -16,18 +16,34 @@
 
 Usage:
     curiousksp.py [--addr=<ip>] [--rpc=<port>] [--stream=<port>] [--dbg_task_filter=<a,b,c>] [--dbg_max_time=<float>]
+                  [--dbg_trace=<file>] [--dbg_profile=<file>] [--dbg_profile_interval=<float>] [--timeseries=<dir>]
+                  [--record=<file>] [--shards=<n>] [--confirm_timeout=<s>] [--schema_cache=<dir>]
+                  [--metrics_port=<port>]
     curiousksp.py _monitor
     curiousksp.py _console
     curiousksp.py _display
     curiousksp.py _control
     curiousksp.py _process
+    curiousksp.py _trace <dump>
+    curiousksp.py _replay <recording> [--addr=<ip>] [--rpc=<port>] [--stream=<port>] [--speed=<float>]
 
 Options:
-    --addr=<ip>                IP address of target host running KSP w/ kRPC [default: 127.0.0.1]
-    --rpc=<port>               kRPC port [default: 50000]
-    --stream=<port>            kRPC stream port [default: 50001]
-    --dbg_task_filter=<a,b,c>  Comma-separated list of Task names for curio.debug.schedtrace filter
-    --dbg_max_time=<float>     Max time for curio.debug.longblock debugger [default: 0.1]
+    --addr=<ip>                     IP address of target host running KSP w/ kRPC [default: 127.0.0.1]
+    --rpc=<port>                    kRPC port [default: 50000]
+    --stream=<port>                 kRPC stream port [default: 50001]
+    --metrics_port=<port>           Port to serve Prometheus metrics on at /metrics, 0 for none [default: 42048]
+    --timeseries=<dir>              Dir to memory-map the metric time-series under [default: curiousksp.tsdb]
+    --schema_cache=<dir>            Dir to cache the kRPC service schema in, "" to download it on every connect
+                                    [default: curiousksp.schema]
+    --record=<file>                 Record the kRPC session to file, for _replay to serve back without KSP
+    --shards=<n>                    Run the vessels' jobs in n worker processes, 0 for none [default: 0]
+    --confirm_timeout=<s>           Seconds to answer the Ctrl-C shutdown prompt in before it's declined [default: 30]
+    --speed=<float>                 Speed multiplier of _replay, 0 for as fast as possible [default: 1]
+    --dbg_task_filter=<a,b,c>       Comma-separated Task names for curio.debug.schedtrace / --dbg_profile filter
+    --dbg_max_time=<float>          Max time for curio.debug.longblock debugger [default: 0.1]
+    --dbg_trace=<file>              Record a binary scheduling trace, dumped to file at exit/crash (see _trace)
+    --dbg_profile=<file>            Profile Task CPU time, dumped to file (pstats) + .collapsed/.speedscope.json at exit
+    --dbg_profile_interval=<float>  Stack sampling interval for --dbg_profile, 0 for CPU time only [default: 0.005]
 """
 import sys
 import time
@@ -38,8 +54,10 @@ from loguru import logger
 # import krpc
 from docopt import docopt
 
-from .debug import _configure_debuggers
-from .missioncontrol import MissionControl
+from .logsink import BatchedSink, file_writer, flush_all
+
+# the helper subcommands that don't run a MissionControl
+SUBCOMMANDS = ("_monitor", "_console", "_display", "_control", "_process", "_trace", "_replay")
 
 # import contextvar
 # ksp_conn: ContextVar[krpc.Connection] = ContextVar('ksp_conn', default=None)
@@ -48,6 +66,16 @@ from .missioncontrol import MissionControl
 @logger.catch
 def main(argv=sys.argv):
     """Set up rich loguru cli based on arguments passed at command line."""
+    args = docopt(__doc__)
+    # only import the kernel debuggers, curio, kRPC etc. when running a MissionControl - the helper
+    # subcommands get launched a lot and shouldn't pay for them at startup
+    subcommand = next((c for c in SUBCOMMANDS if args[c]), None)
+    level = "DEBUG"
+    if subcommand is None:
+        # importing .debug registers the custom SCHED level with loguru
+        from .debug import curio_sched_level
+        level = curio_sched_level.name
+
     # logger.configure(handlers=[{"sink": RichHandler(markup=True), "format": "{message}"}])
     log_fmt_c = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | " \
                 "<level>{level: <8}</level> |{level.icon}  " \
@@ -57,27 +85,66 @@ def main(argv=sys.argv):
                 "<level>{message}</level> [<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan>]"
     # clean up the default logger
     logger.remove()
-    logger.configure(handlers=[{"sink": sys.stdout, "format": log_fmt_c, "level": "SCHED"}])
-    logger.add("curiousksp.log", format=log_fmt_f, level="SCHED", retention="3 days", rotation="1 day")
+    # buffer records and do the console/file I/O in batches on writer threads, off the curio kernel thread
+    stdout_sink = BatchedSink(sys.stdout.write, sys.stdout.flush, name="stdout")
+    file_sink = BatchedSink(*file_writer("curiousksp.log", retention="3 days", rotation="1 day"), name="file")
+    logger.configure(handlers=[{"sink": stdout_sink, "format": log_fmt_c, "level": level,
+                                "colorize": sys.stdout.isatty()}])
+    logger.add(file_sink, format=log_fmt_f, level=level)
     logger.level("INFO", icon="🔔")
     # enable the library logging for CLI mode
     logger.enable("curiousksp")
 
-    args = docopt(__doc__)
     logger.debug(f"command-line parameters:\n{args}")
     # le basics
-    if args["_monitor"]:
-        pass
+    if subcommand == "_trace":
+        # offline analysis of a scheduling trace dumped by debug.schedrecord
+        from .tracedump import analyze
+        flush_all()
+        print(analyze(args["<dump>"]))
+        return 0
+    if subcommand == "_replay":
+        # serve a recorded kRPC session on the kRPC ports until Ctrl-C
+        import curio
+        from .replay import ReplayServer
+        server = ReplayServer(args["<recording>"], address=args["--addr"], rpc_port=int(args["--rpc"]),
+                              stream_port=int(args["--stream"]), speed=float(args["--speed"]))
+        try:
+            curio.run(server.serve_forever)
+        except KeyboardInterrupt:
+            logger.info(f"Replay stopped [{server.requests} requests, {server.misses} not in the recording]")
+        return 0
+    if subcommand:
+        logger.warning(f"'{subcommand}' is not implemented yet")
+        return 0
+
+    from .debug import _configure_debuggers, longblock, schedrecord, taskprofile
+    from .missioncontrol import MissionControl
 
     # TODO: C:\Users\david\AppData\Local\hyper tasks
-    # TODO: asynkrpc(?) one day... XD
     # TODO: type anno
     # TODO: process comma-sep debuggers args list of Task names into a set of the Task names
 
     addr, rpc_port, stream_port = args["--addr"], int(args["--rpc"]), int(args["--stream"])
-    debuggers = _configure_debuggers(filter_=args["--dbg_task_filter"], max_time=args["--dbg_max_time"])
-    mc = MissionControl(krpc_addr=addr, krpc_port=rpc_port, krpcs_port=stream_port, debuggers=debuggers)
+    debuggers = _configure_debuggers(filter_=args["--dbg_task_filter"], max_time=args["--dbg_max_time"],
+                                     trace=args["--dbg_trace"], profile=args["--dbg_profile"],
+                                     profile_interval=args["--dbg_profile_interval"])
+    mc = MissionControl(krpc_addr=addr, krpc_port=rpc_port, krpcs_port=stream_port, debuggers=debuggers,
+                        timeseries=args["--timeseries"], record=args["--record"], shards=int(args["--shards"]),
+                        confirm_timeout=float(args["--confirm_timeout"]), schema_cache=args["--schema_cache"],
+                        metrics_port=int(args["--metrics_port"]))
     report = mc.run()
+    for debugger in debuggers:
+        if isinstance(debugger, longblock):
+            logger.info(f"Task cycle latencies:\n{debugger.report()}")
+        if isinstance(debugger, schedrecord):
+            logger.info(f"Scheduling trace dumped to '{debugger.dump()}'")
+        if isinstance(debugger, taskprofile):
+            debugger.stop()
+            paths = ", ".join(f"'{p}'" for p in debugger.dump())
+            logger.info(f"Task CPU profile:\n{debugger.report()}\ndumped to {paths}")
+    # get the buffered log output out before printing the report
+    flush_all()
     print(f"{report=}")
 
     # HACK: experiment with conn: krpc.client.Client in a totally blocking fashion
@@ -119,6 +186,5 @@ def main(argv=sys.argv):
 
     # curio'd?:
     # await run_in_thread(current_context.run, some_function, *args) ?
-    # TODO: each VesselManager needs to have a priority queue that tasks for the vessel to run can be added to
 
     return 0
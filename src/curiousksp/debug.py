@@ -2,13 +2,21 @@
 import inspect
 import itertools
 # import logging
+import sys
+import threading
 import time
 # import os.path
+from collections import Counter, defaultdict
+from functools import lru_cache
 from pathlib import Path
 
 # import curio
 from loguru import logger
-from curio.debug import schedtrace as _schedtrace, logcrash as _logcrash, longblock as _longblock
+from curio.debug import DebugBase, schedtrace as _schedtrace, logcrash as _logcrash, longblock as _longblock
+from curio.errors import TaskCancelled
+
+from . import profdump, tracedump
+from .histogram import LogHistogram
 
 
 # curio_sched_level = logger.level("CURIO", no=10, color="<yellow>", icon="🌟")
@@ -20,6 +28,29 @@ hidden_tasks = {"Kernel._make_kernel_runtime.<locals>._kernel_task",
                 "Monitor.start", "Monitor.monitor_task"}
 
 
+@lru_cache(maxsize=256)
+def _short_filename(filename):
+    """Return filename shortened to its parts below the curiousksp package dir, e.g. 'tasks/vessel.py'."""
+    p = Path(filename)
+    # take from reversed path parts while part != "curiousksp" (the module)
+    parts = itertools.takewhile(lambda s: s != "curiousksp", p.parts[::-1])
+    # reverse so that the submodule dir part is in front of the file part of the filename
+    return "/".join(reversed(list(parts)))
+
+
+@lru_cache(maxsize=4096)
+def _source_location(code, filename, lineno):
+    """Return the rendered ` @ `sloc`[file:line]` location for a coroutine code object at lineno."""
+    # inspect the lines of code for this coroutine and find the single line of code the Task is on
+    # this reads and tokenizes the source file, so it is cached per (code object, line) - a Task's next cycle
+    # on the same line is then a dict lookup
+    lines, first_lineno = inspect.getsourcelines(code)
+    sloc = lines[lineno - first_lineno]
+    # tidy up the sloc by trimming left whitespace and right \n
+    sloc = sloc.lstrip().rstrip("\n")
+    return f" @ `{sloc}`[{_short_filename(filename)}:{lineno}]"
+
+
 # subclass curio.debug.schedtrace and rewrite to use loguru logger
 class schedtrace(_schedtrace):
     """Subclass curio.debug.schedtrace to output a richer loguru view of the Task scheduling state."""
@@ -30,18 +61,7 @@ class schedtrace(_schedtrace):
         location = ""
         filename, task_lineno = task.where()
         if filename and task_lineno:
-            p = Path(filename)
-            # take from reversed path parts while part != "curiousksp" (the module)
-            parts = itertools.takewhile(lambda s: s != "curiousksp", p.parts[::-1])
-            # reverse so that the submodule dir part is in front of the file part of the filename
-            parts = reversed(list(parts))
-            filename = "/".join(parts)
-            # inspect the lines of code for this coroutine and find the single line of code the Task is on
-            lines, lineno = inspect.getsourcelines(task.coro.cr_code)
-            sloc = lines[task_lineno - lineno]
-            # tidy up the sloc by trimming left whitespace and right \n
-            sloc = sloc.lstrip().rstrip("\n")
-            location = f" @ `{sloc}`[{filename}:{task_lineno}]"
+            location = _source_location(task.coro.cr_code, filename, task_lineno)
         if task.daemon:
             return f"<{task.id}|{task.cycles}> '{task.name}'{location}"
         else:
@@ -80,21 +100,213 @@ class logcrash(_logcrash):
 
 
 class longblock(_longblock):
-    """Subclass curio.debug.longblock to provide rich loguru logging when a Task blocks the kernel for a long time."""
+    """Subclass curio.debug.longblock to provide rich loguru logging when a Task blocks the kernel for a long time.
+
+    Every cycle duration is also counted into a per-task (by name) LogHistogram so that the tail latency of tasks
+    can be reported (see report), not just the cycles that went over max_time.
+    """
+
+    # (overshoot ratio of duration / max_time, level) - the first that is exceeded sets the level to log at
+    escalation = ((10, "CRITICAL"), (3, "ERROR"))
+
+    def __init__(self, **kwargs):
+        """Initialise a new longblock with no histograms yet."""
+        super().__init__(**kwargs)
+        self.histograms = defaultdict(LogHistogram)
+
+    def _level(self, duration):
+        """Return the level to log a duration over max_time at, escalating with how far it overshot."""
+        overshoot = duration / self.max_time
+        for ratio, level in self.escalation:
+            if overshoot > ratio:
+                return level
+        return self.level
 
     def suspended(self, task, trap):
-        """Log when a Task blocks the kernel for a time > self.max_time."""
+        """Record the cycle duration and log when a Task blocks the kernel for a time > self.max_time."""
         if self.check_filter(task):
             duration = time.monotonic() - self.start
+            self.histograms[task.name].record(duration)
             if duration > self.max_time:
-                # TODO: set up a diff = duration - self.max_time, if diff > threshold: log at higher level
-                logger.log(self.level, f'🔂  [longblock] {task!r} ran for {duration:.1f} seconds')
+                logger.log(self._level(duration), f'🔂  [longblock] {task!r} ran for {duration:.1f} seconds '
+                                                  f'({duration / self.max_time:.1f}x max_time)')
+
+    def report(self):
+        """Return a table of the cycle count and p50/p99/max cycle durations of each task, worst p99 first."""
+        rows = sorted(self.histograms.items(), key=lambda item: item[1].percentile(99), reverse=True)
+        lines = [f"{'task':<50} {'cycles':>8} {'p50 (ms)':>10} {'p99 (ms)':>10} {'max (ms)':>10}"]
+        for name, h in rows:
+            lines.append(f"{name[:50]:<50} {h.count:>8} {h.percentile(50) * 1e3:>10.3f} "
+                         f"{h.percentile(99) * 1e3:>10.3f} {h.max * 1e3:>10.3f}")
+        return "\n".join(lines)
+
+
+class schedrecord(DebugBase):
+    """Record every Task scheduling event as a fixed-size binary record in a ring buffer, dumped for offline analysis.
+
+    Far cheaper than schedtrace's text logging: each event is a single struct.pack_into into a preallocated
+    bytearray. The ring is dumped to path (see curiousksp.tracedump) on demand and when a Task crashes.
+    """
+
+    def __init__(self, *, path="curiousksp.trace", capacity=65536, dump_on_crash=True, **kwargs):
+        """Initialise a new schedrecord with a ring buffer of capacity records."""
+        super().__init__(**kwargs)
+        self.path = path
+        self._capacity = capacity
+        self._dump_on_crash = dump_on_crash
+        self._buffer = bytearray(capacity * tracedump.RECORD.size)
+        self._pack_into = tracedump.RECORD.pack_into
+        # records written in total, the next one goes at (count % capacity)
+        self.count = 0
+        # interned task states/trap names (code 0 is "none") and the task names by id
+        self._states, self._traps, self._names = {"": 0}, {"": 0}, {}
+
+    @staticmethod
+    def _intern(table, key):
+        if (code := table.get(key)) is None:
+            code = table[key] = len(table)
+        return code
+
+    def _record(self, task, event, trap=None):
+        """Append a record for task's event to the ring buffer."""
+        if not self.check_filter(task):
+            return
+        if task.id not in self._names:
+            self._names[task.id] = task.name
+        state = self._intern(self._states, task.state or "")
+        trap_code = self._intern(self._traps, trap[0]) if trap else 0
+        offset = (self.count % self._capacity) * tracedump.RECORD.size
+        self._pack_into(self._buffer, offset, time.monotonic_ns(), task.id, task.cycles, event, state, trap_code)
+        self.count += 1
+
+    def created(self, task):
+        """Record Task creation."""
+        self._record(task, tracedump.CREATED)
+
+    def running(self, task):
+        """Record the start of a Task execution cycle."""
+        self._record(task, tracedump.RUNNING)
+
+    def suspended(self, task, trap):
+        """Record a Task suspending on trap, dumping the ring if the Task has just crashed."""
+        self._record(task, tracedump.SUSPENDED, trap)
+        if self._dump_on_crash and task.terminated and task.exception \
+                and not isinstance(task.exception, (StopIteration, TaskCancelled, KeyboardInterrupt, SystemExit)):
+            logger.error(f"{task!r} crashed, dumping scheduling trace to '{self.dump()}'")
+
+    def terminated(self, task):
+        """Record Task termination."""
+        self._record(task, tracedump.TERMINATED)
+
+    def dump(self, path=None):
+        """Dump the ring buffer to path (default self.path) as a memory-mapped file and return the Path."""
+        meta = {"states": list(self._states), "traps": list(self._traps),
+                "names": {str(k): v for k, v in self._names.items()}}
+        return tracedump.write_dump(path or self.path, self._buffer, self._capacity, self.count, meta)
+
+
+class taskprofile(DebugBase):
+    """Measure the kernel thread CPU time of every Task cycle and optionally sample the stack of the running Task.
+
+    The per-task totals (and sampled stacks, every interval seconds from a sampler thread, if interval > 0) are
+    written by dump as a pstats file plus collapsed-stack and speedscope flamegraphs (see curiousksp.profdump).
+    """
+
+    def __init__(self, *, path="curiousksp.prof", interval=0.0, **kwargs):
+        """Initialise a new taskprofile, sampling stacks every interval seconds (0 = CPU time totals only)."""
+        super().__init__(**kwargs)
+        self.path = path
+        self.interval = interval
+        # task name -> [(coroutine filename, first line), cycles, cpu seconds]
+        self.tasks = {}
+        # (task name, frames outermost first) -> samples
+        self.samples = Counter()
+        self._current, self._cpu_start = None, 0.0
+        self._sampler, self._kernel_thread = None, None
+        self._stop = threading.Event()
+
+    def running(self, task):
+        """Start timing a Task execution cycle (and start the sampler on the first one)."""
+        if not self.check_filter(task):
+            return
+        if self.interval and self._sampler is None:
+            self._kernel_thread = threading.get_ident()
+            self._sampler = threading.Thread(target=self._sample, name="taskprofile-sampler", daemon=True)
+            self._sampler.start()
+        self._current = task
+        self._cpu_start = time.thread_time()
+
+    def suspended(self, task, trap):
+        """Add the CPU time of the Task cycle that just ended to its total."""
+        if self._current is not task:
+            return
+        cpu = time.thread_time() - self._cpu_start
+        self._current = None
+        if (stats := self.tasks.get(task.name)) is None:
+            code = getattr(task.coro, "cr_code", None)
+            location = (code.co_filename, code.co_firstlineno) if code else ("~", 0)
+            stats = self.tasks[task.name] = [location, 0, 0.0]
+        stats[1] += 1
+        stats[2] += cpu
+
+    def _sample(self):
+        """[sync] Sampler thread: record the stack of the running Task every interval seconds until stopped."""
+        while not self._stop.wait(self.interval):
+            task = self._current
+            frame = sys._current_frames().get(self._kernel_thread)
+            if task is None or frame is None:
+                continue
+            root = getattr(task.coro, "cr_code", None)
+            frames = []
+            # walk out from the innermost frame to the Task's coroutine, leaving out the kernel's frames
+            while frame is not None:
+                code = frame.f_code
+                frames.append((code.co_filename, code.co_firstlineno, code.co_name))
+                if code is root:
+                    break
+                frame = frame.f_back
+            self.samples[(task.name, tuple(reversed(frames)))] += 1
+
+    def stop(self):
+        """Stop the sampler thread."""
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def profile(self):
+        """Return (tasks, samples, interval) - a snapshot of the profile for the profdump exporters."""
+        tasks = {name: (location, cycles, cpu) for name, (location, cycles, cpu) in self.tasks.items()}
+        return tasks, dict(self.samples), self.interval
+
+    def dump(self, path=None):
+        """Write the profile to path (default self.path) as pstats, and beside it as .collapsed/.speedscope.json."""
+        path = Path(path or self.path)
+        profile = self.profile()
+        return [profdump.write_pstats(path, *profile),
+                profdump.write_collapsed(path.with_suffix(".collapsed"), *profile),
+                profdump.write_speedscope(path.with_suffix(".speedscope.json"), *profile)]
+
+    def report(self):
+        """Return a table of the cycles and CPU time of each task, most CPU first."""
+        rows = sorted(self.tasks.items(), key=lambda item: item[1][2], reverse=True)
+        lines = [f"{'task':<50} {'cycles':>8} {'cpu (s)':>10} {'mean (ms)':>10}"]
+        for name, (_, cycles, cpu) in rows:
+            lines.append(f"{name[:50]:<50} {cycles:>8} {cpu:>10.4f} {cpu / cycles * 1e3:>10.3f}")
+        return "\n".join(lines)
 
 
-def _configure_debuggers(filter_=None, max_time=0.1):
+def _configure_debuggers(filter_=None, max_time=0.1, trace=None, profile=None, profile_interval=0.0):
     """Configure subclassed curio.debug.DebugBase`s for loguru logging (via Rich? maybe?)."""
     logger.debug(f"{filter_=}")
     schedtrace_ = schedtrace(level=curio_sched_level.name)
     logcrash_ = logcrash()
     longblock_ = longblock(level="WARNING", max_time=float(max_time))
-    return [schedtrace_, logcrash_, longblock_]
+    debuggers = [schedtrace_, logcrash_, longblock_]
+    if trace:
+        # record the binary scheduling trace too, dumped to the trace path
+        debuggers.append(schedrecord(path=trace))
+    if profile:
+        # profile the CPU time of the filtered Tasks (or all of them), dumped to the profile path
+        task_filter = set(filter_.split(",")) if filter_ else None
+        debuggers.append(taskprofile(path=profile, interval=float(profile_interval), filter=task_filter))
+    return debuggers
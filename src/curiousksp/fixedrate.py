@@ -0,0 +1,91 @@
+"""Define a drift-free fixed-rate loop for control loops and periodic Tasks, with deadline-miss and jitter accounting.
+
+`await curio.sleep(period)` after the work makes the real period period + work time, so the loop drifts and jitters
+with the RPC times. A FixedRateLoop sleeps until absolute deadlines (start + n * period) on the monotonic clock instead,
+and when the work overruns a deadline either catches up (runs the late ticks back to back) or skips the ticks that
+have fallen a whole period behind.
+"""
+import math
+
+from loguru import logger
+import curio
+
+from .histogram import LogHistogram
+
+CATCH_UP, SKIP = "catch_up", "skip"
+
+
+class FixedRateLoop:
+    """Async iterator yielding the index of each tick at rate Hz - `async for tick in FixedRateLoop(50): ...`."""
+
+    def __init__(self, rate, policy=SKIP, name="loop", max_catch_up=10, clock=curio.clock, sleep=curio.sleep):
+        """Initialise a new FixedRateLoop, policy CATCH_UP (skipping once max_catch_up ticks behind) or SKIP.
+
+        clock and sleep are the Tasks the loop reads the time and waits with - e.g. a simulated clock in tests.
+        """
+        if policy not in (CATCH_UP, SKIP):
+            raise ValueError(f"Unknown FixedRateLoop policy {policy!r}")
+        self._clock = clock
+        self._sleep = sleep
+        self._period = 1 / rate
+        self._policy = policy
+        self._name = name
+        self._max_catch_up = max_catch_up
+        # curio clock time of tick 0 and the index of the next tick
+        self._start, self._index = None, 0
+        # stats: ticks run, deadlines missed (ticks run late or skipped), ticks skipped and how late ticks started
+        self.ticks, self.missed, self.skipped = 0, 0, 0
+        self.jitter = LogHistogram()
+
+    @property
+    def period(self):
+        """Return the period of the loop in seconds."""
+        return self._period
+
+    @property
+    def name(self):
+        """Return the name of the loop."""
+        return self._name
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """Task: wait for the next tick's deadline (according to the policy if it has passed) and return its index."""
+        now = await self._clock()
+        if self._start is None:
+            self._start = now
+        deadline = self._start + self._index * self._period
+        behind = math.floor((now - deadline) / self._period) if now > deadline else -1
+        if behind >= 0:
+            # the deadline has passed - the previous tick overran (or the kernel stalled), this tick runs late
+            self.missed += 1
+            if behind and (self._policy == SKIP or behind >= self._max_catch_up):
+                # skip the ticks whose following deadline has passed too, running the latest straight away
+                self.missed += behind
+                self.skipped += behind
+                self._index += behind
+                deadline += behind * self._period
+                logger.opt(lazy=True).debug("[{}] fell behind, skipped {} ticks", lambda: self._name, lambda: behind)
+        if deadline > now:
+            await self._sleep(deadline - now)
+            now = await self._clock()
+        self.jitter.record(now - deadline)
+        self.ticks += 1
+        index, self._index = self._index, self._index + 1
+        return index
+
+    async def run(self, func, *args):
+        """Task: await func(*args) on every tick, forever (or until cancelled)."""
+        async for _ in self:
+            await func(*args)
+
+    def stats(self):
+        """Return a dict of the tick/missed/skipped counts and the p50/p99/max jitter in ms."""
+        return {"ticks": self.ticks, "missed": self.missed, "skipped": self.skipped,
+                "jitter_p50_ms": self.jitter.percentile(50) * 1e3, "jitter_p99_ms": self.jitter.percentile(99) * 1e3,
+                "jitter_max_ms": self.jitter.max * 1e3}
+
+    def __repr__(self):
+        return f"<FixedRateLoop '{self._name}' {1 / self._period:g} Hz {self._policy} " \
+               f"ticks={self.ticks} missed={self.missed} skipped={self.skipped}>"
@@ -0,0 +1,75 @@
+"""Define a fixed-memory, log-bucketed latency histogram with O(1) recording and approximate percentiles."""
+import math
+
+
+class LogHistogram:
+    """Histogram of durations (seconds) in log2 buckets, each octave split into sub_buckets linear buckets.
+
+    With 4 sub-buckets per octave a percentile is reported to within 25% of the true value, in ~130 ints of memory.
+    """
+
+    __slots__ = ("_min_value", "_sub_buckets", "_counts", "count", "total", "max")
+
+    def __init__(self, min_value=1e-6, octaves=32, sub_buckets=4):
+        """Initialise a new empty LogHistogram resolving values from min_value to min_value * 2**octaves."""
+        self._min_value = min_value
+        self._sub_buckets = sub_buckets
+        # bucket 0 holds everything <= min_value, the last bucket everything beyond the top octave
+        self._counts = [0] * (octaves * sub_buckets + 1)
+        self.count, self.total, self.max = 0, 0.0, 0.0
+
+    def _index(self, value):
+        """Return the bucket index for value."""
+        ratio = value / self._min_value
+        if ratio <= 1:
+            return 0
+        # ratio = m * 2**e with m in [0.5, 1) -> octave e-1, and the linear position of 2m in [1, 2) within it
+        m, e = math.frexp(ratio)
+        index = 1 + (e - 1) * self._sub_buckets + int((2 * m - 1) * self._sub_buckets)
+        return min(index, len(self._counts) - 1)
+
+    def _upper_bound(self, index):
+        """Return the upper bound of the values that fall in bucket index."""
+        if index == 0:
+            return self._min_value
+        octave, j = divmod(index - 1, self._sub_buckets)
+        return self._min_value * 2 ** octave * (1 + (j + 1) / self._sub_buckets)
+
+    def record(self, value):
+        """Count value (seconds) into its bucket."""
+        self._counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Return the (upper bucket bound) value below which p percent of the recorded values fall."""
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index, n in enumerate(self._counts):
+            seen += n
+            if seen >= target:
+                # never report more than the true max
+                return min(self._upper_bound(index), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        """Return the mean of the recorded values."""
+        return self.total / self.count if self.count else 0.0
+
+    def merge(self, other):
+        """Add the counts of another LogHistogram with the same bucket layout into this one."""
+        for index, n in enumerate(other._counts):
+            self._counts[index] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def reset(self):
+        """Clear all the recorded values."""
+        self._counts = [0] * len(self._counts)
+        self.count, self.total, self.max = 0, 0.0, 0.0
@@ -0,0 +1,132 @@
+"""Define loguru sinks that buffer records on the logging (kernel) thread and write them in batches from another thread.
+
+Handing a record to a BatchedSink is an append to a list under a lock - the console/file I/O happens on the sink's
+writer thread, so chatty SCHED level logging never blocks the curio kernel.
+"""
+import atexit
+import copy
+import sys
+import threading
+from functools import partial
+
+from loguru import logger
+
+# every BatchedSink created, so that they can be flushed at shutdown/exit
+_sinks = []
+
+
+class BatchedSink:
+    """Callable loguru sink buffering formatted messages (bounded, counting drops) for a background writer thread."""
+
+    def __init__(self, write, flush=None, name="log", maxsize=10000, batch_size=256, interval=0.1):
+        """Initialise a new BatchedSink writing batches with write(str) (then flush()) and start its writer thread."""
+        self._write = write
+        self._flush = flush
+        self._name = name
+        # max messages buffered before new ones are dropped (and counted) rather than blocking the logging thread
+        self._maxsize = maxsize
+        # wake the writer early once this many messages are buffered, otherwise it wakes every interval seconds
+        self._batch_size = batch_size
+        self._interval = interval
+        self._buffer = []
+        self._cond = threading.Condition()
+        # bumped by flush() requests, and by the writer once it has written everything buffered before the request
+        self._flush_requested, self._flushed = 0, 0
+        self._closed = False
+        # stats: messages written and dropped, dropped messages not yet reported in the output
+        self.written, self.dropped, self._unreported = 0, 0, 0
+        self._thread = threading.Thread(target=self._writer, name=f"{name}-log-writer", daemon=True)
+        self._thread.start()
+        _sinks.append(self)
+
+    @property
+    def name(self):
+        """Return the name of the sink."""
+        return self._name
+
+    @property
+    def buffered(self):
+        """Return the number of messages waiting for the writer thread."""
+        return len(self._buffer)
+
+    def __call__(self, message):
+        """[sync] loguru sink: buffer the formatted message, dropping it if the buffer is full."""
+        with self._cond:
+            if self._closed or len(self._buffer) >= self._maxsize:
+                self.dropped += 1
+                self._unreported += 1
+                return
+            self._buffer.append(message)
+            if len(self._buffer) >= self._batch_size:
+                self._cond.notify_all()
+
+    def _writer(self):
+        """[sync] Writer thread: write out the buffered messages in batches until the sink is closed."""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or self._flush_requested > self._flushed
+                                    or len(self._buffer) >= self._batch_size, timeout=self._interval)
+                batch, self._buffer = self._buffer, []
+                unreported, self._unreported = self._unreported, 0
+                flush_requested, closed = self._flush_requested, self._closed
+            if unreported:
+                batch.append(f"[{self._name}] {unreported} log messages dropped (buffer full)\n")
+            if batch:
+                try:
+                    self._write("".join(batch))
+                    if self._flush:
+                        self._flush()
+                except Exception as e:
+                    # nowhere sensible to log this to, it would come straight back here
+                    print(f"[{self._name}] failed to write {len(batch)} log messages: {e!r}", file=sys.stderr)
+                self.written += len(batch) - bool(unreported)
+            with self._cond:
+                self._flushed = flush_requested
+                self._cond.notify_all()
+            if closed:
+                return
+
+    def flush(self, timeout=5.0):
+        """[sync] Block until everything buffered so far has been written (or timeout seconds pass)."""
+        with self._cond:
+            self._flush_requested += 1
+            request = self._flush_requested
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._flushed >= request or not self._thread.is_alive(), timeout)
+
+    def close(self, timeout=5.0):
+        """[sync] Write out everything buffered and stop the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+
+def file_writer(path, **kwargs):
+    """Return (write, flush) for a loguru file sink at path with kwargs (e.g. rotation/retention) for a BatchedSink.
+
+    The file is written by a raw handler on an independent copy of the logger, so loguru still does the
+    rotation/retention. Copying the logger requires its sinks to be copyable, so call this right after logger.remove().
+    """
+    file_logger = copy.deepcopy(logger)
+    file_logger.remove()
+    file_logger.enable("curiousksp")
+    file_logger.add(path, format="{message}", level=0, **kwargs)
+    raw = file_logger.opt(raw=True)
+    return partial(raw.log, 0), None
+
+
+def flush_all(timeout=5.0):
+    """[sync] Flush every BatchedSink."""
+    for sink in list(_sinks):
+        sink.flush(timeout)
+
+
+def close_all(timeout=5.0):
+    """[sync] Close every BatchedSink, writing out whatever is still buffered."""
+    while _sinks:
+        _sinks.pop().close(timeout)
+
+
+# don't lose the tail of the log when the process exits without an orderly MissionControl shutdown
+atexit.register(close_all)
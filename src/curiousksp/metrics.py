@@ -0,0 +1,190 @@
+"""Serve the process's metrics as plain text in the Prometheus exposition format, for monitoring to scrape.
+
+The curio Monitor only offers an interactive console, and the stats kept by the kernel debuggers, log sinks,
+connections and caches otherwise only reach the log. A Metrics registry gathers them from collectors - callables
+returning metric families - whenever it is scraped, and a MetricsServer answers `GET /metrics` with them from a Task
+in the same kernel. Collecting only reads counters already kept in memory, so a scrape never waits on kRPC.
+"""
+import math
+
+from loguru import logger
+import curio
+from curio.network import run_server, tcp_server_socket
+
+from . import logsink
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# the quantiles exposed of a LogHistogram summary
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def family(name, type_, help_, samples):
+    """Return a metric family: name, type (counter/gauge/summary), help text and [(suffix, labels, value), ...]."""
+    return name, type_, help_, list(samples)
+
+
+def summary(name, help_, histograms, label="task"):
+    """Return a summary family of {label value: LogHistogram} - its QUANTILES, sum and count."""
+    samples = []
+    for key, h in histograms.items():
+        labels = {label: key} if label else {}
+        samples.extend(("", dict(labels, quantile=str(q)), h.percentile(q * 100)) for q in QUANTILES)
+        samples.extend((("_sum", labels, h.total), ("_count", labels, h.count)))
+    return family(name, "summary", help_, samples)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(int(value)) if value.is_integer() and abs(value) < 2 ** 53 else repr(value)
+
+
+def render(families):
+    """Return families rendered in the Prometheus text exposition format."""
+    lines = []
+    for name, type_, help_, samples in families:
+        lines.append(f"# HELP {name} {_escape(help_)}")
+        lines.append(f"# TYPE {name} {type_}")
+        for suffix, labels, value in samples:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{suffix}{{{label_text}}} {_format_value(value)}" if label_text
+                         else f"{name}{suffix} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class Metrics:
+    """Registry of collectors - callables returning an iterable of metric families (see family) when scraped."""
+
+    def __init__(self):
+        """Initialise a new Metrics registry with the log sink collector."""
+        self._collectors = [log_sinks]
+        # stats: collectors that raised while collecting
+        self.errors = 0
+
+    def register(self, collector):
+        """Add collector to the registry and return it."""
+        self._collectors.append(collector)
+        return collector
+
+    def collect(self):
+        """Return the families of every collector - a collector that fails is left out (and counted) for the scrape."""
+        families = []
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                self.errors += 1
+                logger.debug(f"Metrics collector {collector!r} failed: {e!r}")
+        families.append(family("curiousksp_metrics_collector_errors_total", "counter",
+                               "Metrics collectors that failed while being scraped", [("", {}, self.errors)]))
+        return families
+
+    def render(self):
+        """Return every collector's families in the Prometheus text exposition format."""
+        return render(self.collect())
+
+
+def log_sinks():
+    """Return the families of the records written, dropped and buffered of every logsink.BatchedSink."""
+    sinks = list(logsink._sinks)
+    return [family("curiousksp_log_records_written_total", "counter", "Log records written by the sink",
+                   [("", {"sink": s.name}, s.written) for s in sinks]),
+            family("curiousksp_log_records_dropped_total", "counter", "Log records dropped, the sink being full",
+                   [("", {"sink": s.name}, s.dropped) for s in sinks]),
+            family("curiousksp_log_records_buffered", "gauge", "Log records waiting for the sink's writer thread",
+                   [("", {"sink": s.name}, s.buffered) for s in sinks])]
+
+
+def kernel_tasks(kernel, debuggers=()):
+    """Return a collector of the Tasks of kernel and of the longblock/taskprofile debuggers' per-task stats."""
+    from .debug import longblock, taskprofile
+
+    def collect():
+        tasks = list(kernel._tasks.values())
+        states = {}
+        for task in tasks:
+            states[task.state] = states.get(task.state, 0) + 1
+        families = [family("curiousksp_tasks", "gauge", "Tasks in the kernel by state",
+                           [("", {"state": state}, n) for state, n in sorted(states.items())]),
+                    family("curiousksp_task_cycles_total", "counter", "Execution cycles of each Task in the kernel",
+                           [("", {"task": t.name, "id": t.id}, t.cycles) for t in tasks])]
+        for debugger in debuggers:
+            if isinstance(debugger, longblock):
+                families.append(summary("curiousksp_task_cycle_seconds", "Run time of the Task cycles by Task name",
+                                        dict(debugger.histograms)))
+            if isinstance(debugger, taskprofile):
+                profile = dict(debugger.tasks)
+                families.append(family("curiousksp_task_cpu_seconds_total", "counter",
+                                       "Kernel thread CPU time of the Task cycles by Task name",
+                                       [("", {"task": name}, cpu) for name, (_, _, cpu) in profile.items()]))
+        return families
+
+    return collect
+
+
+class MetricsServer:
+    """Answer `GET /metrics` with the rendered metrics of a Metrics registry, from a Task in the kernel."""
+
+    def __init__(self, metrics, address="127.0.0.1", port=42048, max_request=8192):
+        """Initialise a new MetricsServer (port 0 picks a free port, see .port once started)."""
+        self._metrics = metrics
+        self._address = address
+        self._port = port
+        self._max_request = max_request
+        self._task = None
+        # stats: scrapes answered and requests refused
+        self.scrapes, self.refused = 0, 0
+
+    @property
+    def port(self):
+        """Return the port the server is (or will be) listening on."""
+        return self._port
+
+    async def start(self):
+        """Task: bind the server socket and spawn the (daemonic) serving Task."""
+        sock = tcp_server_socket(self._address, self._port)
+        self._port = sock.getsockname()[1]
+        self._task = await curio.spawn(run_server, sock, self._handle, daemon=True)
+        logger.debug(f"Metrics served at http://{self._address}:{self._port}/metrics")
+        return self
+
+    async def stop(self):
+        """Task: stop serving."""
+        if self._task:
+            await self._task.cancel()
+            self._task = None
+
+    async def _handle(self, client, addr):
+        """Task: answer one HTTP request - the metrics for GET /metrics, 404/405 for anything else."""
+        async with client:
+            request = b""
+            try:
+                async with curio.timeout_after(5):
+                    while b"\r\n\r\n" not in request and len(request) < self._max_request:
+                        if not (data := await client.recv(4096)):
+                            break
+                        request += data
+            except curio.TaskTimeout:
+                return
+            method, path, *_ = request.split(b"\r\n", 1)[0].decode("latin-1").split(" ") + ["", ""]
+            if method != "GET":
+                status, body = "405 Method Not Allowed", "only GET is supported\n"
+            elif path.split("?", 1)[0] not in ("/metrics", "/"):
+                status, body = "404 Not Found", "metrics are served at /metrics\n"
+            else:
+                status, body = "200 OK", self._metrics.render()
+            if status == "200 OK":
+                self.scrapes += 1
+            else:
+                self.refused += 1
+            payload = body.encode("utf-8")
+            head = f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(payload)}\r\n" \
+                   f"Connection: close\r\n\r\n"
+            await client.sendall(head.encode("latin-1") + payload)
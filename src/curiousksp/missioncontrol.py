@@ -4,14 +4,40 @@ from functools import partial
 
 from loguru import logger
 
-import krpc
 import curio
-from curio.monitor import Monitor as CurioMonitor
+import krpc
 
-# import the pint UnitRegistry
-from . import ureg
+# import the fast SI prefix formatter
+from .units import compact
+# import the batched log sinks - flushed at shutdown
+from . import logsink
 # import the SignalHandler - class which provides sigint handling task to MissionControl
 from .signalling import SignalHandler
+# import the ConnectionPool - class which keeps warm kRPC connections for MissionControl Tasks to reuse
+from .pool import ConnectionPool
+# import the Telemetry - class which fans out kRPC stream updates to curio Tasks
+from .telemetry import Telemetry
+# import the Reconnector - class which keeps the native kRPC connection up, redialling with backoff when it drops
+from .reconnect import Backoff, Reconnector, reachable
+# import the schemacache - SchemaCache keeps the kRPC service schema on disk so connecting needn't download it
+from . import schemacache
+# import the PropertyCache - class which memoizes reads of slow-changing kRPC properties
+from .propcache import PropertyCache
+# import the RecordingProxy - class which records the kRPC session for replay.ReplayServer to replay offline
+from .replay import RecordingProxy
+# import the TimeSeriesStore - class which keeps downsampled, memory-mapped histories of numeric metrics
+from .timeseries import TimeSeriesStore
+# import the ShardSupervisor - class which runs the vessels' jobs in worker processes across the CPU cores
+from .shards import ShardSupervisor
+# import the Metrics - class which collects the stats of MissionControl for the MetricsServer to expose to scrapers
+from .metrics import Metrics, MetricsServer, family, kernel_tasks, summary
+
+# the numeric fields of the krpc status recorded into the time-series store on every heartbeat
+STATUS_METRICS = ("rpcs_executed", "rpc_rate", "stream_rpcs", "stream_rpc_rate", "stream_rpcs_executed",
+                  "bytes_read", "bytes_read_rate", "bytes_written", "bytes_written_rate", "time_per_rpc_update",
+                  "poll_time_per_rpc_update", "exec_time_per_rpc_update", "time_per_stream_update")
+# the krpc status fields that only ever count up - exposed as counters, the rest as gauges
+STATUS_COUNTERS = ("rpcs_executed", "stream_rpcs_executed", "bytes_read", "bytes_written")
 
 
 # 🏗️  building construction for? MissionControl?
@@ -33,25 +59,118 @@ class MissionControl:
 
     def __init__(self, name="curious",
                  krpc_addr="127.0.0.1", krpc_port=50000, krpcs_port=50001,
-                 monitor_port=42047, debuggers=None):
+                 monitor_port=42047, debuggers=None, timeseries=None, record=None, shards=0,
+                 confirm_timeout=30.0, schema_cache=None, metrics_port=42048):
         """Initialise a new MissionControl instance."""
         self._name = name
         self._krpc_addr = krpc_addr
         self._krpc_port = krpc_port
         self._krpcs_port = krpcs_port
         self._monitor_port = monitor_port
+        # port to serve the Prometheus metrics on, 0/None to serve none
+        self._metrics_port = metrics_port
+        self._metrics_server = None
         self._debuggers = debuggers
+        # path to record the kRPC session to (through a RecordingProxy) or None
+        self._record = record
+        self._recorder = None
+        # number of worker processes to shard the vessels across, 0 to run none
+        self._shard_workers = shards
+        self._shards = None
 
         # init curio.Kernel and curio.monitor.Monitor as None
         self._ck, self._cm = None, None
         # init task refs as None
         self._start_task = None
+        # setup the on-disk cache of the kRPC service schema under the schema_cache dir if given
+        self._schema_cache = schemacache.SchemaCache(schema_cache) if schema_cache else None
+        # init the Reconnector that keeps the native kRPC client (asynkrpc.Client) up as None until start
+        self._link = None
+        # init the cache of slow-changing kRPC property reads (through the native client) as None until start
+        self._props = None
+        # init telemetry (and its dedicated kRPC connection) as None until start has connected
+        self._telemetry = None
+        # setup the time-series store for metric histories, memory-mapped under the timeseries dir if given
+        self._timeseries = TimeSeriesStore(timeseries)
+        # setup a bounded pool of kRPC connections - tasks check out warm connections instead of connecting anew
+        self._pool = ConnectionPool(self.connect, name=self._name)
+        # collect the stats kept in memory for the metrics endpoint - the kernel's Tasks are added in run
+        self._metrics = Metrics()
+        self._metrics.register(self._collect_metrics)
 
         # setup a signal handler to manage Ctrl-C/KeyboardInterrupt initiated shutdown
-        self._signal_handler = SignalHandler(self.shutdown, shutdown_mode="ask soft")
+        self._signal_handler = SignalHandler(self.shutdown, shutdown_mode="ask soft", confirm_timeout=confirm_timeout)
 
     # TODO: add properties to guard internals like _name against changes
 
+    @property
+    def timeseries(self):
+        """Return the TimeSeriesStore of metric histories."""
+        return self._timeseries
+
+    @property
+    def metrics(self):
+        """Return the Metrics registry exposed by the metrics endpoint."""
+        return self._metrics
+
+    @property
+    def shards(self):
+        """Return the ShardSupervisor of the vessel worker processes, or None."""
+        return self._shards
+
+    async def shard_telemetry(self):
+        """Task (daemonic): record the numeric telemetry published by the sharded vessels' jobs."""
+        while True:
+            vessel, key, value = await self._shards.updates.get()
+            if isinstance(value, (int, float)):
+                self._timeseries.record(f"vessel.{vessel}.{key}", value)
+
+    def _collect_metrics(self):
+        """Return the metric families of the kRPC status, connections, caches and queues of MissionControl."""
+        families = []
+        if self._telemetry and (status := self._telemetry.latest("krpc.status")) is not None:
+            for m in STATUS_METRICS:
+                counter = m in STATUS_COUNTERS
+                families.append(family(f"curiousksp_krpc_{m}{'_total' if counter else ''}",
+                                       "counter" if counter else "gauge", f"krpc status {m} at the last heartbeat",
+                                       [("", {}, getattr(status, m))]))
+        if self._telemetry:
+            families.append(family("curiousksp_queue_depth", "gauge", "Updates queued for the telemetry subscribers",
+                                   [("", {"queue": f"telemetry.{key}"}, n)
+                                    for key, n in self._telemetry.depths().items()]
+                                   + ([("", {"queue": "shards.updates"}, self._shards.updates.qsize())]
+                                      if self._shards is not None else [])))
+            families.append(family("curiousksp_telemetry_dropped_total", "counter",
+                                   "Telemetry updates dropped for slow subscribers",
+                                   [("", {}, self._telemetry.dropped)]))
+        if self._link is not None:
+            families += [family("curiousksp_krpc_connects_total", "counter", "Native kRPC connections made",
+                                [("", {}, self._link.connects)]),
+                         family("curiousksp_krpc_reconnects_total", "counter", "Native kRPC connections remade",
+                                [("", {}, max(0, self._link.connects - 1))]),
+                         family("curiousksp_krpc_probe_failures_total", "counter", "Failed kRPC health probes",
+                                [("", {}, self._link.probe_failures)]),
+                         summary("curiousksp_krpc_outage_seconds", "Time without a native kRPC connection",
+                                 {None: self._link.outages}, label=None)]
+        families += [family("curiousksp_pool_connections", "gauge", "Pooled kRPC connections by state",
+                            [("", {"state": "idle"}, self._pool.idle), ("", {"state": "in_use"}, self._pool.in_use)]),
+                     family("curiousksp_pool_connections_total", "counter", "Pooled kRPC connections by event",
+                            [("", {"event": e}, getattr(self._pool, e)) for e in ("opened", "reused", "discarded")])]
+        if self._props is not None:
+            stats = self._props.stats()
+            families += [family("curiousksp_propcache_reads_total", "counter", "Property reads by where they came from",
+                                [("", {"result": "hit"}, stats["hits"]), ("", {"result": "miss"}, stats["misses"])]),
+                         family("curiousksp_propcache_dropped_total", "counter", "Cached property values dropped",
+                                [("", {"reason": "evicted"}, stats["evictions"]),
+                                 ("", {"reason": "invalidated"}, stats["invalidations"])]),
+                         family("curiousksp_propcache_size", "gauge", "Cached property values",
+                                [("", {}, stats["size"])])]
+        if self._shards is not None:
+            families.append(family("curiousksp_shard_events_total", "counter", "Vessel worker process events",
+                                   [("", {"event": e}, getattr(self._shards, e))
+                                    for e in ("restarts", "results", "received", "dropped")]))
+        return families
+
     async def shutdown(self):
         """Task: shutdown other running tasks. maybe even save some state first?."""
         logger.info(f"Shutting down '{self._name}' mission control...")
@@ -59,96 +178,170 @@ class MissionControl:
         # the tasks that it manages
         # self._running = False
         # cancel tasks
+        # start's cleanup flushes the buffered log messages - this Task is cancelled by it when run from the sigint Task
         if self._start_task:
             await self._start_task.cancel()
 
+    @property
+    def rpc(self):
+        """Return the current native kRPC client (asynkrpc.Client), or None while disconnected."""
+        return self._link.client if self._link else None
+
+    @property
+    def props(self):
+        """Return the PropertyCache to read slow-changing kRPC properties through, or None before connecting."""
+        return self._props
+
+    def batch(self):
+        """Return an asynkrpc.Batch to collect calls in `async with mc.batch() as b:` and send them in one request."""
+        if self.rpc is None:
+            raise RuntimeError("MissionControl is not connected to kRPC yet")
+        return self.rpc.batch()
+
     def _connect(self, name=None, address="127.0.0.1", rpc_port=50000, stream_port=50001):
-        """[sync] Return krpc.client.Client from blocking krpc.connect."""
+        """[sync] Return krpc.client.Client from blocking krpc.connect (schemacache.connect if caching the schema)."""
         logger.info(f"Connecting to kRPC at '{address}' as '{name}' [{rpc_port=}, {stream_port=}]")
+        if self._schema_cache:
+            return schemacache.connect(name=name, address=address, rpc_port=rpc_port, stream_port=stream_port,
+                                       cache=self._schema_cache)
         conn = krpc.connect(name=name, address=address, rpc_port=rpc_port, stream_port=stream_port)
         return conn
 
     async def connect(self, name, address="127.0.0.1", rpc_port=50000, stream_port=50001):
         """Task: run in thread self._connect and return the constructed krpc.client.Client."""
+        # the blocking connect can't be timed out or cancelled once in its thread - only hand it reachable servers
+        if not await reachable(self._krpc_addr, self._krpc_port):
+            raise ConnectionRefusedError(f"kRPC at '{self._krpc_addr}:{self._krpc_port}' is not reachable")
         # use a functools.partial here to pass keyword arguments into the synchronous function _connect
         conn = await curio.run_in_thread(partial(self._connect, name, address=self._krpc_addr,
                                                  rpc_port=self._krpc_port, stream_port=self._krpcs_port))
         return conn
 
     async def poll_for_ksp_connect(self):
-        """Task: poll for first connection as part of MissionControl.start - waiting 10 seconds before next attempt."""
-        # the synchronous parts of this need to run in a separate thread - now it begins...
+        """Task: start the Reconnector of the native connection as part of MissionControl.start and wait for it."""
+        # the native client connects with curio sockets, so each attempt times out and the wait is cancellable - the
+        # attempts back off from milliseconds apart so a (re)started KSP is picked up within a second
         try:
-            while True:
-                try:
-                    conn = await self.connect(self._name)
-                    return conn
-                except ConnectionRefusedError as e:
-                    # TODO: do some form of await here to prevent logging of below after shutdown has begun?
-                    # connection refused :(, let's output some fancy logs 🐍
-                    logger.error("Connection refused - is KSP running and is the kRPC server started?")
-                    logger.debug("Waiting 10 seconds before next KSP/kRPC connection poll attempt...")
-                # now wait a bit before trying again
-                await curio.sleep(10)
+            self._link = Reconnector(self._name, address=self._krpc_addr, rpc_port=self._krpc_port,
+                                     schema_cache=self._schema_cache)
+            await self._link.start()
+            return await self._link.get()
         except curio.CancelledError:
             logger.debug("[cancelled] 'MissionControl.poll_for_ksp_connect'")
             raise
 
+    @staticmethod
+    def _format_status(s):
+        """Render a KRPC.Status into a compact human string of RPC/stream rates, IO and update times."""
+        # the status values are in base units (seconds, bytes) - `compact` picks the best SI prefix for humans
+        # like pint's `.to_compact()` + `~P` would, without building a dozen Quantities per heartbeat
+        rpc_info = f"RPCs: {s.rpcs_executed} [{s.rpc_rate:.1f}/s]"
+        stream_info = f"SRPCs: {s.stream_rpcs} [{s.stream_rpc_rate:.1f}/s] ({s.stream_rpcs_executed} exec)"
+        io_info = f"IO R: {compact(s.bytes_read, 'B')} [{compact(s.bytes_read_rate, 'B/s')}], " \
+                  f"IO W: {compact(s.bytes_written, 'B')} [{compact(s.bytes_written_rate, 'B/s')}]"
+        # the rt (Rpc update Time) and its components: the time spent on poll and exec
+        rti = f"{compact(s.time_per_rpc_update, 's')} / RPC " \
+              f"(poll:{compact(s.poll_time_per_rpc_update, 's')}, exec:{compact(s.exec_time_per_rpc_update, 's')})"
+        # the st (Stream update Time)
+        sti = f"{compact(s.time_per_stream_update, 's')} / stream"
+        return f"{rpc_info} + {stream_info}; {io_info}; {rti} & {sti}"
+
     async def heartbeat(self, downtime=5):
-        """Task (daemonic): periodically poll krpc for status information and log/display."""
-        conn = None
+        """Task (daemonic): subscribe to a krpc status stream (at 1/downtime Hz) and log/display each update."""
+        status_q = None
         try:
-            conn = await self.connect(f"{self._name}:heartbeat")
+            # register the status stream once, the server pushes updates to us rather than us polling it per tick -
+            # by path, so that relink_telemetry can register it again on a new connection after a KSP restart
+            await self._telemetry.register("krpc.status", "krpc.get_status", rate=1 / downtime)
+            status_q = self._telemetry.subscribe("krpc.status")
             while True:
-                s = conn.krpc.get_status()
-                # process the status into something nice
-                # take vars from status and build pint quantities from them
-                rpcs, rpcr = s.rpcs_executed, s.rpc_rate * ureg.count / ureg.second
-                iobr, iobrr = s.bytes_read * ureg.bytes, s.bytes_read_rate * ureg.bytes / ureg.second,
-                iobw, iobwr = s.bytes_written * ureg.bytes, s.bytes_written * ureg.bytes / ureg.second
-                # extract the rt (Rpc update Time) and its components: the time spent on poll and exec
-                rt = s.time_per_rpc_update * ureg.seconds
-                pt, et = s.poll_time_per_rpc_update * ureg.seconds, s.exec_time_per_rpc_update * ureg.seconds
-                # make a fancy string to represent this data - `~P:.1f` for pint pretty abbreviated .1 float acc. form
-                # `.to_compact()` is pint magic that picks the best prefix for humans
-                rti = f"{rt.to_compact():~P.1f} / RPC (poll:{pt.to_compact():~P.1f}, exec:{et.to_compact():~P.1f})"
-                # extract the st (Stream update Time) related information
-                srpcs, srpcs_exec = s.stream_rpcs, s.stream_rpcs_executed
-                st, srpcr = s.time_per_stream_update * ureg.seconds, s.stream_rpc_rate * ureg.count / ureg.second
-                sti = f"{st.to_compact():~P.1f} / stream"
-                rpc_info = f"RPCs: {rpcs} [{rpcr.magnitude:.1f}/s]"
-                stream_info = f"SRPCs: {srpcs} [{srpcr.magnitude:.1f}/s] ({srpcs_exec} exec)"
-                status = f"{rpc_info} + {stream_info}; " \
-                         f"IO R: {iobr.to_compact():~P.1f} [{iobrr.to_compact():~P.1f}], " \
-                         f"IO W: {iobw.to_compact():~P.1f} [{iobwr.to_compact():~P.1f}]; " \
-                         f"{rti} & {sti}"
-                # print(dir(s))
-                logger.debug(f"❤️  {status}")
-                await curio.sleep(downtime)
+                s = await status_q.get()
+                # keep the status history rather than only a log line of it
+                self._timeseries.record_many({f"krpc.status.{m}": getattr(s, m) for m in STATUS_METRICS})
+                # only format the status if a sink will actually emit the DEBUG record
+                logger.opt(lazy=True).debug("❤️  {}", partial(self._format_status, s))
         except curio.CancelledError as e:
             logger.debug("[cancelled] 'MissionControl.heartbeat' - cleaning up:")
             raise
         finally:
-            # close the conn
-            if conn:
-                logger.debug("Closing heartbeat connection...")
-                conn.close()
+            # stop receiving status updates
+            if status_q:
+                logger.debug("Unsubscribing heartbeat from status telemetry...")
+                self._telemetry.unsubscribe("krpc.status", status_q)
+            raise
+
+    async def relink_telemetry(self):
+        """Task (daemonic): move the telemetry streams onto a new pooled connection whenever the Reconnector redials.
+
+        The telemetry's connection doesn't survive a KSP restart any more than the native one does - its stream thread
+        dies with it and the subscribers (e.g. heartbeat) would wait for their next update forever.
+        """
+        backoff = Backoff(initial=0.1, maximum=5.0)
+        connects = self._link.connects
+        try:
+            while True:
+                redialled = await self._link.redialled(connects)
+                conn = None
+                try:
+                    # the idle pooled connections were to the old server too
+                    await self._pool.close()
+                    conn = await self._pool.checkout()
+                    old = await self._telemetry.rebind(conn)
+                except (Exception, curio.TaskTimeout) as e:
+                    if conn is not None:
+                        await self._pool.checkin(conn, discard=True)
+                    delay = backoff.next()
+                    logger.error(f"Moving the telemetry streams to a new connection failed ({e!r}) - retrying in "
+                                 f"{delay:.1f}s")
+                    await curio.sleep(delay)
+                    continue
+                backoff.reset()
+                connects = redialled
+                logger.info(f"Moved the telemetry streams {self._telemetry.keys} to a new connection")
+                await self._pool.checkin(old, discard=True)
+        except curio.CancelledError:
+            logger.debug("[cancelled] 'MissionControl.relink_telemetry'")
             raise
 
     async def start(self):
         """Task: curio.Kernel.run(start) main that boots up the async parts of MissionControl."""
         cancelled = False
         self._start_task = await curio.current_task()
-        sigint_task, poll_task, beat_task = None, None, None
+        sigint_task, poll_task, beat_task, reaper_task, shard_task, props_task, relink_task = (None,) * 7
         try:
             # setup background task to wait for SIGINT events
             sigint_task = await curio.spawn(self._signal_handler.sigint, daemon=True)
+            if self._metrics_port:
+                # serve the metrics for scrapers next to the curio monitor console
+                self._metrics_server = await MetricsServer(self._metrics, port=self._metrics_port).start()
+            if self._record:
+                # connect everything through the recording proxy instead of straight to kRPC
+                self._recorder = RecordingProxy(self._record, address=self._krpc_addr, rpc_port=self._krpc_port,
+                                                stream_port=self._krpcs_port)
+                await self._recorder.start()
+                self._krpc_addr, self._krpc_port, self._krpcs_port = \
+                    "127.0.0.1", self._recorder.rpc_port, self._recorder.stream_port
             # TODO: spawn monitor console with subprocess.Popen(NEW_CONSOLE)
             poll_task = await curio.spawn(self.poll_for_ksp_connect)
-            conn = await poll_task.join()
-            logger.success(f"{conn=}")
+            logger.success(f"rpc={await poll_task.join()!r}")
+            # memoize the slow-changing properties, invalidated as the scene, active vessel or stage changes
+            self._props = PropertyCache(self._link)
+            props_task = await curio.spawn(self._props.watch, daemon=True)
+            # evict pooled connections that idle for too long
+            reaper_task = await curio.spawn(self._pool.reaper, daemon=True)
+            # check out a dedicated connection whose stream thread feeds the telemetry subscribers
+            self._telemetry = Telemetry(await self._pool.checkout())
+            relink_task = await curio.spawn(self.relink_telemetry, daemon=True)
             # spawn heartbeat/status class
             beat_task = await curio.spawn(self.heartbeat, daemon=True)
+            if self._shard_workers:
+                # hand the vessels to worker processes, each with a kernel and kRPC connection of its own
+                self._shards = ShardSupervisor(self._shard_workers, name=self._name, address=self._krpc_addr,
+                                               rpc_port=self._krpc_port)
+                await self._shards.start()
+                vessels = await self._link.invoke("SpaceCenter", "get_Vessels")
+                await self._shards.assign(*(v._object_id for v in vessels))
+                shard_task = await curio.spawn(self.shard_telemetry, daemon=True)
             # HACK: run for a while - so we have time to check interaction of sigint etc during dev
             #       when start ends, all other spawned tasks are daemonic; self.run would return immediately
             await curio.sleep(30)
@@ -164,13 +357,47 @@ class MissionControl:
             if beat_task:
                 logger.debug(f"Cancelling '{beat_task.name}' [id={beat_task.id}, state={beat_task.state}]...")
                 await beat_task.cancel()
+            if relink_task:
+                await relink_task.cancel()
+            if props_task:
+                logger.debug(f"Stopping property cache watch [{self._props.stats()}]...")
+                await props_task.cancel()
+            if shard_task:
+                await shard_task.cancel()
+            if self._shards:
+                logger.debug(f"Stopping vessel worker processes [{self._shards.restarts} restarts]...")
+                await self._shards.stop()
+            if self._telemetry:
+                logger.debug("Closing telemetry streams and returning its connection to the pool...")
+                await self._telemetry.close()
+                await self._pool.checkin(self._telemetry.conn)
+            if reaper_task:
+                await reaper_task.cancel()
+            logger.debug(f"Closing pooled connections [{self._pool.opened} opened, {self._pool.reused} reused]...")
+            await self._pool.close()
+            if self._link:
+                logger.debug(f"Closing native kRPC connection [{self._link.connects} connects]...")
+                await self._link.close()
+            if self._recorder:
+                logger.debug(f"Writing kRPC recording to '{self._record}' [{self._recorder.records} frames]...")
+                await self._recorder.stop()
+            if self._metrics_server:
+                logger.debug(f"Stopping metrics endpoint [{self._metrics_server.scrapes} scrapes]...")
+                await self._metrics_server.stop()
+            logger.debug(f"Flushing time-series store [{len(self._timeseries.names)} metrics]...")
+            self._timeseries.close()
+            # write out the buffered log messages (from a thread, the writers may take a moment)
+            await curio.run_in_thread(logsink.flush_all)
             # raise Exception("test")
             return "cancelled" if cancelled else "timeout: end of all tasks reached"
 
     def run(self):
         """Stir this curious cauldron of dark async magic and kerbal witch/wizard blood already!."""
+        # curio.monitor pulls in telnetlib etc, only import it when a kernel is actually going to run
+        from curio.monitor import Monitor as CurioMonitor
         self._ck = curio.Kernel(debug=self._debuggers, taskcls=curio.task.ContextTask)
         self._cm = CurioMonitor(self._ck, port=self._monitor_port)
+        self._metrics.register(kernel_tasks(self._ck, self._debuggers or ()))
         # run the monitor task with the kernel
         # returns None immediately because it is daemonic(?)
         self._ck.run(self._cm.start)
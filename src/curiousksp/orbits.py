@@ -0,0 +1,162 @@
+"""Propagate Kepler orbits locally with NumPy - positions/velocities of many orbits at many times without an RPC each.
+
+Asking the server for the position of an orbit at a future UT costs an RPC per sample, so planning a maneuver or
+looking for an encounter takes thousands of round trips. Orbits pulls the orbital elements of a batch of orbits and
+the gravitational parameters of their bodies once - two batched requests - and then evaluates them over arrays of
+times in vectorized form. The elements only hold while nothing but gravity acts on the vessel: fetch them again after
+a burn, staging or a change of sphere of influence.
+"""
+import numpy as np
+
+# a row per orbit: its elements (m, rad, s) and the gravitational parameter (m^3/s^2) of the body it orbits
+ELEMENTS = np.dtype([("a", "f8"), ("e", "f8"), ("inc", "f8"), ("lan", "f8"), ("argp", "f8"), ("m0", "f8"),
+                     ("epoch", "f8"), ("mu", "f8")])
+# ELEMENTS field -> the SpaceCenter procedure reading it from an Orbit
+PROCEDURES = {"a": "Orbit_get_SemiMajorAxis", "e": "Orbit_get_Eccentricity", "inc": "Orbit_get_Inclination",
+              "lan": "Orbit_get_LongitudeOfAscendingNode", "argp": "Orbit_get_ArgumentOfPeriapsis",
+              "m0": "Orbit_get_MeanAnomalyAtEpoch", "epoch": "Orbit_get_Epoch"}
+
+
+def solve_kepler(m, e, tol=1e-12, iterations=50):
+    """Return the eccentric (e < 1) or hyperbolic (e > 1) anomalies of the mean anomalies m, e broadcast against m.
+
+    Newton's method on every element at once, stopping when the largest step is below tol (radians).
+    """
+    m, e = np.broadcast_arrays(np.asarray(m, dtype=float), np.asarray(e, dtype=float))
+    elliptic = e < 1
+    # wrap elliptic mean anomalies into [-pi, pi) - the series of revolutions doesn't matter to the position
+    m = np.where(elliptic, np.remainder(m + np.pi, 2 * np.pi) - np.pi, m)
+    anomaly = np.where(elliptic, np.where(e < 0.8, m, np.pi * np.sign(m)), np.arcsinh(m / np.where(elliptic, 1, e)))
+    for _ in range(iterations):
+        f = np.where(elliptic, anomaly - e * np.sin(anomaly) - m, e * np.sinh(anomaly) - anomaly - m)
+        df = np.where(elliptic, 1 - e * np.cos(anomaly), e * np.cosh(anomaly) - 1)
+        step = f / df
+        anomaly = anomaly - step
+        if np.max(np.abs(step), initial=0.0) < tol:
+            break
+    return anomaly
+
+
+class Orbits:
+    """A batch of Kepler orbits - ELEMENTS rows, their names and remote objects - evaluated with NumPy."""
+
+    def __init__(self, elements, names=None, remotes=None, bodies=None):
+        """Initialise new Orbits from an ELEMENTS array (or a sequence of ELEMENTS tuples).
+
+        remotes and bodies are the SpaceCenter Orbit objects and the CelestialBody objects they orbit, if the orbits
+        came from a server - validate needs them.
+        """
+        self.elements = np.array(elements, dtype=ELEMENTS, ndmin=1)
+        self.names = list(names) if names is not None else [str(i) for i in range(len(self.elements))]
+        self.remotes = remotes
+        self.bodies = bodies
+
+    def __len__(self):
+        return len(self.elements)
+
+    @classmethod
+    async def fetch(cls, conn, remotes, names=None):
+        """Task: return the Orbits of the remote Orbit objects, read through conn (an asynkrpc.Client).
+
+        Every element of every orbit is read in one batched request, the bodies' gravitational parameters in another.
+        """
+        async with conn.batch() as b:
+            calls = [({field: b.add("SpaceCenter", proc, r) for field, proc in PROCEDURES.items()},
+                      b.add("SpaceCenter", "Orbit_get_Body", r)) for r in remotes]
+        bodies = [body.value for _, body in calls]
+        unique = {body._object_id: body for body in bodies}
+        async with conn.batch() as b:
+            mus = {i: b.add("SpaceCenter", "CelestialBody_get_GravitationalParameter", body)
+                   for i, body in unique.items()}
+        elements = [tuple(call.value for call in fields.values()) + (mus[body._object_id].value,)
+                    for (fields, _), body in zip(calls, bodies)]
+        return cls(elements, names=names, remotes=list(remotes), bodies=bodies)
+
+    @classmethod
+    async def of(cls, conn, objects, kind="Vessel"):
+        """Task: return the Orbits of objects - Vessels or CelestialBodies (kind) - named after them.
+
+        One more batched request reads their Orbit objects and names. A body without an orbit (the Sun) is left out.
+        """
+        async with conn.batch() as b:
+            calls = [(b.add("SpaceCenter", f"{kind}_get_Orbit", o), b.add("SpaceCenter", f"{kind}_get_Name", o))
+                     for o in objects]
+        calls = [(orbit.value, name.value) for orbit, name in calls if orbit.value is not None]
+        return await cls.fetch(conn, [orbit for orbit, _ in calls], names=[name for _, name in calls])
+
+    def state(self, ut):
+        """Return the positions and velocities of every orbit at the times ut - two arrays of shape (orbits, times, 3).
+
+        ut is a scalar, an array of times shared by every orbit or an (orbits, times) array. Vectors are in the
+        orbited body's non-rotating reference frame like kRPC's: x/z in the equatorial plane, y the rotation axis.
+        """
+        el = self.elements
+        ut = np.asarray(ut, dtype=float)
+        ut = np.broadcast_to(ut.reshape(1, -1) if ut.ndim < 2 else ut, (len(el), ut.shape[-1] if ut.ndim else 1))
+        a, e, mu = el["a"][:, None], el["e"][:, None], el["mu"][:, None]
+        # |a| keeps the mean motion (and the perifocal coordinates below) real for hyperbolic orbits (a < 0)
+        size = np.abs(a)
+        m = el["m0"][:, None] + np.sqrt(mu / size ** 3) * (ut - el["epoch"][:, None])
+        anomaly = solve_kepler(m, np.broadcast_to(e, m.shape))
+        elliptic = e < 1
+        cos = np.where(elliptic, np.cos(anomaly), np.cosh(anomaly))
+        sin = np.where(elliptic, np.sin(anomaly), np.sinh(anomaly))
+        # perifocal coordinates: x towards the periapsis, y 90 degrees along the motion
+        root = np.sqrt(np.abs(1 - e * e))
+        x = np.where(elliptic, size * (cos - e), size * (e - cos))
+        y = size * root * sin
+        r = np.where(elliptic, size * (1 - e * cos), size * (e * cos - 1))
+        vx = -np.sqrt(mu * size) / r * sin
+        vy = np.sqrt(mu * size) * root / r * cos
+        p, q = self._perifocal_axes()
+        positions = x[..., None] * p[:, None, :] + y[..., None] * q[:, None, :]
+        velocities = vx[..., None] * p[:, None, :] + vy[..., None] * q[:, None, :]
+        # from a right-handed z-up frame to KSP's left-handed y-up one
+        return positions[..., [0, 2, 1]], velocities[..., [0, 2, 1]]
+
+    def _perifocal_axes(self):
+        """Return the unit vectors towards the periapsis and 90 degrees along the motion, (orbits, 3) arrays each."""
+        el = self.elements
+        cl, sl = np.cos(el["lan"]), np.sin(el["lan"])
+        cw, sw = np.cos(el["argp"]), np.sin(el["argp"])
+        ci, si = np.cos(el["inc"]), np.sin(el["inc"])
+        p = np.stack((cl * cw - sl * sw * ci, sl * cw + cl * sw * ci, sw * si), axis=-1)
+        q = np.stack((-cl * sw - sl * cw * ci, -sl * sw + cl * cw * ci, cw * si), axis=-1)
+        return p, q
+
+    def positions(self, ut):
+        """Return the positions of every orbit at the times ut, an (orbits, times, 3) array - see state."""
+        return self.state(ut)[0]
+
+    def separations(self, i, j, ut):
+        """Return the distances between orbits i and j (around the same body) at the times ut, a (times,) array."""
+        positions = self.positions(ut)
+        return np.linalg.norm(positions[i] - positions[j], axis=-1)
+
+    async def validate(self, conn, ut):
+        """Task: return the largest position (m) and speed (m/s) errors against the server's at the times ut.
+
+        Every orbit's Orbit.PositionAt (in its body's non-rotating frame) and Orbit.OrbitalSpeedAt is read at every
+        time in one batched request - as many calls as the propagation saves, so use a handful of times.
+        kRPC sends gravitational parameters as (single precision) floats, so expect position errors of ~1e-8 of the
+        distance travelled since the epoch.
+        """
+        if self.remotes is None:
+            raise ValueError("Only Orbits fetched from a server can be validated")
+        ut = np.atleast_1d(np.asarray(ut, dtype=float))
+        unique = {body._object_id: body for body in self.bodies}
+        async with conn.batch() as b:
+            frames = {i: b.add("SpaceCenter", "CelestialBody_get_NonRotatingReferenceFrame", body)
+                      for i, body in unique.items()}
+        async with conn.batch() as b:
+            calls = [[(b.add("SpaceCenter", "Orbit_PositionAt", orbit, t, frames[body._object_id].value),
+                       b.add("SpaceCenter", "Orbit_OrbitalSpeedAt", orbit, t)) for t in ut.tolist()]
+                     for orbit, body in zip(self.remotes, self.bodies)]
+        server_positions = np.array([[position.value for position, _ in times] for times in calls])
+        server_speeds = np.array([[speed.value for _, speed in times] for times in calls])
+        positions, velocities = self.state(ut)
+        return {"position": float(np.max(np.linalg.norm(positions - server_positions, axis=-1))),
+                "speed": float(np.max(np.abs(np.linalg.norm(velocities, axis=-1) - server_speeds)))}
+
+    def __repr__(self):
+        return f"<Orbits {', '.join(self.names[:5])}{', ...' if len(self.names) > 5 else ''}>"
@@ -0,0 +1,160 @@
+"""Define a bounded pool of warm kRPC connections that MissionControl Tasks check out and back in.
+
+The connections are handed out as asyncrpc.AsyncClient`s, so every RPC made through them runs on the connection's
+executor thread (with a timeout) rather than stalling the kernel.
+"""
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from loguru import logger
+import curio
+
+from .asyncrpc import AsyncClient
+from .fixedrate import FixedRateLoop
+
+
+class ConnectionPool:
+    """Bounded pool of AsyncClient`s with async checkout/checkin, health checks and idle eviction."""
+
+    def __init__(self, connect, name="curious", maxsize=4, max_idle=60.0, check_after=5.0, timeout=5.0):
+        """Initialise a new ConnectionPool around connect, a Task that opens a new krpc.client.Client for a name.
+
+        The RPCs made through the connections handed out time out after timeout seconds.
+        """
+        self._connect = connect
+        self._name = name
+        self._maxsize = maxsize
+        self._timeout = timeout
+        # seconds a connection may sit idle before the reaper closes it
+        self._max_idle = max_idle
+        # seconds a connection may sit idle before it is health checked on checkout
+        self._check_after = check_after
+        # idle connections as (conn, monotonic time of checkin) - newest (warmest) on the right
+        self._idle = deque()
+        # bounds the number of checked out connections
+        self._slots = curio.Semaphore(maxsize)
+        self._counter = itertools.count(1)
+        # stats: connections opened, reused from idle and discarded (unhealthy/evicted/errored)
+        self.opened, self.reused, self.discarded = 0, 0, 0
+
+    @property
+    def idle(self):
+        """Return the number of idle connections waiting in the pool."""
+        return len(self._idle)
+
+    @property
+    def in_use(self):
+        """Return the number of connections currently checked out."""
+        return self._maxsize - self._slots.value
+
+    @staticmethod
+    async def _healthy(conn):
+        """Task: return True if conn still answers a cheap RPC (within its timeout)."""
+        try:
+            await conn.krpc.get_client_id()
+            return True
+        except (Exception, curio.TaskTimeout) as e:
+            logger.debug(f"Pooled connection failed health check: {e!r}")
+            return False
+
+    @staticmethod
+    async def _close(conn):
+        """Task: close conn's krpc.client.Client in a thread, then stop its executor thread.
+
+        Closing the client first fails a call stuck on it, errors from an already broken connection are ignored.
+        """
+        try:
+            await curio.run_in_thread(conn.conn.close)
+        except Exception as e:
+            logger.debug(f"Error closing pooled connection: {e!r}")
+        await conn.close()
+
+    async def _discard(self, conn):
+        """Task: close a connection that will not return to the pool."""
+        self.discarded += 1
+        await self._close(conn)
+
+    def _park(self, conn):
+        """Add conn to the idle connections if there is room, return whether there was."""
+        if len(self._idle) < self._maxsize:
+            self._idle.append((conn, time.monotonic()))
+            return True
+        return False
+
+    def _wrap(self, conn, name):
+        """Return an AsyncClient around conn, a krpc.client.Client."""
+        return AsyncClient(conn, name=name, timeout=self._timeout)
+
+    def seed(self, conn):
+        """Add an already open krpc.client.Client (e.g. from the first connect poll) to the idle connections."""
+        if len(self._idle) >= self._maxsize:
+            return False
+        return self._park(self._wrap(conn, f"{self._name}:pool:{next(self._counter)}"))
+
+    async def checkout(self):
+        """Task: wait for a free slot and return a warm idle connection, or open a new one if none are healthy."""
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                conn, since = self._idle.pop()
+                # only round-trip a health check for connections that have been sitting around for a while
+                if time.monotonic() - since < self._check_after or await self._healthy(conn):
+                    self.reused += 1
+                    return conn
+                await self._discard(conn)
+            name = f"{self._name}:pool:{next(self._counter)}"
+            conn = self._wrap(await self._connect(name), name)
+            self.opened += 1
+            return conn
+        except BaseException:
+            await self._slots.release()
+            raise
+
+    async def checkin(self, conn, discard=False):
+        """Task: return a checked out connection to the pool (or close it if discard) and free its slot."""
+        try:
+            if discard or not self._park(conn):
+                await self._discard(conn)
+        finally:
+            await self._slots.release()
+
+    @asynccontextmanager
+    async def connection(self):
+        """Check out a connection for the duration of an async with block, discarding it if the block hit an OSError."""
+        conn = await self.checkout()
+        discard = False
+        try:
+            yield conn
+        except OSError:
+            discard = True
+            raise
+        finally:
+            await self.checkin(conn, discard=discard)
+
+    async def reap(self):
+        """Task: close the idle connections that have been idle for longer than max_idle seconds."""
+        now = time.monotonic()
+        # the oldest idle connections are on the left
+        while self._idle and now - self._idle[0][1] > self._max_idle:
+            conn, since = self._idle.popleft()
+            logger.debug(f"Evicting connection idle for {now - since:.1f}s from pool...")
+            await self._discard(conn)
+
+    async def reaper(self, interval=10):
+        """Task (daemonic): periodically evict connections that have sat idle for too long."""
+        try:
+            # reap every interval seconds on the dot, however long a reap takes (tick 0 is straight away)
+            async for tick in FixedRateLoop(1 / interval, name="pool.reaper"):
+                if tick:
+                    await self.reap()
+        except curio.CancelledError:
+            logger.debug("[cancelled] 'ConnectionPool.reaper'")
+            raise
+
+    async def close(self):
+        """Task: close all of the idle connections in the pool."""
+        while self._idle:
+            conn, _ = self._idle.pop()
+            await self._close(conn)
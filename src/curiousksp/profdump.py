@@ -0,0 +1,108 @@
+"""Export the per-task CPU profiles gathered by debug.taskprofile as pstats, collapsed stacks and speedscope files.
+
+A profile is two mappings: the per-task cycle aggregates {task name: (code location, cycles, cpu seconds)} and the
+sampled stacks {(task name, (frame, ...)): samples} where a frame is a (filename, first line, function name) code
+location, outermost first. Each sample stands for interval seconds of the task running.
+"""
+import json
+import marshal
+from collections import defaultdict
+from pathlib import Path
+
+
+def _frame_name(frame):
+    filename, lineno, name = frame
+    return f"{name} ({Path(filename).name}:{lineno})"
+
+
+def weighted_stacks(tasks, samples, interval):
+    """Return {(task name, frames): seconds} - the sampled stacks, or one flat stack per task if nothing was sampled."""
+    if samples and interval:
+        return {key: n * interval for key, n in samples.items()}
+    return {(name, ()): cpu for name, (_, _, cpu) in tasks.items()}
+
+
+def pstats_dict(tasks, samples, interval):
+    """Return the profile as the {func: (cc, nc, tt, ct, callers)} dict that pstats.Stats loads.
+
+    Each task is a pseudo-function (named after the task, at the location of its coroutine) with its cycles as calls
+    and its CPU time as time, and is the caller of the outermost sampled frame of its stacks.
+    """
+    stats = {}
+    task_funcs = {}
+    for name, ((filename, lineno), cycles, cpu) in tasks.items():
+        func = task_funcs[name] = (filename, lineno, f"<task {name}>")
+        stats[func] = [cycles, cycles, cpu, cpu, {}]
+    for (name, frames), n in samples.items():
+        seconds = n * interval
+        caller = task_funcs.get(name)
+        for depth, frame in enumerate(frames):
+            entry = stats.setdefault(frame, [0, 0, 0.0, 0.0, {}])
+            # only count a recursive frame once per sample towards its inclusive time
+            if frame not in frames[:depth]:
+                entry[0] += n
+                entry[1] += n
+                entry[3] += seconds
+            if depth == len(frames) - 1:
+                entry[2] += seconds
+            if caller is not None:
+                cnc, ccc, ctt, cct = entry[4].get(caller, (0, 0, 0.0, 0.0))
+                leaf = seconds if depth == len(frames) - 1 else 0.0
+                entry[4][caller] = (cnc + n, ccc + n, ctt + leaf, cct + seconds)
+            caller = frame
+    return {func: (cc, nc, tt, ct, callers) for func, (cc, nc, tt, ct, callers) in stats.items()}
+
+
+def write_pstats(path, tasks, samples, interval):
+    """Write the profile to path in the marshalled format read by pstats.Stats (and snakeviz etc.)."""
+    with open(path, "wb") as f:
+        marshal.dump(pstats_dict(tasks, samples, interval), f)
+    return Path(path)
+
+
+def collapsed(tasks, samples, interval):
+    """Return the profile as collapsed stack lines ("task;frame;frame µs") for flamegraph.pl/inferno/speedscope."""
+    lines = []
+    for (name, frames), seconds in weighted_stacks(tasks, samples, interval).items():
+        stack = ";".join([name, *map(_frame_name, frames)])
+        lines.append(f"{stack} {round(seconds * 1e6)}")
+    return "\n".join(sorted(lines))
+
+
+def write_collapsed(path, tasks, samples, interval):
+    """Write the collapsed stacks of the profile to path."""
+    Path(path).write_text(collapsed(tasks, samples, interval) + "\n", encoding="utf8")
+    return Path(path)
+
+
+def speedscope(tasks, samples, interval, name="curiousksp"):
+    """Return the profile as a speedscope file format dict with one sampled profile per task."""
+    frames, index = [], {}
+    by_task = defaultdict(list)
+    for (task, stack), seconds in weighted_stacks(tasks, samples, interval).items():
+        by_task[task].append((stack, seconds))
+    profiles = []
+    for task, stacks in sorted(by_task.items()):
+        task_frame = (None, None, task)
+        profile_samples, weights = [], []
+        for stack, seconds in stacks:
+            ids = []
+            for frame in (task_frame, *stack):
+                if frame not in index:
+                    index[frame] = len(frames)
+                    filename, lineno, func = frame
+                    frames.append({"name": _frame_name(frame), "file": filename, "line": lineno}
+                                  if filename else {"name": func})
+                ids.append(index[frame])
+            profile_samples.append(ids)
+            weights.append(seconds)
+        profiles.append({"type": "sampled", "name": task, "unit": "seconds", "startValue": 0,
+                         "endValue": sum(weights), "samples": profile_samples, "weights": weights})
+    return {"$schema": "https://www.speedscope.app/file-format-schema.json", "name": name, "exporter": "curiousksp",
+            "activeProfileIndex": 0, "shared": {"frames": frames}, "profiles": profiles}
+
+
+def write_speedscope(path, tasks, samples, interval):
+    """Write the profile to path as a speedscope JSON file."""
+    Path(path).write_text(json.dumps(speedscope(tasks, samples, interval, name=Path(path).stem)), encoding="utf8")
+    return Path(path)
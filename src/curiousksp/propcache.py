@@ -0,0 +1,199 @@
+"""Memoize reads of slow-changing kRPC properties - per-procedure TTLs, bounded LRU memory and event invalidation.
+
+Vessel names, part lists, celestial body constants and the game mode rarely change, yet every read is an RPC. A
+PropertyCache sits in front of anything with an `invoke(service, procedure, *args)` Task (an asynkrpc.Client or a
+reconnect.Reconnector) and answers the reads matching its RULES from memory until their TTL runs out or an event they
+depend on happens: "scene" (game scene change or reconnect), "vessel" (active vessel switch) or "staging" (parts
+decoupled). Calls that cause an event through the cache invalidate straight away, watch() notices the rest.
+"""
+import fnmatch
+import time
+from collections import OrderedDict
+
+from loguru import logger
+import curio
+
+from .fixedrate import FixedRateLoop
+
+# (service, procedure pattern, TTL in seconds or None for until invalidated, events that invalidate it) - first match
+RULES = (
+    ("SpaceCenter", "CelestialBody_get_*", None, ("scene",)),
+    ("SpaceCenter", "get_Bodies", None, ("scene",)),
+    ("SpaceCenter", "get_GameMode", None, ("scene",)),
+    ("KRPC", "get_CurrentGameScene", 1.0, ("scene",)),
+    ("SpaceCenter", "get_ActiveVessel", 1.0, ("scene", "vessel")),
+    ("SpaceCenter", "Vessel_get_Name", 10.0, ("scene", "vessel")),
+    ("SpaceCenter", "Vessel_get_Type", 10.0, ("scene", "vessel")),
+    ("SpaceCenter", "Vessel_get_Parts", None, ("scene", "vessel")),
+    ("SpaceCenter", "Vessel_get_Control", None, ("scene", "vessel")),
+    ("SpaceCenter", "Parts_get_*", None, ("scene", "vessel", "staging")),
+    ("SpaceCenter", "Part_get_Title", None, ("scene", "vessel")),
+    ("SpaceCenter", "Part_get_Name", None, ("scene", "vessel")),
+    ("SpaceCenter", "Part_get_Tag", 5.0, ("scene", "vessel")),
+    ("SpaceCenter", "Part_get_Modules", None, ("scene", "vessel")),
+    ("SpaceCenter", "Part_get_*Stage", None, ("scene", "vessel", "staging")),
+    ("SpaceCenter", "Part_get_Parent", None, ("scene", "vessel", "staging")),
+    ("SpaceCenter", "Part_get_Children", None, ("scene", "vessel", "staging")),
+    ("SpaceCenter", "Module_get_Name", None, ("scene",)),
+)
+# (service, procedure pattern) -> the event a call of it causes
+EVENTS = (
+    ("SpaceCenter", "Control_ActivateNextStage", "staging"),
+    ("SpaceCenter", "Decoupler_Decouple", "staging"),
+    ("SpaceCenter", "DockingPort_Undock", "staging"),
+    ("SpaceCenter", "set_ActiveVessel", "vessel"),
+    ("SpaceCenter", "Launch*", "scene"),
+    ("SpaceCenter", "*load", "scene"),
+    ("SpaceCenter", "RevertTo*", "scene"),
+)
+
+
+def _key_arg(arg):
+    """Return a hashable stand-in for an argument - remote objects by their object id."""
+    return ("object", arg._object_id) if hasattr(arg, "_object_id") else arg
+
+
+class PropertyCache:
+    """Answer the kRPC property reads matching rules from an LRU memo of at most maxsize values."""
+
+    def __init__(self, client, rules=RULES, events=EVENTS, maxsize=4096):
+        """Initialise a new PropertyCache in front of client (with an invoke Task)."""
+        self._client = client
+        self._rules = rules
+        self._events = events
+        self._maxsize = maxsize
+        # (service, procedure) -> (ttl, events) or None, and -> the event the call causes or None
+        self._rule_of, self._event_of = {}, {}
+        # (service, procedure, args) -> (value, expiry monotonic time, events), least recently used first
+        self._values = OrderedDict()
+        # (service, procedure, args) -> curio.Result of the RPC already fetching it, shared by concurrent misses
+        self._fetching = {}
+        # stats: reads answered from memory, reads that made an RPC, values evicted for space and invalidated
+        self.hits, self.misses, self.evictions, self.invalidations = 0, 0, 0, 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def _rule(self, service, procedure):
+        """Return the (ttl, events) that service.procedure is cached by, or None if it isn't cached."""
+        try:
+            return self._rule_of[(service, procedure)]
+        except KeyError:
+            rule = next(((ttl, events) for s, pattern, ttl, events in self._rules
+                         if s == service and fnmatch.fnmatchcase(procedure, pattern)), None)
+            self._rule_of[(service, procedure)] = rule
+            return rule
+
+    def _event(self, service, procedure):
+        """Return the event a call of service.procedure causes, or None."""
+        try:
+            return self._event_of[(service, procedure)]
+        except KeyError:
+            event = next((e for s, pattern, e in self._events
+                          if s == service and fnmatch.fnmatchcase(procedure, pattern)), None)
+            self._event_of[(service, procedure)] = event
+            return event
+
+    async def invoke(self, service, procedure, *args):
+        """Task: return service.procedure(*args) - from memory if it is cached and still valid, else by RPC."""
+        rule = self._rule(service, procedure)
+        if rule is None:
+            value = await self._client.invoke(service, procedure, *args)
+            if (event := self._event(service, procedure)) is not None:
+                self.invalidate(event)
+            return value
+        try:
+            key = (service, procedure, tuple(_key_arg(a) for a in args))
+            hash(key)
+        except TypeError:
+            # e.g. a list argument, not worth caching
+            return await self._client.invoke(service, procedure, *args)
+        entry = self._values.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self.hits += 1
+            self._values.move_to_end(key)
+            return entry[0]
+        if (pending := self._fetching.get(key)) is not None:
+            self.hits += 1
+            return await pending.unwrap()
+        self.misses += 1
+        pending = self._fetching[key] = curio.Result()
+        try:
+            value = await self._client.invoke(service, procedure, *args)
+        except BaseException as e:
+            # the concurrent misses waiting on this RPC fail with it (or as it was cancelled, with a RuntimeError)
+            await pending.set_exception(e if isinstance(e, Exception) else RuntimeError(f"{procedure} was cancelled"))
+            raise
+        finally:
+            del self._fetching[key]
+        ttl, events = rule
+        self._values[key] = (value, float("inf") if ttl is None else time.monotonic() + ttl, events)
+        self._values.move_to_end(key)
+        while len(self._values) > self._maxsize:
+            self._values.popitem(last=False)
+            self.evictions += 1
+        await pending.set_value(value)
+        return value
+
+    def invalidate(self, event=None):
+        """Drop the values that depend on event (every value if None) and return how many were dropped."""
+        if event is None:
+            dropped = len(self._values)
+            self._values.clear()
+        else:
+            stale = [key for key, (_, _, events) in self._values.items() if event in events]
+            for key in stale:
+                del self._values[key]
+            dropped = len(stale)
+        self.invalidations += dropped
+        if dropped:
+            logger.opt(lazy=True).debug("Property cache invalidated {} values on {}", lambda: dropped,
+                                        lambda: event or "everything")
+        return dropped
+
+    async def watch(self, interval=0.5):
+        """Task (daemonic): poll the game scene, active vessel and its stage, invalidating on any change.
+
+        A reconnect of a reconnect.Reconnector client invalidates everything, the server's object ids start over.
+        """
+        last = None
+        try:
+            async for _ in FixedRateLoop(1 / interval, name="propcache.watch"):
+                # (reconnects, scene, active vessel, stage) - None where it couldn't be read
+                state = [getattr(self._client, "connects", None), None, None, None]
+                changed = False
+                try:
+                    state[1] = await self._client.invoke("KRPC", "get_CurrentGameScene")
+                    vessel = await self._client.invoke("SpaceCenter", "get_ActiveVessel")
+                    state[2] = _key_arg(vessel)
+                    # drop the old vessel's values before caching the new vessel's control
+                    changed = self._invalidate_changes(last, state[:3])
+                    control = await self.invoke("SpaceCenter", "Vessel_get_Control", vessel)
+                    state[3] = await self._client.invoke("SpaceCenter", "Control_get_CurrentStage", control)
+                except Exception as e:
+                    # e.g. no active vessel outside of flight, or the connection being down
+                    logger.debug(f"Property cache watch failed: {e!r}")
+                if not changed:
+                    self._invalidate_changes(last, state)
+                last = state
+        except curio.CancelledError:
+            logger.debug("[cancelled] 'PropertyCache.watch'")
+            raise
+
+    def _invalidate_changes(self, last, state):
+        """Invalidate for the first of reconnects/scene/vessel/stage that changed from last, return whether one did."""
+        if last is not None:
+            for was, now, event in zip(last, state, ("*", "scene", "vessel", "staging")):
+                if was != now:
+                    self.invalidate(None if event == "*" else event)
+                    return True
+        return False
+
+    def stats(self):
+        """Return a dict of the hit/miss/eviction/invalidation counts, hit rate and size."""
+        reads = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / reads if reads else 0.0,
+                "evictions": self.evictions, "invalidations": self.invalidations, "size": len(self._values)}
+
+    def __repr__(self):
+        return f"<PropertyCache size={len(self._values)} hits={self.hits} misses={self.misses}>"
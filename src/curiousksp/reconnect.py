@@ -0,0 +1,214 @@
+"""Reconnect to kRPC fast after KSP restarts - backoff with jitter, per-attempt timeouts and health probing.
+
+Polling every 10 s means a restarted server waits up to 10 s for us, and a dial stuck on a black-holed address hangs
+recovery and shutdown. Attempts here start milliseconds apart and back off exponentially up to a cap, with full jitter
+so that many connections don't retry in lockstep. Every attempt is a curio-native dial, so it times out and can be
+cancelled. A Reconnector keeps a native connection up: it probes the connection's health, redials as soon as a probe
+or a call finds it broken, and Tasks calling through it wait for the new connection rather than failing.
+"""
+import random
+
+from loguru import logger
+import curio
+from krpc.error import ConnectionError as KRPCConnectionError
+
+from . import asynkrpc
+from .fixedrate import FixedRateLoop
+from .histogram import LogHistogram
+
+# the errors of a dial that are worth retrying - refused/reset/unreachable, the server hanging up during the handshake
+# (e.g. a recording proxy that can't reach it), the handshake being rejected (e.g. not approved in game yet), timeouts
+RETRY = (OSError, EOFError, KRPCConnectionError, curio.TaskTimeout)
+
+
+class Backoff:
+    """Capped exponential backoff with jitter - delay n is drawn from [(1 - jitter) * d, d], d = initial * factor^n."""
+
+    def __init__(self, initial=0.005, maximum=1.0, factor=2.0, jitter=1.0):
+        """Initialise a new Backoff of delays from initial up to maximum seconds, jitter 1.0 being full jitter."""
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next(self):
+        """Return the delay before the next attempt."""
+        delay = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        """Start again from the initial delay (after a success)."""
+        self.attempts = 0
+
+
+async def dial(connect, *args, timeout=1.0, backoff=None, attempts=None, name="kRPC", **kwargs):
+    """Task: return await connect(*args, **kwargs), retrying failed (RETRY errors) or timed out attempts with backoff.
+
+    Every attempt is cancelled after timeout seconds. After attempts failed attempts (if given) the last error raises.
+    """
+    backoff = backoff or Backoff()
+    failures = 0
+    while True:
+        try:
+            return await curio.timeout_after(timeout, connect(*args, **kwargs))
+        except RETRY as e:
+            failures += 1
+            if attempts is not None and failures >= attempts:
+                raise
+            delay = backoff.next()
+            # say so once, then keep quiet at the fast retry rates
+            log = logger.error if failures == 1 else logger.debug
+            log(f"[{name}] Connecting failed ({e!r}) - is KSP running and is the kRPC server started? "
+                f"Retrying in {delay * 1e3:.0f}ms [attempt {failures}]")
+            await curio.sleep(delay)
+
+
+async def reachable(address, port, timeout=1.0):
+    """Task: return whether a TCP connection to address:port opens within timeout seconds."""
+    try:
+        sock = await curio.timeout_after(timeout, curio.open_connection, address, port)
+    except (OSError, curio.TaskTimeout):
+        return False
+    await sock.close()
+    return True
+
+
+class Reconnector:
+    """Keep a native (asynkrpc) kRPC connection up, redialling with backoff as soon as it is found broken."""
+
+    def __init__(self, name="curious", address="127.0.0.1", rpc_port=50000, timeout=5.0, probe_interval=0.5,
+                 probe_timeout=1.0, backoff=None, schema_cache=None):
+        """Initialise a new Reconnector, probing the connection every probe_interval seconds.
+
+        Each dial (handshake and service schema download) times out after timeout seconds, each probe after
+        probe_timeout seconds. The service schema is loaded from schema_cache (a schemacache.SchemaCache) if given.
+        """
+        self._name = name
+        self._address = address
+        self._rpc_port = rpc_port
+        self._timeout = timeout
+        self._probe_timeout = probe_timeout
+        self._probe_interval = probe_interval
+        self._backoff = backoff or Backoff()
+        self._schema_cache = schema_cache
+        self._client = None
+        # set while there is a connection believed to be healthy
+        self._connected = curio.Event()
+        # set by a Task whose call found the connection broken, so it is redialled without waiting for a probe
+        self._lost = curio.Event()
+        # notified whenever a connection has been made, see redialled
+        self._dialled = curio.Condition()
+        self._task = None
+        # stats: connections made, probes failed and how long each outage lasted (s)
+        self.connects, self.probe_failures = 0, 0
+        self.outages = LogHistogram()
+
+    @property
+    def client(self):
+        """Return the current asynkrpc.Client, or None while disconnected."""
+        return self._client if self._connected.is_set() else None
+
+    @property
+    def connected(self):
+        """Return whether there is a connection believed to be healthy."""
+        return self._connected.is_set()
+
+    async def start(self):
+        """Task: spawn the (daemonic) Task that dials, probes and redials the connection."""
+        self._task = await curio.spawn(self._run, daemon=True)
+        return self
+
+    async def get(self):
+        """Task: return the current asynkrpc.Client, waiting for a connection if there is none."""
+        await self._connected.wait()
+        return self._client
+
+    async def redialled(self, connects):
+        """Task: wait until there is a connection made after the first connects ones, return the connections made.
+
+        e.g. for a Task to redo what it had set up on the server, which a restarted KSP won't know about.
+        """
+        async with self._dialled:
+            await self._dialled.wait_for(lambda: self.connects > connects and self._connected.is_set())
+        return self.connects
+
+    async def lost(self, client):
+        """Task: report client broken (e.g. a call on it failed), to have it redialled straight away."""
+        if client is self._client and self._connected.is_set():
+            self._connected.clear()
+            await self._lost.set()
+
+    async def invoke(self, service, procedure, *args, retries=1):
+        """Task: call service.procedure(*args) like asynkrpc.Client.invoke, retrying on a new connection if it drops.
+
+        A call that was in flight when the connection dropped may have run, so only retry idempotent calls.
+        """
+        while True:
+            client = await self.get()
+            try:
+                return await client.invoke(service, procedure, *args)
+            except OSError:
+                await self.lost(client)
+                if retries <= 0:
+                    raise
+                retries -= 1
+
+    async def _probe(self, client):
+        """Task: return once the connection fails a health probe."""
+        async for _ in FixedRateLoop(1 / self._probe_interval, name=f"{self._name}.probe"):
+            try:
+                await curio.timeout_after(self._probe_timeout, client.get_status)
+            except (Exception, curio.TaskTimeout) as e:
+                self.probe_failures += 1
+                logger.warning(f"[{self._name}] kRPC connection failed its health probe: {e!r}")
+                return
+
+    async def _run(self):
+        """Task (daemonic): dial with backoff, then watch the connection and redial once it is broken."""
+        down_since = await curio.clock()
+        try:
+            while True:
+                try:
+                    self._client = await dial(asynkrpc.connect, self._name, address=self._address,
+                                              rpc_port=self._rpc_port, schema_cache=self._schema_cache,
+                                              timeout=self._timeout, backoff=self._backoff, name=self._name)
+                except Exception as e:
+                    # e.g. an RPCError fetching the service schema - keep redialling, Tasks are waiting on get()
+                    delay = self._backoff.next()
+                    logger.opt(exception=e).error(f"[{self._name}] Connecting failed ({e!r}) - retrying in "
+                                                  f"{delay * 1e3:.0f}ms")
+                    await curio.sleep(delay)
+                    continue
+                self._backoff.reset()
+                self.connects += 1
+                if self.connects > 1:
+                    self.outages.record(await curio.clock() - down_since)
+                    logger.success(f"[{self._name}] Reconnected to kRPC after {await curio.clock() - down_since:.3f}s")
+                self._lost.clear()
+                await self._connected.set()
+                async with self._dialled:
+                    await self._dialled.notify_all()
+                async with curio.TaskGroup(wait=any) as g:
+                    await g.spawn(self._lost.wait)
+                    await g.spawn(self._probe, self._client)
+                down_since = await curio.clock()
+                self._connected.clear()
+                await self._client.close()
+        except curio.CancelledError:
+            logger.debug(f"[cancelled] '{self._name}' Reconnector")
+            raise
+
+    async def close(self):
+        """Task: stop reconnecting and close the connection."""
+        if self._task:
+            await self._task.cancel()
+            self._task = None
+        self._connected.clear()
+        if self._client:
+            await self._client.close()
+            self._client = None
+
+    def __repr__(self):
+        return f"<Reconnector '{self._name}' connected={self.connected} connects={self.connects}>"
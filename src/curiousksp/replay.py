@@ -0,0 +1,318 @@
+"""Record kRPC sessions through a proxy and replay them from a stand-in server, so the pipeline can run without KSP.
+
+A recording is a header then one record per kRPC frame that crossed the proxy, in the order they crossed it:
+(ns since the recording started, connection id, channel, direction, payload size) followed by the still encoded
+payload. The RecordingProxy forwards the RPC and stream ports to the real server untouched, the ReplayServer answers
+each RPC request with the response recorded for the same request bytes (after the recorded latency / speed) and
+pushes the recorded stream updates at their recorded offsets / speed.
+"""
+import itertools
+import struct
+import time
+from collections import defaultdict, deque
+from functools import partial
+
+from loguru import logger
+import curio
+from curio.network import run_server, tcp_server_socket
+from krpc.decoder import Decoder
+import krpc.schema.KRPC_pb2 as KRPC
+
+from .asynkrpc import receive_frame, send_frame, send_message
+
+MAGIC = b"CKSPREC1"
+# magic, wall clock ns the recording started at
+HEADER = struct.Struct("<8sQ")
+# ns since the recording started, connection id, channel, direction, payload size
+RECORD = struct.Struct("<qIBBI")
+RPC, STREAM = 0, 1
+TO_SERVER, TO_CLIENT = 0, 1
+
+
+class SessionWriter:
+    """Buffer recorded frames in memory and write them out to the recording file from a thread."""
+
+    def __init__(self, path, flush_size=1 << 20):
+        """Initialise a new SessionWriter, creating the recording file at path."""
+        self._path = path
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, time.time_ns()))
+        self._start = time.monotonic_ns()
+        # write out once this many bytes are buffered
+        self._flush_size = flush_size
+        self._buffer = bytearray()
+        # chunks must reach the file in the order they were taken from the buffer
+        self._lock = curio.Lock()
+        self.records = 0
+
+    @property
+    def path(self):
+        """Return the path of the recording file."""
+        return self._path
+
+    def record(self, conn, channel, direction, payload):
+        """Append a record of the frame payload to the buffer."""
+        self._buffer += RECORD.pack(time.monotonic_ns() - self._start, conn, channel, direction, len(payload))
+        self._buffer += payload
+        self.records += 1
+
+    @property
+    def full(self):
+        """Return whether enough is buffered that it should be flushed."""
+        return len(self._buffer) >= self._flush_size
+
+    async def flush(self):
+        """Task: run in thread the write of everything buffered so far to the file."""
+        async with self._lock:
+            chunk, self._buffer = bytes(self._buffer), bytearray()
+            if chunk:
+                await curio.run_in_thread(self._file.write, chunk)
+
+    async def close(self):
+        """Task: flush and close the file."""
+        await self.flush()
+        await curio.run_in_thread(self._file.close)
+
+
+def read_session(path):
+    """Return the [(ns, connection id, channel, direction, payload), ...] records of the recording at path."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, _ = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"'{path}' is not a curiousksp kRPC recording")
+    records, offset = [], HEADER.size
+    # a recording cut short (e.g. by a crash) may end part way through a record, ignore the partial record
+    while offset + RECORD.size <= len(data):
+        ns, conn, channel, direction, size = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + size > len(data):
+            break
+        records.append((ns, conn, channel, direction, data[offset:offset + size]))
+        offset += size
+    return records
+
+
+class RecordingProxy:
+    """Forward local RPC/stream ports to a kRPC server, recording every frame that crosses them."""
+
+    def __init__(self, path, address="127.0.0.1", rpc_port=50000, stream_port=50001, listen_address="127.0.0.1"):
+        """Initialise a new RecordingProxy recording to path, for the kRPC server at address:rpc_port/stream_port."""
+        self._path = path
+        self._upstream = {RPC: (address, rpc_port), STREAM: (address, stream_port)}
+        self._listen_address = listen_address
+        self._ports = {RPC: 0, STREAM: 0}
+        self._tasks = []
+        self._writer = None
+        self._ids = itertools.count(1)
+        # stats: connections proxied
+        self.connections = 0
+
+    @property
+    def rpc_port(self):
+        """Return the local port proxying the RPC port."""
+        return self._ports[RPC]
+
+    @property
+    def stream_port(self):
+        """Return the local port proxying the stream port."""
+        return self._ports[STREAM]
+
+    @property
+    def records(self):
+        """Return the number of frames recorded."""
+        return self._writer.records if self._writer else 0
+
+    async def _pump(self, conn, channel, direction, src, dst):
+        """Task: copy frames from src to dst, recording each, until either side closes."""
+        try:
+            while True:
+                payload = await receive_frame(src)
+                self._writer.record(conn, channel, direction, payload)
+                await send_frame(dst, payload)
+                if self._writer.full:
+                    await self._writer.flush()
+        except (EOFError, OSError):
+            pass
+
+    async def _handle(self, channel, client, addr):
+        """Task: connect a client to the server and pump the frames between them both ways."""
+        try:
+            upstream = await curio.open_connection(*self._upstream[channel])
+        except OSError as e:
+            # close the client, to it this looks like the server hanging up during the handshake
+            logger.debug(f"Recording proxy failed to connect {addr} upstream: {e!r}")
+            return
+        conn = next(self._ids)
+        self.connections += 1
+        async with upstream:
+            client_stream, upstream_stream = client.as_stream(), upstream.as_stream()
+            async with curio.TaskGroup(wait=any) as g:
+                await g.spawn(self._pump, conn, channel, TO_SERVER, client_stream, upstream_stream)
+                await g.spawn(self._pump, conn, channel, TO_CLIENT, upstream_stream, client_stream)
+
+    async def start(self):
+        """Task: open the recording, bind the local ports and spawn the (daemonic) serving Tasks."""
+        self._writer = SessionWriter(self._path)
+        for channel in (RPC, STREAM):
+            sock = tcp_server_socket(self._listen_address, 0)
+            self._ports[channel] = sock.getsockname()[1]
+            self._tasks.append(await curio.spawn(run_server, sock, partial(self._handle, channel), daemon=True))
+        logger.debug(f"Recording kRPC session to '{self._path}' [rpc_port={self.rpc_port}, "
+                     f"stream_port={self.stream_port}]")
+        return self
+
+    async def stop(self):
+        """Task: stop proxying and write out the rest of the recording."""
+        for task in self._tasks:
+            await task.cancel()
+        self._tasks.clear()
+        if self._writer:
+            await self._writer.close()
+
+
+class ReplayServer:
+    """Serve a recorded kRPC session back over the RPC/stream ports at speed x real time (0 = as fast as possible)."""
+
+    def __init__(self, path, address="127.0.0.1", rpc_port=0, stream_port=0, speed=1.0):
+        """Initialise a new ReplayServer for the recording at path (port 0 picks a free port)."""
+        self._address = address
+        self._ports = {RPC: rpc_port, STREAM: stream_port}
+        self._speed = speed
+        self._tasks = []
+        # recorded RPC connections in the order they were made, and stream connections by client identifier
+        self._rpc_sessions, self._stream_sessions = self._load(read_session(path))
+        # request bytes -> [(response bytes, latency s), ...] over every recorded RPC connection
+        self._replies = defaultdict(list)
+        for session in self._rpc_sessions:
+            for request, replies in session["replies"].items():
+                self._replies[request].extend(replies)
+        self._next_rpc_session = 0
+        # stats: connections served, requests served and requests that were not in the recording
+        self.connections, self.requests, self.misses = 0, 0, 0
+
+    @staticmethod
+    def _load(records):
+        """Return the ([RPC session, ...], {client id: stream session}) dicts of the recorded connections."""
+        sessions = {}
+        for ns, conn, channel, direction, payload in records:
+            session = sessions.setdefault(conn, {"channel": channel, "request": None, "response": None, "t0": ns,
+                                                 "pending": deque(), "replies": defaultdict(list), "updates": []})
+            if session["request"] is None:
+                session["request"] = payload
+            elif session["response"] is None:
+                session["response"], session["t0"] = payload, ns
+            elif channel == RPC and direction == TO_SERVER:
+                session["pending"].append((payload, ns))
+            elif channel == RPC and session["pending"]:
+                # responses come back in the order the requests were sent
+                request, sent = session["pending"].popleft()
+                session["replies"][request].append((payload, (ns - sent) / 1e9))
+            elif channel == STREAM and direction == TO_CLIENT:
+                session["updates"].append(((ns - session["t0"]) / 1e9, payload))
+        rpc_sessions, stream_sessions = [], {}
+        for session in sessions.values():
+            if session["response"] is None:
+                continue
+            if session["channel"] == RPC:
+                rpc_sessions.append(session)
+            else:
+                client_id = Decoder.decode_message(session["request"], KRPC.ConnectionRequest).client_identifier
+                stream_sessions[client_id] = session
+        return rpc_sessions, stream_sessions
+
+    @property
+    def rpc_port(self):
+        """Return the port the RPC server is (or will be) listening on."""
+        return self._ports[RPC]
+
+    @property
+    def stream_port(self):
+        """Return the port the stream server is (or will be) listening on."""
+        return self._ports[STREAM]
+
+    def _reply(self, session, served, request):
+        """Return the (response bytes, latency) recorded for request, the next one each time it is repeated."""
+        replies = session["replies"].get(request) or self._replies.get(request)
+        if not replies:
+            self.misses += 1
+            error = KRPC.Error(description="request not in the kRPC recording being replayed")
+            return KRPC.Response(error=error).SerializeToString(), 0.0
+        # serve the recorded responses in turn, then keep repeating the last one
+        index = served[request]
+        served[request] += 1
+        return replies[min(index, len(replies) - 1)]
+
+    async def _handle_rpc(self, client, addr):
+        """Task: replay the next recorded RPC connection to a client."""
+        stream = client.as_stream()
+        try:
+            request = await receive_frame(stream)
+            if Decoder.decode_message(request, KRPC.ConnectionRequest).type != KRPC.ConnectionRequest.RPC \
+                    or not self._rpc_sessions:
+                await send_message(stream, KRPC.ConnectionResponse(status=KRPC.ConnectionResponse.WRONG_TYPE,
+                                                                   message="no RPC connection to replay"))
+                return
+            # hand out the recorded connections in order (and their client ids), round again if more connect
+            session = self._rpc_sessions[self._next_rpc_session % len(self._rpc_sessions)]
+            self._next_rpc_session += 1
+            self.connections += 1
+            await send_frame(stream, session["response"])
+            served = defaultdict(int)
+            while True:
+                request = await receive_frame(stream)
+                self.requests += 1
+                response, latency = self._reply(session, served, request)
+                if self._speed:
+                    await curio.sleep(latency / self._speed)
+                await send_frame(stream, response)
+        except (EOFError, OSError):
+            # the client hung up (or reset the connection) mid-replay - the session is over
+            pass
+
+    async def _handle_stream(self, client, addr):
+        """Task: replay the updates of the recorded stream connection of the client identifier to a client."""
+        stream = client.as_stream()
+        try:
+            request = Decoder.decode_message(await receive_frame(stream), KRPC.ConnectionRequest)
+            session = self._stream_sessions.get(request.client_identifier)
+            if request.type != KRPC.ConnectionRequest.STREAM or session is None:
+                await send_message(stream, KRPC.ConnectionResponse(status=KRPC.ConnectionResponse.WRONG_TYPE,
+                                                                   message="no stream connection to replay"))
+                return
+            self.connections += 1
+            await send_frame(stream, session["response"])
+            start = await curio.clock()
+            for offset, update in session["updates"]:
+                if self._speed:
+                    await curio.sleep(max(0.0, start + offset / self._speed - await curio.clock()))
+                await send_frame(stream, update)
+            # the recording has run out, hold the connection open until the client closes it
+            while await stream.read():
+                pass
+        except (EOFError, OSError):
+            pass
+
+    async def start(self):
+        """Task: bind the server sockets and spawn the (daemonic) serving Tasks."""
+        for channel, handler in ((RPC, self._handle_rpc), (STREAM, self._handle_stream)):
+            sock = tcp_server_socket(self._address, self._ports[channel])
+            self._ports[channel] = sock.getsockname()[1]
+            self._tasks.append(await curio.spawn(run_server, sock, handler, daemon=True))
+        logger.info(f"Replaying {len(self._rpc_sessions)} recorded kRPC connections on {self._address} "
+                    f"[rpc_port={self.rpc_port}, stream_port={self.stream_port}, speed={self._speed}]")
+        return self
+
+    async def serve_forever(self):
+        """Task: start serving and keep serving until cancelled."""
+        await self.start()
+        try:
+            await curio.Event().wait()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        """Task: stop serving."""
+        for task in self._tasks:
+            await task.cancel()
+        self._tasks.clear()
@@ -0,0 +1,143 @@
+"""Cache the kRPC service schema (KRPC.GetServices) on disk, so connecting doesn't download and parse it every time.
+
+The schema is large with mods installed and every connection - the stock clients of the pool and the native clients
+alike - fetches it. The cache keeps the encoded KRPC.Services per server version, in files named by the version and
+the hash of the schema. Connecting then only asks the server for its (small) KRPC.Status to pick the cached schema.
+Mods can change the schema without changing the server version, so a native client fetches the schema once per
+session in the background and replaces the cached file if its hash has changed.
+"""
+import hashlib
+import os
+import re
+import time
+from glob import glob
+
+from loguru import logger
+from krpc.client import Client as KRPCClient
+from krpc.connection import Connection
+from krpc.decoder import Decoder
+from krpc.error import ConnectionError as KRPCConnectionError
+import krpc.schema.KRPC_pb2 as KRPC
+
+
+class SchemaCache:
+    """On-disk cache of the encoded KRPC.Services schema per kRPC server version."""
+
+    def __init__(self, path="curiousksp.schema", max_age=7 * 86400.0):
+        """Initialise a new SchemaCache of the files under dir path, ignoring files older than max_age seconds."""
+        self._path = path
+        self._max_age = max_age
+        # server versions whose cached schema has been checked against the server this session
+        self.validated = set()
+        # stats: schemas loaded from the cache, not found in it and stored to it
+        self.hits, self.misses, self.stores = 0, 0, 0
+
+    @property
+    def path(self):
+        """Return the dir the schema files are stored under."""
+        return self._path
+
+    @staticmethod
+    def digest(data):
+        """Return the hash of an encoded KRPC.Services."""
+        return hashlib.sha256(data).hexdigest()[:16]
+
+    def _file(self, version, digest):
+        """Return the path of the schema file of a server version and schema hash (a glob pattern for "*")."""
+        return os.path.join(self._path, f"services-{re.sub(r'[^0-9A-Za-z_.-]', '_', version)}-{digest}.pb")
+
+    def _files(self, version):
+        """Return the paths of the schema files of a server version."""
+        return glob(self._file(version, "*"))
+
+    def load(self, version):
+        """Return (KRPC.Services, hash) of the cached schema of a server version, or (None, None) if there isn't one."""
+        for path in self._files(version):
+            try:
+                if time.time() - os.path.getmtime(path) > self._max_age:
+                    continue
+                with open(path, "rb") as f:
+                    data = f.read()
+                services = Decoder.decode_message(data, KRPC.Services)
+            except Exception as e:
+                # e.g. a file cut short or removed by another process
+                logger.debug(f"Ignoring unreadable kRPC schema cache file '{path}': {e!r}")
+                continue
+            if path.endswith(f"-{self.digest(data)}.pb"):
+                self.hits += 1
+                return services, self.digest(data)
+        self.misses += 1
+        return None, None
+
+    def store(self, version, services):
+        """Cache the KRPC.Services of a server version, replacing its other files, and return the schema hash."""
+        data = services.SerializeToString()
+        digest = self.digest(data)
+        name = self._file(version, digest)
+        stale = [p for p in self._files(version) if p != name]
+        os.makedirs(self._path, exist_ok=True)
+        if os.path.exists(name):
+            # keep it from expiring, it is still the server's schema
+            os.utime(name)
+        else:
+            # write then rename, other processes connecting meanwhile never read a partial file
+            with open(f"{name}.tmp{os.getpid()}", "wb") as f:
+                f.write(data)
+            os.replace(f"{name}.tmp{os.getpid()}", name)
+            self.stores += 1
+        for path in stale:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return digest
+
+    def services(self, version, fetch):
+        """[sync] Return the KRPC.Services of a server version from the cache, else from fetch() (caching them)."""
+        services, _ = self.load(version)
+        if services is None:
+            services = fetch()
+            self.store(version, services)
+            self.validated.add(version)
+        return services
+
+
+class CachedClient(KRPCClient):
+    """krpc.client.Client that gets the service schema from a SchemaCache instead of downloading it every time."""
+
+    def __init__(self, rpc_connection, stream_connection, cache, use_pregenerated_stubs=True):
+        """Initialise a new CachedClient on connections that have completed the kRPC handshakes."""
+        self._schema_cache = cache
+        super().__init__(rpc_connection, stream_connection, use_pregenerated_stubs)
+
+    def _invoke(self, service, procedure, args, param_names, param_types, return_type):
+        """Execute an RPC - answering KRPC.GetServices from the cache for the server's version if it can."""
+        invoke = super()._invoke
+        if (service, procedure) != ("KRPC", "GetServices"):
+            return invoke(service, procedure, args, param_names, param_types, return_type)
+        version = invoke("KRPC", "GetStatus", [], [], [], self._types.status_type).version
+        return self._schema_cache.services(
+            version, lambda: invoke(service, procedure, args, param_names, param_types, return_type))
+
+
+def connect(name=None, address="127.0.0.1", rpc_port=50000, stream_port=50001, cache=None):
+    """[sync] Return a connected CachedClient - like krpc.connect, with the schema from cache (a SchemaCache)."""
+    rpc_connection = Connection(address, rpc_port)
+    rpc_connection.connect()
+    rpc_connection.send_message(KRPC.ConnectionRequest(type=KRPC.ConnectionRequest.RPC, client_name=name or ""))
+    response = rpc_connection.receive_message(KRPC.ConnectionResponse)
+    if response.status != KRPC.ConnectionResponse.OK:
+        rpc_connection.close()
+        raise KRPCConnectionError(response.message)
+    stream_connection = None
+    if stream_port is not None:
+        stream_connection = Connection(address, stream_port)
+        stream_connection.connect()
+        stream_connection.send_message(KRPC.ConnectionRequest(type=KRPC.ConnectionRequest.STREAM,
+                                                              client_identifier=response.client_identifier))
+        response = stream_connection.receive_message(KRPC.ConnectionResponse)
+        if response.status != KRPC.ConnectionResponse.OK:
+            rpc_connection.close()
+            stream_connection.close()
+            raise KRPCConnectionError(response.message)
+    return CachedClient(rpc_connection, stream_connection, cache or SchemaCache())
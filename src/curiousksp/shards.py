@@ -0,0 +1,284 @@
+"""Shard the vessels across worker processes - each with a curio kernel and kRPC connection of its own.
+
+One kernel on one core runs every vessel's jobs, so a fleet of vessels with busy control loops is bounded by that
+core (and the GIL). A ShardSupervisor starts workers processes instead, assigns each vessel to one of them by id and
+forwards commands for a vessel to the VesselManager its worker runs for it. Messages are pickled over a pipe per
+worker as (kind, payload) tuples:
+
+    supervisor -> worker: ("assign", [vessel, ...]), ("release", [vessel, ...]),
+                          ("command", (command id, vessel, func, args, priority)), ("stop", None)
+    worker -> supervisor: ("ready", pid), ("telemetry", (vessel, key, value)), ("result", (command id, ok, value))
+
+A worker that crashes (or whose kRPC connection fails) is restarted and reassigned its vessels, the commands it had in
+flight fail. Command functions are called as func(manager, *args) like VesselManager jobs (manager.vessel being the
+SpaceCenter.Vessel of the id) and, as they are pickled, must be importable module level functions.
+"""
+import itertools
+import multiprocessing
+import os
+import pickle
+
+from loguru import logger
+import curio
+from curio.channel import Connection
+
+from . import asynkrpc
+from .tasks.vessel import NORMAL, VesselManager
+
+
+def shard_of(vessel, shards):
+    """Return the index of the shard (of shards) that vessel (a kRPC object id) is assigned to."""
+    return vessel % shards
+
+
+def _worker_main(index, pipe, name, address, rpc_port):
+    """[sync] Entry point of a worker process: serve the vessels of shard index in a kernel of its own until stopped."""
+    curio.run(_serve_shard, index, pipe, name, address, rpc_port)
+
+
+async def _serve_shard(index, pipe, name, address, rpc_port):
+    """Task: connect to kRPC, then run the commands for the shard's vessels that arrive on pipe until told to stop."""
+    channel = Connection.from_Connection(pipe)
+    # a message can be written in two parts, don't let the Tasks of two commands interleave theirs
+    lock = curio.Lock()
+
+    async def send(kind, payload):
+        async with lock:
+            await channel.send((kind, payload))
+
+    async def publish(vessel, key, value):
+        await send("telemetry", (vessel._object_id, key, value))
+
+    async def command(command_id, manager, func, args, priority):
+        try:
+            value, ok = await manager.run(func, *args, priority=priority), True
+        except Exception as e:
+            value, ok = e, False
+        try:
+            pickle.dumps(value)
+        except Exception as e:
+            value, ok = RuntimeError(f"unpicklable result of {func.__name__}: {e!r}"), False
+        await send("result", (command_id, ok, value))
+
+    client = await asynkrpc.connect(f"{name}-shard{index}", address=address, rpc_port=rpc_port)
+    managers = {}
+    try:
+        await send("ready", os.getpid())
+        async with curio.TaskGroup() as g:
+            while True:
+                kind, payload = await channel.recv()
+                if kind == "assign":
+                    for vessel in payload:
+                        if vessel not in managers:
+                            remote = client.remote_object("SpaceCenter", "Vessel", vessel)
+                            managers[vessel] = VesselManager(client, remote, name=f"vessel-{vessel}",
+                                                             publish=publish)
+                elif kind == "release":
+                    for vessel in payload:
+                        if (manager := managers.pop(vessel, None)) is not None:
+                            await manager.close()
+                elif kind == "command":
+                    command_id, vessel, func, args, priority = payload
+                    if (manager := managers.get(vessel)) is None:
+                        await send("result", (command_id, False, KeyError(f"vessel {vessel} is not in this shard")))
+                    else:
+                        await g.spawn(command, command_id, manager, func, args, priority)
+                elif kind == "stop":
+                    break
+            for manager in managers.values():
+                await manager.close()
+    finally:
+        await client.close()
+        await channel.close()
+
+
+class Shard:
+    """The supervisor's side of one worker process: its vessels, pipe and the commands awaiting results."""
+
+    def __init__(self, index):
+        """Initialise a new Shard, not running a worker yet."""
+        self.index = index
+        self.vessels = set()
+        self.process = None
+        self.channel = None
+        # set once the worker has connected to kRPC, cleared while it is (re)starting
+        self.ready = curio.Event()
+        # command id -> curio.Result
+        self.pending = {}
+        self._lock = curio.Lock()
+        # stats: times the worker was restarted
+        self.restarts = 0
+
+    @property
+    def pid(self):
+        """Return the pid of the worker process, or None."""
+        return self.process.pid if self.process else None
+
+    async def send(self, kind, payload):
+        """Task: send a message to the worker."""
+        async with self._lock:
+            await self.channel.send((kind, payload))
+
+    def __repr__(self):
+        return f"<Shard {self.index} pid={self.pid} vessels={len(self.vessels)} restarts={self.restarts}>"
+
+
+class ShardSupervisor:
+    """Start, feed and restart a pool of worker processes that each run the VesselManagers of a shard of vessels."""
+
+    def __init__(self, workers=None, name="curious", address="127.0.0.1", rpc_port=50000, restart_delay=1.0,
+                 max_restarts=5, maxsize=1024):
+        """Initialise a new ShardSupervisor of workers processes (default one per CPU core).
+
+        A worker that crashes more than max_restarts times is given up on, telemetry updates are dropped once maxsize
+        are waiting to be taken from .updates.
+        """
+        self._workers = workers or os.cpu_count() or 1
+        self._name = name
+        self._address = address
+        self._rpc_port = rpc_port
+        self._restart_delay = restart_delay
+        self._max_restarts = max_restarts
+        # workers are started fresh rather than forked from a process running a kernel and threads
+        self._context = multiprocessing.get_context("spawn")
+        self._shards = [Shard(i) for i in range(self._workers)]
+        self._tasks = []
+        self._ids = itertools.count(1)
+        self._stopping = False
+        # (vessel, key, value) telemetry published by the workers' jobs
+        self.updates = curio.Queue(maxsize=maxsize)
+        # stats: worker restarts, results received, telemetry updates received and dropped
+        self.restarts, self.results, self.received, self.dropped = 0, 0, 0, 0
+
+    @property
+    def shards(self):
+        """Return the Shards."""
+        return list(self._shards)
+
+    def shard(self, vessel):
+        """Return the Shard that vessel is assigned to."""
+        return self._shards[shard_of(vessel, self._workers)]
+
+    async def start(self):
+        """Task: spawn a (daemonic) Task per worker process that starts it and restarts it if it dies."""
+        self._stopping = False
+        self._tasks = [await curio.spawn(self._supervise, shard, daemon=True) for shard in self._shards]
+        return self
+
+    async def wait_ready(self):
+        """Task: wait until every worker has connected to kRPC."""
+        for shard in self._shards:
+            await shard.ready.wait()
+
+    def _start_worker(self, shard):
+        """[sync] Start the worker process of shard and return the supervisor's end of its pipe."""
+        parent, child = self._context.Pipe()
+        shard.process = self._context.Process(target=_worker_main, name=f"{self._name}-shard{shard.index}",
+                                              args=(shard.index, child, self._name, self._address, self._rpc_port),
+                                              daemon=True)
+        shard.process.start()
+        child.close()
+        return parent
+
+    async def _supervise(self, shard):
+        """Task (daemonic): run the worker of shard, restarting it (after restart_delay) whenever it dies."""
+        while True:
+            shard.channel = Connection.from_Connection(await curio.run_in_thread(self._start_worker, shard))
+            try:
+                await self._receive(shard)
+            except (EOFError, OSError):
+                pass
+            finally:
+                shard.ready.clear()
+                await shard.channel.close()
+                for result in shard.pending.values():
+                    await result.set_exception(RuntimeError(f"worker of shard {shard.index} exited"))
+                shard.pending.clear()
+            await curio.run_in_thread(shard.process.join)
+            if self._stopping:
+                return
+            shard.restarts += 1
+            self.restarts += 1
+            logger.error(f"Worker of shard {shard.index} exited [exitcode={shard.process.exitcode}, "
+                         f"restarts={shard.restarts}]")
+            if shard.restarts > self._max_restarts:
+                logger.critical(f"Giving up on the worker of shard {shard.index} - {len(shard.vessels)} vessels "
+                                f"are unmanaged")
+                return
+            await curio.sleep(self._restart_delay)
+
+    async def _receive(self, shard):
+        """Task: handle the messages from the worker of shard until its pipe closes."""
+        while True:
+            kind, payload = await shard.channel.recv()
+            if kind == "telemetry":
+                self.received += 1
+                if self.updates.full():
+                    self.dropped += 1
+                else:
+                    await self.updates.put(payload)
+            elif kind == "result":
+                command_id, ok, value = payload
+                self.results += 1
+                if (result := shard.pending.pop(command_id, None)) is not None:
+                    await (result.set_value(value) if ok else result.set_exception(value))
+            elif kind == "ready":
+                # (re)assign every vessel the shard has by now
+                await shard.send("assign", sorted(shard.vessels))
+                logger.debug(f"Worker of shard {shard.index} ready [pid={payload}, vessels={len(shard.vessels)}]")
+                await shard.ready.set()
+
+    async def assign(self, *vessels):
+        """Task: assign vessels to their shards, whose workers start a VesselManager for each."""
+        for shard in self._shards:
+            if new := [v for v in vessels if self.shard(v) is shard and v not in shard.vessels]:
+                shard.vessels.update(new)
+                if shard.ready.is_set():
+                    await shard.send("assign", new)
+
+    async def release(self, *vessels):
+        """Task: unassign vessels, whose VesselManagers are closed."""
+        for shard in self._shards:
+            if gone := [v for v in vessels if v in shard.vessels]:
+                shard.vessels.difference_update(gone)
+                if shard.ready.is_set():
+                    await shard.send("release", gone)
+
+    async def command(self, vessel, func, *args, priority=NORMAL):
+        """Task: run func(manager, *args) on the VesselManager of vessel in its worker and return its value."""
+        shard = self.shard(vessel)
+        if vessel not in shard.vessels:
+            raise KeyError(f"vessel {vessel} is not assigned")
+        await shard.ready.wait()
+        command_id = next(self._ids)
+        try:
+            result = shard.pending[command_id] = curio.Result()
+            await shard.send("command", (command_id, vessel, func, args, priority))
+            return await result.unwrap()
+        finally:
+            # answered, or the send failed or the caller was cancelled - no one is waiting for the result any more
+            shard.pending.pop(command_id, None)
+
+    async def stop(self, timeout=5.0):
+        """Task: tell the workers to stop, terminating those that haven't within timeout seconds."""
+        self._stopping = True
+        for shard in self._shards:
+            if shard.ready.is_set():
+                try:
+                    await shard.send("stop", None)
+                except OSError:
+                    pass
+        async with curio.ignore_after(timeout):
+            for task in self._tasks:
+                await task.wait()
+        for task in self._tasks:
+            await task.cancel()
+        for shard in self._shards:
+            if shard.process and shard.process.is_alive():
+                logger.warning(f"Terminating the worker of shard {shard.index} [pid={shard.pid}]")
+                shard.process.terminate()
+                await curio.run_in_thread(shard.process.join)
+        self._tasks = []
+
+    def __repr__(self):
+        return f"<ShardSupervisor '{self._name}' workers={self._workers} restarts={self.restarts}>"
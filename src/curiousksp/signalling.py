@@ -1,16 +1,62 @@
 # import some stuff
 import signal
+import sys
+import threading
+import time
 
 from loguru import logger
 import curio
 
+CONFIRM_PROMPT = "Ctrl-C! Confirm to end all missions and shutdown mission control? Y/N: "
+
+
+class ConsoleReader:
+    """Reads lines of a (blocking) text stream in a daemon thread, for Tasks to await without blocking the kernel."""
+
+    def __init__(self, stream=None):
+        """Initialise a new ConsoleReader of stream (default sys.stdin), the thread starts with start/readline."""
+        self._stream = stream
+        # (monotonic time read, line) of the lines read, (time, None) once the stream has ended
+        self._lines = curio.UniversalQueue()
+        self._thread = None
+        self._ended = False
+
+    def _read(self):
+        """[sync] Put each line read from the stream on the queue, then None once it ends."""
+        for line in iter((self._stream or sys.stdin).readline, ""):
+            self._lines.put((time.monotonic(), line.rstrip("\n")))
+        self._lines.put((time.monotonic(), None))
+
+    def start(self):
+        """Start reading lines in the daemon thread (if it isn't already)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._read, name="console-reader", daemon=True)
+            self._thread.start()
+
+    async def readline(self, prompt=""):
+        """Task: write prompt to stdout and return the next line entered (without the newline), or None at the end."""
+        self.start()
+        asked = time.monotonic()
+        print(prompt, end="", flush=True)
+        while not self._ended:
+            read, line = await self._lines.get()
+            self._ended = line is None
+            # drop the lines typed before the prompt, they weren't answers to it
+            if read >= asked or self._ended:
+                return line
+        return None
+
 
 class SignalHandler:
     """Handles signals for MissionControl."""
-    def __init__(self, shutdown_task, shutdown_mode="ask"):
+    def __init__(self, shutdown_task, shutdown_mode="ask", confirm_timeout=30.0, console=None):
         # setup the shutdown mode, one of "now" | "ask" (default) | "ask soft"
         self._shutdown_task = shutdown_task
         self._shutdown_mode = shutdown_mode
+        # seconds to wait for a confirmation before declining the shutdown (None to wait forever)
+        self._confirm_timeout = confirm_timeout
+        # the prompt is answered on the console through a reader thread, so every other Task keeps running meanwhile
+        self._console = console or ConsoleReader()
 
         # setup a signal so that we can catch KeyboardInterrupt/Ctrl-C and handle them async
         self._sigint_event = curio.UniversalEvent()
@@ -21,9 +67,32 @@ class SignalHandler:
         if not self._sigint_event.is_set():
             self._sigint_event.set()
 
+    async def _ask(self):
+        """Task: prompt for confirmation, return "yes"/"no", "interrupt" for another Ctrl-C or "eof" without stdin."""
+        async with curio.TaskGroup(wait=any) as g:
+            reader = await g.spawn(self._console.readline, CONFIRM_PROMPT)
+            await g.spawn(self._sigint_event.wait)
+        if g.completed is not reader:
+            self._sigint_event.clear()
+            # end the unanswered prompt line
+            print()
+            return "interrupt"
+        if reader.result is None:
+            return "eof"
+        return "yes" if reader.result.strip().lower() in ["y", "ye", "yes"] else "no"
+
+    async def confirm(self):
+        """Task: ask to confirm the shutdown without blocking the kernel - _ask's answer or "timeout" if none came."""
+        if self._confirm_timeout is None:
+            return await self._ask()
+        return await curio.ignore_after(self._confirm_timeout, self._ask) or "timeout"
+
     async def sigint(self):
-        """Task (daemonic): wait for sigint/Ctrl-C, [block] confirm quit, resume on declined or await shutdown."""
+        """Task (daemonic): wait for sigint/Ctrl-C, confirm quit, resume on declined or await shutdown."""
         try:
+            # read the console from now on, so that lines typed before a prompt aren't taken as answers to it
+            if self._shutdown_mode.startswith("ask"):
+                self._console.start()
             while True:
                 await self._sigint_event.wait()
                 self._sigint_event.clear()
@@ -31,23 +100,20 @@ class SignalHandler:
                     # signal shutdown as soon as this task picks up the sigint_event it was waiting on
                     await self._shutdown_task()
                 elif self._shutdown_mode.startswith("ask"):
-                    try:
-                        # TODO: this really needs to use some form of async console.readline so it doesn't block :/
-                        # atm, this works like a pause while awaiting confirmation or declination to shutdown
-                        # because input blocks the Task and thus the curio.Kernel
-                        response = input("Ctrl-C! Confirm to end all missions and shutdown mission control? Y/N: ")
-                        if response.lower() in ["y", "ye", "yes"]:
-                            await self._shutdown_task()
-                        else:
-                            logger.info("Shutdown declined...")
-                    except EOFError as e:
-                        # occurs at Ctrl-C/KeyboardInterrupt triggered when the input prompt is open
-                        if self._shutdown_mode == "ask soft":
-                            # shutdown for the second Ctrl-C that has triggered
-                            await self._shutdown_task()
-                        else:
-                            # ignore the sigint - requiring hard confirmation from user to quit
-                            logger.error("Response required, none was given :(")
+                    # the other Tasks keep being scheduled while awaiting confirmation or declination to shutdown
+                    response = await self.confirm()
+                    if response == "yes":
+                        await self._shutdown_task()
+                    elif response == "no":
+                        logger.info("Shutdown declined...")
+                    elif response == "timeout":
+                        logger.warning(f"No response within {self._confirm_timeout}s - shutdown declined...")
+                    elif self._shutdown_mode == "ask soft":
+                        # shutdown for the second Ctrl-C that has triggered while the prompt was open (or no stdin)
+                        await self._shutdown_task()
+                    else:
+                        # ignore the sigint - requiring hard confirmation from user to quit
+                        logger.error("Response required, none was given :(")
                 else:
                     raise ValueError(f"MissionControl._shutdown_mode must be 'now'|'ask'|'ask soft'")
         except curio.CancelledError as e:
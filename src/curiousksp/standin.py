@@ -0,0 +1,370 @@
+"""Define a lightweight stand-in kRPC server so that clients can be exercised without a running KSP.
+
+It serves the kRPC handshake on an RPC and a stream port, the KRPC service procedures that clients need
+(GetStatus/GetServices/GetClientID and the stream procedures) and whatever procedures are added to it - e.g. the
+SpaceCenter subset of add_space_center. Every call can be delayed by an injected latency to mimic a busy game.
+"""
+import math
+import time
+import uuid
+
+from loguru import logger
+import curio
+from curio.network import run_server, tcp_server_socket
+from krpc.decoder import Decoder
+from krpc.encoder import Encoder
+from krpc.types import Types
+import krpc.schema.KRPC_pb2 as KRPC
+
+from .asynkrpc import receive_message, send_message
+
+_types = Types()
+_vessel = _types.class_type("SpaceCenter", "Vessel")
+_part = _types.class_type("SpaceCenter", "Part")
+_parts = _types.class_type("SpaceCenter", "Parts")
+_module = _types.class_type("SpaceCenter", "Module")
+_resources = _types.class_type("SpaceCenter", "Resources")
+_control = _types.class_type("SpaceCenter", "Control")
+_orbit = _types.class_type("SpaceCenter", "Orbit")
+_body = _types.class_type("SpaceCenter", "CelestialBody")
+_frame = _types.class_type("SpaceCenter", "ReferenceFrame")
+_vector = _types.tuple_type(_types.double_type, _types.double_type, _types.double_type)
+
+
+def _part_of(sc, p, key):
+    return sc["parts"][p][key]
+
+
+def _activate_next_stage(sc, control):
+    """Stage the vessel of control: the parts that decouple at the new stage are gone (as if their own vessel)."""
+    vessel = sc["vessels"][control]
+    vessel["stage"] -= 1
+    for p in [p for p, part in sc["parts"].items() if part["vessel"] == control
+              and part["decouple_stage"] >= vessel["stage"]]:
+        del sc["parts"][p]
+    return []
+
+
+def _orbit_of(sc, o, key):
+    return sc["orbits"][o][key]
+
+
+def _position_at(sc, o, ut, frame):
+    """Return the position of orbit o at ut, one Kepler equation solved by Newton's method at a time.
+
+    Positions are in the orbited body's non-rotating frame (x/z equatorial, y the rotation axis) - the only frame
+    the stand-in has for an orbit.
+    """
+    orbit = sc["orbits"][o]
+    if frame != orbit["body"]:
+        raise ValueError(f"Orbit {o} only has positions relative to body {orbit['body']}")
+    a, e, mu = orbit["a"], orbit["e"], sc["bodies"][orbit["body"]]["mu"]
+    m = orbit["m0"] + math.sqrt(mu / abs(a) ** 3) * (ut - orbit["epoch"])
+    if e < 1:
+        anomaly = m if e < 0.8 else math.pi
+        for _ in range(100):
+            anomaly -= (anomaly - e * math.sin(anomaly) - m) / (1 - e * math.cos(anomaly))
+        x, y = a * (math.cos(anomaly) - e), a * math.sqrt(1 - e * e) * math.sin(anomaly)
+    else:
+        anomaly = math.asinh(m / e)
+        for _ in range(100):
+            anomaly -= (e * math.sinh(anomaly) - anomaly - m) / (e * math.cosh(anomaly) - 1)
+        x, y = -a * (e - math.cosh(anomaly)), -a * math.sqrt(e * e - 1) * math.sinh(anomaly)
+    # rotate by the argument of periapsis, inclination and longitude of the ascending node
+    w, i, lan = orbit["argp"], orbit["inc"], orbit["lan"]
+    x, y = x * math.cos(w) - y * math.sin(w), x * math.sin(w) + y * math.cos(w)
+    y, z = y * math.cos(i), y * math.sin(i)
+    x, y = x * math.cos(lan) - y * math.sin(lan), x * math.sin(lan) + y * math.cos(lan)
+    return x, z, y
+
+
+def _speed_at(sc, o, ut):
+    """Return the orbital speed of orbit o at ut by the vis-viva equation."""
+    orbit = sc["orbits"][o]
+    mu = sc["bodies"][orbit["body"]]["mu"]
+    return math.sqrt(mu * (2 / math.hypot(*_position_at(sc, o, ut, orbit["body"])) - 1 / orbit["a"]))
+
+
+# SpaceCenter procedure -> ([param TypeBase, ...], return TypeBase, handler(state, *args)) served by add_space_center
+SPACE_CENTER = {
+    "get_UT": ([], _types.double_type, lambda sc: sc["ut"] + time.monotonic() - sc["t0"]),
+    "get_ActiveVessel": ([], _vessel, lambda sc: sc["active_vessel"]),
+    "get_Vessels": ([], _types.list_type(_vessel), lambda sc: list(sc["vessels"])),
+    "get_Funds": ([], _types.double_type, lambda sc: sc["funds"]),
+    "get_Science": ([], _types.float_type, lambda sc: sc["science"]),
+    "get_Reputation": ([], _types.float_type, lambda sc: sc["reputation"]),
+    "Vessel_get_Name": ([_vessel], _types.string_type, lambda sc, v: sc["vessels"][v]["name"]),
+    "Vessel_get_MET": ([_vessel], _types.double_type, lambda sc, v: time.monotonic() - sc["t0"]),
+    "Vessel_get_Mass": ([_vessel], _types.float_type, lambda sc, v: sc["vessels"][v]["mass"]),
+    "Vessel_get_Thrust": ([_vessel], _types.float_type, lambda sc, v: sc["vessels"][v]["thrust"]),
+    # Parts/Resources/Control objects have their vessel's/part's object id
+    "Vessel_get_Parts": ([_vessel], _parts, lambda sc, v: v),
+    "Vessel_get_Control": ([_vessel], _control, lambda sc, v: v),
+    "Parts_get_All": ([_parts], _types.list_type(_part),
+                      lambda sc, v: [p for p, part in sc["parts"].items() if part["vessel"] == v]),
+    "Part_get_Title": ([_part], _types.string_type, lambda sc, p: _part_of(sc, p, "title")),
+    "Part_get_Name": ([_part], _types.string_type, lambda sc, p: _part_of(sc, p, "name")),
+    "Part_get_Tag": ([_part], _types.string_type, lambda sc, p: _part_of(sc, p, "tag")),
+    "Part_get_Stage": ([_part], _types.sint32_type, lambda sc, p: _part_of(sc, p, "stage")),
+    "Part_get_DecoupleStage": ([_part], _types.sint32_type, lambda sc, p: _part_of(sc, p, "decouple_stage")),
+    "Part_get_Parent": ([_part], _part, lambda sc, p: _part_of(sc, p, "parent")),
+    "Part_get_Modules": ([_part], _types.list_type(_module), lambda sc, p: _part_of(sc, p, "modules")),
+    "Part_get_Resources": ([_part], _resources, lambda sc, p: p),
+    "Module_get_Name": ([_module], _types.string_type, lambda sc, m: sc["modules"][m]),
+    "Resources_get_Names": ([_resources], _types.list_type(_types.string_type),
+                            lambda sc, p: _part_of(sc, p, "resources")),
+    "Control_get_CurrentStage": ([_control], _types.sint32_type, lambda sc, v: sc["vessels"][v]["stage"]),
+    "Control_ActivateNextStage": ([_control], _types.list_type(_vessel), _activate_next_stage),
+    "Vessel_get_Orbit": ([_vessel], _orbit, lambda sc, v: sc["vessels"][v]["orbit"]),
+    # a body's non-rotating ReferenceFrame has the body's object id
+    "CelestialBody_get_Name": ([_body], _types.string_type, lambda sc, b: sc["bodies"][b]["name"]),
+    "CelestialBody_get_GravitationalParameter": ([_body], _types.float_type, lambda sc, b: sc["bodies"][b]["mu"]),
+    "CelestialBody_get_Orbit": ([_body], _orbit, lambda sc, b: sc["bodies"][b]["orbit"]),
+    "CelestialBody_get_NonRotatingReferenceFrame": ([_body], _frame, lambda sc, b: b),
+    "Orbit_get_Body": ([_orbit], _body, lambda sc, o: _orbit_of(sc, o, "body")),
+    "Orbit_get_SemiMajorAxis": ([_orbit], _types.double_type, lambda sc, o: _orbit_of(sc, o, "a")),
+    "Orbit_get_Eccentricity": ([_orbit], _types.double_type, lambda sc, o: _orbit_of(sc, o, "e")),
+    "Orbit_get_Inclination": ([_orbit], _types.double_type, lambda sc, o: _orbit_of(sc, o, "inc")),
+    "Orbit_get_LongitudeOfAscendingNode": ([_orbit], _types.double_type, lambda sc, o: _orbit_of(sc, o, "lan")),
+    "Orbit_get_ArgumentOfPeriapsis": ([_orbit], _types.double_type, lambda sc, o: _orbit_of(sc, o, "argp")),
+    "Orbit_get_MeanAnomalyAtEpoch": ([_orbit], _types.double_type, lambda sc, o: _orbit_of(sc, o, "m0")),
+    "Orbit_get_Epoch": ([_orbit], _types.double_type, lambda sc, o: _orbit_of(sc, o, "epoch")),
+    "Orbit_PositionAt": ([_orbit, _types.double_type, _frame], _vector, _position_at),
+    "Orbit_OrbitalSpeedAt": ([_orbit, _types.double_type], _types.double_type, _speed_at),
+}
+
+
+class StandInServer:
+    """Scriptable stand-in for the kRPC server: handshakes, the KRPC service, streams and added procedures."""
+
+    types = _types
+
+    def __init__(self, address="127.0.0.1", port=0, stream_port=0, latency=0.0, stream_interval=0.02):
+        """Initialise a new StandInServer (port 0 picks a free port, see .port/.stream_port once started).
+
+        latency (seconds, or a callable returning seconds e.g. for jitter) delays every call that has no latency of
+        its own, stream_interval is how often streams with rate 0 are pushed (like the game's physics frames).
+        """
+        self._address = address
+        self._port = port
+        self._stream_port = stream_port
+        self.latency = latency
+        self.stream_interval = stream_interval
+        self._tasks = []
+        # (service, procedure) -> (handler, [param TypeBase, ...], return TypeBase or None, latency or None, client)
+        self._procedures = {}
+        self._services = {}
+        self._status = KRPC.Status(version="standin")
+        # identifiers of the connected clients, a stream connection must be for one of them
+        self._client_ids = set()
+        # stream id -> {"client": id, "call": ProcedureCall, "rate": Hz, "started": bool}
+        self._streams = {}
+        self._next_stream_id = 1
+        # SpaceCenter state served by add_space_center - tests/benchmarks may modify it
+        self.space_center = {"ut": 0.0, "t0": time.monotonic(), "active_vessel": 1, "funds": 25000.0,
+                             "science": 0.0, "reputation": 0.0,
+                             "vessels": {1: {"name": "Untitled Space Craft", "mass": 5000.0, "thrust": 0.0,
+                                             "stage": 1, "orbit": 1}},
+                             # part id -> {"vessel", "title", "name", "tag", "stage", "decouple_stage", "parent" (0 for
+                             # the root part), "modules": [module id, ...], "resources": [name, ...]}
+                             "parts": {}, "modules": {},
+                             # body id -> {"name", "mu" (gravitational parameter), "orbit" (orbit id, 0 for none)}
+                             "bodies": {1: {"name": "Kerbin", "mu": 3.5316e12, "orbit": 0}},
+                             # orbit id -> {"body", "a", "e", "inc", "lan", "argp", "m0", "epoch"} (m, rad, s)
+                             "orbits": {1: {"body": 1, "a": 700000.0, "e": 0.0, "inc": 0.0, "lan": 0.0, "argp": 0.0,
+                                            "m0": 0.0, "epoch": 0.0}}}
+        # stats: connections accepted, requests/calls served and stream updates pushed
+        self.connections, self.requests, self.calls, self.updates = 0, 0, 0, 0
+        self.add_procedure("KRPC", "GetStatus", self._get_status, return_type=self.types.status_type)
+        self.add_procedure("KRPC", "GetServices", self._get_services, return_type=self.types.services_type)
+        self.add_procedure("KRPC", "GetClientID", lambda client_id: client_id, return_type=self.types.bytes_type,
+                           client=True)
+        uint64 = self.types.uint64_type
+        self.add_procedure("KRPC", "AddStream", self._add_stream,
+                           params=[self.types.procedure_call_type, self.types.bool_type],
+                           return_type=self.types.stream_type, client=True)
+        self.add_procedure("KRPC", "StartStream", self._start_stream, params=[uint64])
+        self.add_procedure("KRPC", "SetStreamRate", self._set_stream_rate, params=[uint64, self.types.float_type])
+        self.add_procedure("KRPC", "RemoveStream", self._remove_stream, params=[uint64])
+
+    @property
+    def port(self):
+        """Return the RPC port the server is (or will be) listening on."""
+        return self._port
+
+    @property
+    def stream_port(self):
+        """Return the stream port the server is (or will be) listening on."""
+        return self._stream_port
+
+    @property
+    def status(self):
+        """Return the KRPC.Status message served by KRPC.GetStatus - tests may modify it."""
+        return self._status
+
+    def add_procedure(self, service, procedure, handler, params=(), return_type=None, latency=None, client=False):
+        """Serve service.procedure by calling handler(*args) (which may be async), params/return_type TypeBase`s.
+
+        latency (seconds, or a callable returning seconds) overrides the server's latency for this procedure. If client
+        is true the identifier of the calling client is passed to handler before the call's arguments.
+        """
+        self._procedures[(service, procedure)] = (handler, list(params), return_type, latency, client)
+        svc = self._services.setdefault(service, KRPC.Service(name=service))
+        proc = svc.procedures.add(name=procedure)
+        for i, typ in enumerate(params):
+            proc.parameters.add(name=f"arg{i}", type=typ.protobuf_type)
+        if return_type is not None:
+            proc.return_type.CopyFrom(return_type.protobuf_type)
+        else:
+            proc.return_type.code = KRPC.Type.NONE
+
+    def add_space_center(self, procedures=None, latency=None):
+        """Serve the SpaceCenter procedures (all of SPACE_CENTER, or the named ones) from self.space_center."""
+        for name in procedures or SPACE_CENTER:
+            params, return_type, handler = SPACE_CENTER[name]
+            self.add_procedure("SpaceCenter", name, lambda *args, h=handler: h(self.space_center, *args),
+                               params=params, return_type=return_type, latency=latency)
+        return self
+
+    def _get_status(self):
+        self._status.rpcs_executed = self.calls
+        self._status.stream_rpcs = len(self._streams)
+        return self._status
+
+    def _get_services(self):
+        return KRPC.Services(services=self._services.values())
+
+    def _add_stream(self, client_id, call, start):
+        # like kRPC, a client adding the same call again gets the same stream
+        for stream_id, stream in self._streams.items():
+            if stream["client"] == client_id and stream["call"] == call:
+                break
+        else:
+            stream_id, self._next_stream_id = self._next_stream_id, self._next_stream_id + 1
+            self._streams[stream_id] = {"client": client_id, "call": call, "rate": 0.0, "started": False}
+        self._streams[stream_id]["started"] |= start
+        return KRPC.Stream(id=stream_id)
+
+    def _start_stream(self, stream_id):
+        self._streams[stream_id]["started"] = True
+
+    def _set_stream_rate(self, stream_id, rate):
+        self._streams[stream_id]["rate"] = rate
+
+    def _remove_stream(self, stream_id):
+        self._streams.pop(stream_id, None)
+
+    @staticmethod
+    def _wire_type(typ):
+        """Return the TypeBase to decode/encode typ as - class instances are handled as their uint64 object ids."""
+        return _types.uint64_type if typ is not None and typ.protobuf_type.code == KRPC.Type.CLASS else typ
+
+    async def _call(self, call, client_id):
+        """Task: run one KRPC.ProcedureCall of client client_id against its handler and return the KRPC.ProcedureResult.
+
+        The client is passed along rather than kept on the server - other clients' calls run while this one sleeps.
+        """
+        self.calls += 1
+        result = KRPC.ProcedureResult()
+        try:
+            handler, params, return_type, latency, client = self._procedures[(call.service, call.procedure)]
+        except KeyError:
+            result.error.CopyFrom(KRPC.Error(description=f"Procedure not found: {call.service}.{call.procedure}"))
+            return result
+        latency = self.latency if latency is None else latency
+        if callable(latency):
+            latency = latency()
+        if latency:
+            await curio.sleep(latency)
+        try:
+            args = [None] * len(params)
+            for arg in call.arguments:
+                args[arg.position] = Decoder.decode(None, arg.value, self._wire_type(params[arg.position]))
+            value = handler(client_id, *args) if client else handler(*args)
+            if hasattr(value, "__await__"):
+                value = await value
+            if return_type is not None:
+                if return_type.protobuf_type.code == KRPC.Type.LIST:
+                    return_type = self.types.list_type(self._wire_type(return_type.value_type))
+                result.value = Encoder.encode(value, self._wire_type(return_type))
+        except Exception as e:
+            result.error.CopyFrom(KRPC.Error(service=call.service, name=type(e).__name__, description=str(e)))
+        return result
+
+    async def _handle(self, client, addr):
+        """Task: serve one RPC client connection - the handshake and then each Request in turn."""
+        stream = client.as_stream()
+        try:
+            request = await receive_message(stream, KRPC.ConnectionRequest)
+            if request.type != KRPC.ConnectionRequest.RPC:
+                await send_message(stream, KRPC.ConnectionResponse(status=KRPC.ConnectionResponse.WRONG_TYPE,
+                                                                   message="expected an RPC connection"))
+                return
+            self.connections += 1
+            client_id = uuid.uuid4().bytes
+            self._client_ids.add(client_id)
+            await send_message(stream, KRPC.ConnectionResponse(status=KRPC.ConnectionResponse.OK,
+                                                               client_identifier=client_id))
+            while True:
+                request = await receive_message(stream, KRPC.Request)
+                self.requests += 1
+                response = KRPC.Response()
+                for call in request.calls:
+                    response.results.append(await self._call(call, client_id))
+                await send_message(stream, response)
+        except EOFError:
+            pass
+        except curio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"Stand-in kRPC server dropped client {addr}: {e!r}")
+
+    async def _handle_stream(self, client, addr):
+        """Task: serve one stream connection - the handshake and then pushing the client's started streams."""
+        stream = client.as_stream()
+        try:
+            request = await receive_message(stream, KRPC.ConnectionRequest)
+            if request.type != KRPC.ConnectionRequest.STREAM or request.client_identifier not in self._client_ids:
+                await send_message(stream, KRPC.ConnectionResponse(status=KRPC.ConnectionResponse.WRONG_TYPE,
+                                                                   message="expected a stream connection of a client"))
+                return
+            client_id = request.client_identifier
+            await send_message(stream, KRPC.ConnectionResponse(status=KRPC.ConnectionResponse.OK))
+            # stream id -> when it is next due to be pushed
+            due = {}
+            while True:
+                now = await curio.clock()
+                update = KRPC.StreamUpdate()
+                for stream_id, s in list(self._streams.items()):
+                    if s["client"] != client_id or not s["started"] or due.get(stream_id, now) > now:
+                        continue
+                    due[stream_id] = now + (1 / s["rate"] if s["rate"] else self.stream_interval)
+                    update.results.add(id=stream_id, result=await self._call(s["call"], client_id))
+                if update.results:
+                    self.updates += 1
+                    await send_message(stream, update)
+                await curio.sleep(max(0.0, min(due.values(), default=now + self.stream_interval)
+                                      - await curio.clock()))
+        except (EOFError, OSError):
+            pass
+        except curio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"Stand-in kRPC server dropped stream client {addr}: {e!r}")
+
+    async def start(self):
+        """Task: bind the server sockets and spawn the (daemonic) serving Tasks."""
+        sock = tcp_server_socket(self._address, self._port)
+        self._port = sock.getsockname()[1]
+        stream_sock = tcp_server_socket(self._address, self._stream_port)
+        self._stream_port = stream_sock.getsockname()[1]
+        self._tasks = [await curio.spawn(run_server, sock, self._handle, daemon=True),
+                       await curio.spawn(run_server, stream_sock, self._handle_stream, daemon=True)]
+        logger.debug(f"Stand-in kRPC server listening on {self._address}:{self._port} [{self._stream_port=}]")
+        return self
+
+    async def stop(self):
+        """Task: stop serving."""
+        for task in self._tasks:
+            await task.cancel()
+        self._tasks = []
@@ -1 +1,5 @@
 """Classes providing Tasks that the MissionControl can execute asynchronously."""
+from .parts import Part, PartTree
+from .vessel import BULK, FLIGHT_CONTROL, HIGH, NORMAL, Job, VesselManager
+
+__all__ = ["VesselManager", "Job", "FLIGHT_CONTROL", "HIGH", "NORMAL", "BULK", "PartTree", "Part"]
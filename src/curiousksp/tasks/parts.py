@@ -0,0 +1,200 @@
+"""Define the PartTree - a local, indexed snapshot of a vessel's parts, patched as parts come and go.
+
+Walking the parts tree through kRPC costs an RPC per part per property, so finding e.g. the engines of stage 3 on a
+300 part craft takes thousands of round trips. A PartTree reads every part's properties in two batched requests, keeps
+indexes by tag, title, module, resource and (decouple) stage, and answers queries from them. When the vessel stages
+(or parts are decoupled/docked), refresh reads the current part list - one RPC - and only fetches the new parts.
+"""
+import fnmatch
+from collections import defaultdict
+
+from loguru import logger
+import curio
+
+from ..fixedrate import FixedRateLoop
+
+# the Part properties snapshotted, Part.<attribute> -> SpaceCenter procedure
+PROPERTIES = {"title": "Part_get_Title", "name": "Part_get_Name", "tag": "Part_get_Tag", "stage": "Part_get_Stage",
+              "decouple_stage": "Part_get_DecoupleStage", "parent": "Part_get_Parent"}
+# the indexes kept - by the Part attribute of the same name, "module"/"resource" by each of its modules/resources
+INDEXES = ("tag", "title", "name", "module", "resource", "stage", "decouple_stage")
+
+
+class Part:
+    """A snapshot of one part of a PartTree."""
+
+    __slots__ = ("remote", "id", "title", "name", "tag", "stage", "decouple_stage", "parent", "children", "modules",
+                 "resources")
+
+    def __init__(self, remote):
+        """Initialise a new Part for the remote SpaceCenter.Part object."""
+        self.remote = remote
+        self.id = remote._object_id
+        self.title = self.name = self.tag = None
+        self.stage = self.decouple_stage = None
+        # object ids of the parent part (None for the root part) and of the child parts
+        self.parent = None
+        self.children = set()
+        # module names and resource names
+        self.modules, self.resources = (), ()
+
+    def keys(self, index):
+        """Return the keys of the part in index."""
+        if index == "module":
+            return self.modules
+        if index == "resource":
+            return self.resources
+        return (getattr(self, index),)
+
+    def __repr__(self):
+        return f"<Part {self.id} '{self.title}' tag='{self.tag}' stage={self.stage}>"
+
+
+class PartTree:
+    """Indexed snapshot of the parts of vessel, read and patched through conn (an asynkrpc.Client)."""
+
+    def __init__(self, conn, vessel):
+        """Initialise a new, empty PartTree - snapshot it with refresh."""
+        self._conn = conn
+        self._vessel = vessel
+        self._remote_parts = None
+        # object id -> Part
+        self._parts = {}
+        # index -> key -> {object id, ...}
+        self._indexes = {index: defaultdict(set) for index in INDEXES}
+        # stats: refreshes and parts fetched, added and removed
+        self.refreshes, self.fetched, self.added, self.removed = 0, 0, 0, 0
+
+    def __len__(self):
+        return len(self._parts)
+
+    def __iter__(self):
+        return iter(self._parts.values())
+
+    def __getitem__(self, part_id):
+        return self._parts[part_id]
+
+    @property
+    def root(self):
+        """Return the root Part, or None."""
+        return next((p for p in self._parts.values() if p.parent is None), None)
+
+    async def _fetch(self, remotes):
+        """Task: return the Parts of the remote parts, reading their properties in two batched requests."""
+        parts = [Part(r) for r in remotes]
+        async with self._conn.batch() as b:
+            calls = [({attr: b.add("SpaceCenter", proc, p.remote) for attr, proc in PROPERTIES.items()},
+                      b.add("SpaceCenter", "Part_get_Modules", p.remote),
+                      b.add("SpaceCenter", "Part_get_Resources", p.remote)) for p in parts]
+        async with self._conn.batch() as b:
+            names = []
+            for part, (properties, modules, resources) in zip(parts, calls):
+                for attr, call in properties.items():
+                    setattr(part, attr, call.value)
+                part.parent = getattr(part.parent, "_object_id", None)
+                names.append(([b.add("SpaceCenter", "Module_get_Name", m) for m in modules.value],
+                              b.add("SpaceCenter", "Resources_get_Names", resources.value)))
+        for part, (modules, resources) in zip(parts, names):
+            part.modules = tuple(m.value for m in modules)
+            part.resources = tuple(resources.value)
+        self.fetched += len(parts)
+        return parts
+
+    def _add(self, part):
+        """Add a Part to the tree and its indexes."""
+        self._parts[part.id] = part
+        for index, keys in self._indexes.items():
+            for key in part.keys(index):
+                keys[key].add(part.id)
+        if part.parent in self._parts:
+            self._parts[part.parent].children.add(part.id)
+        part.children.update(p.id for p in self._parts.values() if p.parent == part.id)
+
+    def _remove(self, part_id):
+        """Remove a Part from the tree and its indexes."""
+        part = self._parts.pop(part_id)
+        for index, keys in self._indexes.items():
+            for key in part.keys(index):
+                keys[key].discard(part_id)
+                if not keys[key]:
+                    del keys[key]
+        if part.parent in self._parts:
+            self._parts[part.parent].children.discard(part_id)
+
+    async def _current(self):
+        """Task: return the remote parts the vessel has now - one RPC (and one more the first time)."""
+        if self._remote_parts is None:
+            self._remote_parts = await self._conn.invoke("SpaceCenter", "Vessel_get_Parts", self._vessel)
+        return await self._conn.invoke("SpaceCenter", "Parts_get_All", self._remote_parts)
+
+    async def refresh(self):
+        """Task: read the vessel's current part list, dropping the parts that have gone and fetching the new ones.
+
+        The first refresh snapshots every part, later ones (e.g. after staging) only fetch the parts that are new.
+        """
+        return await self._patch(await self._current())
+
+    async def _patch(self, remotes):
+        """Task: bring the tree up to the remote parts the vessel has - drop the parts gone, fetch the new ones."""
+        current = {r._object_id: r for r in remotes}
+        gone = [i for i in self._parts if i not in current]
+        for part_id in gone:
+            self._remove(part_id)
+        new = await self._fetch([r for i, r in current.items() if i not in self._parts])
+        for part in new:
+            self._add(part)
+        self.refreshes += 1
+        self.added += len(new)
+        self.removed += len(gone)
+        if new or gone:
+            logger.opt(lazy=True).debug("Part tree of {} refreshed: {} parts, {} new, {} gone",
+                                        lambda: self._vessel, lambda: len(self._parts), lambda: len(new),
+                                        lambda: len(gone))
+        return self
+
+    def keys(self, index):
+        """Return the keys of an index, e.g. every tag."""
+        return list(self._indexes[index])
+
+    def find(self, **criteria):
+        """Return the Parts matching every criterion (index=key), e.g. find(module="ModuleEngines*", stage=3).
+
+        String keys may be fnmatch patterns, matching any key of the index that they match.
+        """
+        ids = None
+        for index, key in criteria.items():
+            keys = self._indexes[index]
+            if isinstance(key, str) and any(c in key for c in "*?["):
+                matched = set().union(*(ids_ for k, ids_ in keys.items() if fnmatch.fnmatchcase(str(k), key)))
+            else:
+                matched = keys.get(key, set())
+            ids = matched if ids is None else ids & matched
+        parts = self._parts.values() if ids is None else (self._parts[i] for i in ids)
+        return sorted(parts, key=lambda p: p.id)
+
+    def subtree(self, part_id):
+        """Return the Part of part_id and every Part below it in the tree."""
+        parts, todo = [], [part_id]
+        while todo:
+            part = self._parts[todo.pop()]
+            parts.append(part)
+            todo.extend(part.children)
+        return parts
+
+    async def watch(self, interval=0.5):
+        """Task (daemonic): patch the tree whenever the vessel's parts change - staging, decoupling, (un)docking.
+
+        The part list is read every interval seconds (one RPC) and compared with the tree's by object id: a decouple
+        or undock needn't advance the current stage.
+        """
+        try:
+            async for _ in FixedRateLoop(1 / interval, name="parttree.watch"):
+                remotes = await self._current()
+                if {r._object_id for r in remotes} != self._parts.keys():
+                    await self._patch(remotes)
+        except curio.CancelledError:
+            logger.debug("[cancelled] 'PartTree.watch'")
+            raise
+
+    def __repr__(self):
+        return f"<PartTree of {self._vessel} parts={len(self._parts)} refreshes={self.refreshes}>"
@@ -0,0 +1,204 @@
+"""Define the VesselManager - which owns a vessel's connection and runs the jobs queued for it by priority/deadline."""
+import heapq
+import itertools
+import math
+
+from loguru import logger
+import curio
+
+from .. import asynkrpc
+
+# job priorities, lower runs first: flight control must never wait behind anything, bulk queries (e.g. science
+# collection) run when nothing else is due
+FLIGHT_CONTROL, HIGH, NORMAL, BULK = 0, 10, 20, 30
+
+
+class Job:
+    """A job queued on a VesselManager - await job.wait() for the value returned by its coroutine function."""
+
+    def __init__(self, func, args, priority, deadline, preemptible, name, seq):
+        """Initialise a new Job (see VesselManager.submit)."""
+        self.func = func
+        self.args = args
+        self.priority = priority
+        # curio clock time the job should have started by (inf if it has no deadline)
+        self.deadline = deadline
+        self.preemptible = preemptible
+        self.name = name
+        self._seq = seq
+        self._result = curio.Result()
+        # set while the manager cancels the job to preempt it, so that it is requeued rather than failed
+        self._preempting = False
+        # times the job was preempted (and restarted from the beginning)
+        self.preemptions = 0
+
+    @property
+    def key(self):
+        """Return the sort key of the job: priority, then earliest deadline, then first submitted."""
+        return self.priority, self.deadline, self._seq
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+    @property
+    def done(self):
+        """Return whether the job has finished (or failed)."""
+        return self._result.is_set()
+
+    async def wait(self):
+        """Task: wait for the job to finish and return its value (or raise its exception)."""
+        return await self._result.unwrap()
+
+    def __repr__(self):
+        deadline = "" if math.isinf(self.deadline) else f", deadline={self.deadline:.3f}"
+        return f"<Job '{self.name}' priority={self.priority}{deadline}>"
+
+
+class VesselManager:
+    """Owns the connection for a vessel and runs its queued jobs, most urgent first, concurrency at a time.
+
+    When every slot is busy and a job more urgent than a running preemptible one is queued, the running job is
+    cancelled and requeued to restart from the beginning once it is the most urgent again - so preemptible jobs
+    (by default those of NORMAL priority or lower) must be safe to restart.
+    """
+
+    def __init__(self, conn, vessel=None, name="vessel", concurrency=1, publish=None):
+        """Initialise a new VesselManager for vessel on conn, running up to concurrency jobs at once."""
+        self._conn = conn
+        self._vessel = vessel
+        self._name = name
+        self._concurrency = concurrency
+        # Task publish(vessel, key, value) that the jobs' telemetry is sent on with (see publish), or None
+        self._publish = publish
+        # heap of queued Jobs and the running Jobs -> their Tasks
+        self._queue = []
+        self._running = {}
+        # dispatching spawns/cancels Tasks, don't let two dispatches interleave
+        self._lock = curio.Lock()
+        self._seq = itertools.count()
+        self._closed = False
+        # whether the manager opened conn itself (see connect), and so closes it with the manager
+        self._owns_conn = False
+        # stats: jobs completed, failed, preempted and started after their deadline
+        self.completed, self.failed, self.preempted, self.missed = 0, 0, 0, 0
+
+    @classmethod
+    async def connect(cls, vessel_id=None, address="127.0.0.1", rpc_port=50000, name="vessel", schema_cache=None,
+                      **kwargs):
+        """Task: open a kRPC connection of its own for a new VesselManager of vessel_id (see __init__ for kwargs).
+
+        The manager owns the connection: it is closed when the manager is.
+        """
+        conn = await asynkrpc.connect(name, address=address, rpc_port=rpc_port, schema_cache=schema_cache)
+        vessel = None if vessel_id is None else conn.remote_object("SpaceCenter", "Vessel", vessel_id)
+        manager = cls(conn, vessel, name=name, **kwargs)
+        manager._owns_conn = True
+        return manager
+
+    @property
+    def conn(self):
+        """Return the connection the manager's jobs use."""
+        return self._conn
+
+    @property
+    def vessel(self):
+        """Return the vessel the manager's jobs control."""
+        return self._vessel
+
+    @property
+    def name(self):
+        """Return the name of the manager."""
+        return self._name
+
+    @property
+    def queued(self):
+        """Return the queued Jobs, most urgent first."""
+        return sorted(self._queue)
+
+    @property
+    def running(self):
+        """Return the running Jobs."""
+        return list(self._running)
+
+    async def publish(self, key, value):
+        """Task: publish a telemetry value of the vessel under key (dropped if the manager has no publish Task)."""
+        if self._publish is not None:
+            await self._publish(self._vessel, key, value)
+
+    async def submit(self, func, *args, priority=NORMAL, deadline=None, preemptible=None, name=None):
+        """Task: queue func(manager, *args), to start within deadline seconds (if given), and return its Job."""
+        if self._closed:
+            raise RuntimeError(f"VesselManager '{self._name}' is closed")
+        deadline = math.inf if deadline is None else await curio.clock() + deadline
+        preemptible = priority >= NORMAL if preemptible is None else preemptible
+        job = Job(func, args, priority, deadline, preemptible, name or func.__name__, next(self._seq))
+        heapq.heappush(self._queue, job)
+        await self._dispatch()
+        return job
+
+    async def run(self, func, *args, **kwargs):
+        """Task: submit func(manager, *args) (see submit for kwargs) and return its value once it has run."""
+        return await (await self.submit(func, *args, **kwargs)).wait()
+
+    async def _dispatch(self):
+        """Task: start the most urgent queued jobs in the free slots, preempting less urgent jobs if need be."""
+        async with self._lock:
+            while self._queue:
+                job = self._queue[0]
+                if len(self._running) >= self._concurrency:
+                    victim = max((j for j in self._running if j.preemptible), default=None)
+                    if victim is None or job.priority >= victim.priority:
+                        return
+                    await self._preempt(victim, job)
+                heapq.heappop(self._queue)
+                now = await curio.clock()
+                if now > job.deadline:
+                    self.missed += 1
+                    logger.warning(f"[{self._name}] {job!r} started {now - job.deadline:.3f}s after its deadline")
+                self._running[job] = await curio.spawn(self._run_job, job, daemon=True)
+
+    async def _preempt(self, victim, job):
+        """Task: cancel the running victim and requeue it, to make room for job."""
+        logger.debug(f"[{self._name}] Preempting {victim!r} for {job!r}")
+        victim._preempting = True
+        await self._running.pop(victim).cancel()
+        victim._preempting = False
+        victim.preemptions += 1
+        self.preempted += 1
+        heapq.heappush(self._queue, victim)
+
+    async def _run_job(self, job):
+        """Task (daemonic): run a job, set its result and start the next queued job."""
+        try:
+            value = await job.func(self, *job.args)
+        except curio.CancelledError:
+            if not job._preempting:
+                await job._result.set_exception(RuntimeError(f"{job!r} was cancelled"))
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.opt(exception=e).debug(f"[{self._name}] {job!r} failed")
+            value, error = None, e
+        else:
+            self.completed += 1
+            error = None
+        # free the slot before anything else can await, a finished job must not be picked for preemption
+        self._running.pop(job, None)
+        if error is None:
+            await job._result.set_value(value)
+        else:
+            await job._result.set_exception(error)
+        await self._dispatch()
+
+    async def close(self):
+        """Task: stop running jobs, fail the running and queued jobs and close the connection if the manager owns it."""
+        self._closed = True
+        async with self._lock:
+            for job, task in list(self._running.items()):
+                await task.cancel()
+            self._running.clear()
+            while self._queue:
+                await heapq.heappop(self._queue)._result.set_exception(
+                    RuntimeError(f"VesselManager '{self._name}' closed"))
+        if self._owns_conn:
+            await self._conn.close()
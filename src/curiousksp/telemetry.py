@@ -0,0 +1,136 @@
+"""Bridge server-pushed kRPC streams into curio.UniversalQueue`s so Tasks can await telemetry without polling."""
+import threading
+from functools import partial, reduce
+
+from loguru import logger
+import curio
+
+
+class Telemetry:
+    """Registers kRPC streams once on a connection and fans out each update to subscribed Tasks."""
+
+    def __init__(self, conn, maxsize=64):
+        """Initialise a new Telemetry instance around an asyncrpc.AsyncClient of an open krpc.client.Client."""
+        self._conn = conn
+        # max updates buffered per subscriber before new updates for it are dropped
+        self._maxsize = maxsize
+        # key -> krpc.stream.Stream, key -> [curio.UniversalQueue, ...], key -> most recent value
+        self._streams = {}
+        self._subscribers = {}
+        self._latest = {}
+        # key -> (func, args, rate) of its stream, to register it again on a new connection
+        self._specs = {}
+        # count of updates dropped because a subscriber queue was full
+        self.dropped = 0
+        # the stream callbacks run on the krpc stream update thread, guard the subscriber lists with a lock
+        self._lock = threading.Lock()
+        # registering awaits the executor thread, don't let two Tasks both add a stream for the same key meanwhile
+        self._register_lock = curio.Lock()
+
+    @property
+    def conn(self):
+        """Return the asyncrpc.AsyncClient whose client's stream thread feeds this Telemetry."""
+        return self._conn
+
+    @property
+    def keys(self):
+        """Return the keys of the registered streams."""
+        return list(self._streams)
+
+    def _register(self, conn, key, func, *args, rate=0):
+        """[sync] Add a kRPC stream for func(*args) on conn, hook it up to publish under key and start it."""
+        if isinstance(func, str):
+            func = reduce(getattr, func.split("."), conn)
+        stream = conn.add_stream(func, *args)
+        if rate:
+            stream.rate = rate
+        stream.add_callback(partial(self._publish, key))
+        stream.start(wait=False)
+        return stream
+
+    async def register(self, key, func, *args, rate=0):
+        """Task: run self._register on the client's executor thread, once per key, returning the krpc.stream.Stream.
+
+        func is the procedure to stream or its attribute path on the krpc.client.Client, e.g. "krpc.get_status" - only
+        a path is looked up again on the new client when the streams are moved to one (see rebind).
+        """
+        async with self._register_lock:
+            if (stream := self._streams.get(key)) is not None:
+                return stream
+            logger.debug(f"Registering telemetry stream '{key}' [{rate=}]")
+            stream = await self._conn.run(self._register, key, func, *args, rate=rate)
+            self._streams[key] = stream
+            self._specs[key] = func, args, rate
+            return stream
+
+    async def rebind(self, conn):
+        """Task: register every stream again on conn (e.g. after a KSP restart) and return the previous connection.
+
+        The subscribers keep their queues. The previous connection's streams are left to go with it - close it. If a
+        stream can't be registered on conn the error raises and the streams stay on the previous connection.
+        """
+        async with self._register_lock:
+            streams = {}
+            for key, (func, args, rate) in self._specs.items():
+                logger.debug(f"Registering telemetry stream '{key}' again on the new connection [{rate=}]")
+                streams[key] = await conn.run(self._register, key, func, *args, rate=rate)
+            old, self._conn, self._streams = self._conn, conn, streams
+            return old
+
+    def _publish(self, key, value):
+        """[sync] Callback for the krpc stream update thread - fan out value to every subscriber of key."""
+        with self._lock:
+            self._latest[key] = value
+            queues = list(self._subscribers.get(key, ()))
+        dropped = 0
+        for q in queues:
+            # never block the stream thread on a slow subscriber, drop the update for that subscriber instead
+            if q.qsize() >= self._maxsize:
+                dropped += 1
+                continue
+            q.put(value)
+        if dropped:
+            with self._lock:
+                self.dropped += dropped
+
+    def subscribe(self, key):
+        """Return a new curio.UniversalQueue that receives every future update published under key."""
+        q = curio.UniversalQueue()
+        with self._lock:
+            self._subscribers.setdefault(key, []).append(q)
+        return q
+
+    def unsubscribe(self, key, q):
+        """Stop publishing updates under key to q."""
+        with self._lock:
+            if q in (queues := self._subscribers.get(key, [])):
+                queues.remove(q)
+
+    def depths(self):
+        """Return {key: updates queued for its subscribers}, e.g. to spot a subscriber falling behind."""
+        with self._lock:
+            return {key: sum(q.qsize() for q in queues) for key, queues in self._subscribers.items()}
+
+    def latest(self, key, default=None):
+        """Return the most recent value published under key (or default if none has arrived yet)."""
+        with self._lock:
+            return self._latest.get(key, default)
+
+    def _close(self, conn):
+        """[sync] Remove all registered streams from the server."""
+        for key, stream in self._streams.items():
+            try:
+                stream.remove()
+            except Exception as e:
+                logger.warning(f"Failed to remove telemetry stream '{key}': {e!r}")
+        self._streams.clear()
+        self._specs.clear()
+
+    async def close(self):
+        """Task: run self._close on the client's executor thread and drop all subscribers."""
+        try:
+            await self._conn.run(self._close)
+        except curio.TaskTimeout:
+            logger.warning("Timed out removing the telemetry streams - is the connection broken?")
+        with self._lock:
+            self._subscribers.clear()
@@ -0,0 +1,180 @@
+"""Define a columnar time-series store of fixed-size NumPy ring buffers per metric, downsampled at several resolutions.
+
+Every metric keeps a ring of raw samples plus rings of per-bucket aggregates (mean/min/max/count) at coarser
+resolutions (1 s and 1 min by default), so memory is fixed however long the session runs. When the store has a path,
+each ring is a memory-mapped `.npy` file under it - a long session can be reopened (e.g. with
+`TimeSeriesStore(path).query(...)`) and plotted without parsing the log.
+"""
+import math
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+
+# a row of every ring: the (bucket start) time, the aggregates of the values in it and how many values that was
+ROW = np.dtype([("t", "f8"), ("mean", "f8"), ("min", "f8"), ("max", "f8"), ("n", "u4")])
+# resolution in seconds (0 = raw samples) -> ring capacity in rows, i.e. ~2.3 h of raw heartbeats, 1 h of 1 s
+# buckets and a week of 1 min buckets: under 1 MB per metric
+RESOLUTIONS = {0: 8192, 1: 3600, 60: 10080}
+
+
+class Ring:
+    """Fixed-capacity ring buffer of ROW records, in memory or in a memory-mapped .npy file."""
+
+    def __init__(self, capacity, path=None):
+        """Initialise a new Ring, reopening (and continuing) the ring in the .npy file at path if it exists."""
+        if path is None:
+            self._rows = np.zeros(capacity, dtype=ROW)
+        elif Path(path).exists():
+            self._rows = np.lib.format.open_memmap(path, mode="r+")
+        else:
+            self._rows = np.lib.format.open_memmap(path, mode="w+", dtype=ROW, shape=(capacity,))
+        # unused rows have n == 0, and the next row goes after the latest one
+        filled = self._rows["n"] > 0
+        self._size = int(np.count_nonzero(filled))
+        self._head = (int(np.argmax(np.where(filled, self._rows["t"], -np.inf))) + 1) % len(self._rows) \
+            if self._size else 0
+
+    def __len__(self):
+        """Return the number of rows in the ring."""
+        return self._size
+
+    @property
+    def capacity(self):
+        """Return the max number of rows the ring holds before overwriting the oldest."""
+        return len(self._rows)
+
+    def append(self, t, mean, min_, max_, n=1, replace=False):
+        """Write a row, overwriting the oldest once the ring is full (or the latest row if replace)."""
+        if replace and self._size:
+            self._rows[self._head - 1] = (t, mean, min_, max_, n)
+            return
+        self._rows[self._head] = (t, mean, min_, max_, n)
+        self._head = (self._head + 1) % len(self._rows)
+        self._size = min(self._size + 1, len(self._rows))
+
+    def latest(self):
+        """Return the latest row, or None if the ring is empty."""
+        return self._rows[self._head - 1].copy() if self._size else None
+
+    def rows(self, start=None, end=None):
+        """Return a copy of the rows (with start <= t < end, if given) in chronological order."""
+        if self._size < len(self._rows):
+            rows = self._rows[:self._size].copy()
+        else:
+            rows = np.concatenate((self._rows[self._head:], self._rows[:self._head]))
+        if start is not None:
+            rows = rows[rows["t"] >= start]
+        if end is not None:
+            rows = rows[rows["t"] < end]
+        return rows
+
+    def flush(self):
+        """Flush a memory-mapped ring to its file."""
+        if isinstance(self._rows, np.memmap):
+            self._rows.flush()
+
+
+class Metric:
+    """The rings of one metric at each resolution, aggregating raw values into the open bucket of each coarser one."""
+
+    def __init__(self, resolutions=None, path=None):
+        """Initialise a new Metric with {resolution: capacity} rings, memory-mapped as <path>.<resolution>.npy."""
+        resolutions = RESOLUTIONS if resolutions is None else resolutions
+        self.rings = {r: Ring(capacity, None if path is None else f"{path}.{r}.npy")
+                      for r, capacity in resolutions.items()}
+        # resolution -> [bucket start, sum, min, max, n, written] of the bucket still being filled, where written is
+        # whether a flush has already written it out as the latest row of the ring
+        self._buckets = {r: None for r in self.rings if r}
+        # a reopened ring's latest row is the bucket that was open when it was last flushed - carry on filling it
+        for r in self._buckets:
+            if (row := self.rings[r].latest()) is not None:
+                self._buckets[r] = [float(row["t"]), float(row["mean"]) * int(row["n"]), float(row["min"]),
+                                    float(row["max"]), int(row["n"]), True]
+
+    def record(self, value, t):
+        """Append value at time t to the raw ring and fold it into the buckets, writing out any bucket it closes."""
+        if 0 in self.rings:
+            self.rings[0].append(t, value, value, value)
+        for r, bucket in self._buckets.items():
+            start = math.floor(t / r) * r
+            if bucket is not None and bucket[0] != start:
+                self._write(r, bucket)
+                bucket = None
+            if bucket is None:
+                self._buckets[r] = [start, value, value, value, 1, False]
+            else:
+                bucket[1] += value
+                bucket[2] = min(bucket[2], value)
+                bucket[3] = max(bucket[3], value)
+                bucket[4] += 1
+
+    def _write(self, resolution, bucket):
+        start, total, min_, max_, n, written = bucket
+        self.rings[resolution].append(start, total / n, min_, max_, n, replace=written)
+        bucket[5] = True
+
+    def flush(self):
+        """Write out the open buckets so far (so queries/files include them) and flush the rings."""
+        for r, bucket in self._buckets.items():
+            if bucket is not None:
+                self._write(r, bucket)
+        for ring in self.rings.values():
+            ring.flush()
+
+
+class TimeSeriesStore:
+    """Named Metrics recorded against wall clock time, persisted under path (a directory) if one is given."""
+
+    def __init__(self, path=None, resolutions=None):
+        """Initialise a new TimeSeriesStore, in memory if path is None."""
+        self._path = None if path is None else Path(path)
+        if self._path is not None:
+            self._path.mkdir(parents=True, exist_ok=True)
+        self._resolutions = RESOLUTIONS if resolutions is None else resolutions
+        self._metrics = {}
+
+    @property
+    def path(self):
+        """Return the directory the rings are memory-mapped under (None if in memory)."""
+        return self._path
+
+    @property
+    def names(self):
+        """Return the names of the metrics in the store (including any persisted by an earlier session)."""
+        names = set(self._metrics)
+        if self._path is not None:
+            names.update(re.sub(r"\.\d+$", "", p.stem) for p in self._path.glob("*.npy"))
+        return sorted(names)
+
+    def metric(self, name):
+        """Return the Metric for name, creating (or reopening) it on first use."""
+        if (metric := self._metrics.get(name)) is None:
+            path = None if self._path is None else self._path / name
+            metric = self._metrics[name] = Metric(self._resolutions, path)
+        return metric
+
+    def record(self, name, value, t=None):
+        """Record value for the metric name at time t (default now)."""
+        self.metric(name).record(float(value), time.time() if t is None else t)
+
+    def record_many(self, values, t=None):
+        """Record a {name: value} mapping of values all taken at time t (default now)."""
+        t = time.time() if t is None else t
+        for name, value in values.items():
+            self.metric(name).record(float(value), t)
+
+    def query(self, name, resolution=0, start=None, end=None):
+        """Return the ROW records of name at resolution (seconds, 0 = raw) with start <= t < end, oldest first."""
+        return self.metric(name).rings[resolution].rows(start, end)
+
+    def flush(self):
+        """Write out the open buckets of every metric and flush the memory-mapped rings."""
+        for metric in self._metrics.values():
+            metric.flush()
+
+    def close(self):
+        """Flush the store and drop the metrics (releasing the memory maps)."""
+        self.flush()
+        self._metrics.clear()
@@ -0,0 +1,104 @@
+"""Define the compact binary scheduling trace written by debug.schedrecord and an offline analyzer for its dumps.
+
+A dump is a header, a JSON table of the interned task names/states/traps, then the ring buffer of fixed-size records
+(oldest first once read back). Each record is (monotonic ns, task id, cycle, event, state, trap).
+"""
+import json
+import mmap
+import struct
+from collections import defaultdict
+from pathlib import Path
+
+MAGIC = b"CKSPTRC1"
+# magic, record size, meta JSON length, ring capacity (records), records written in total
+HEADER = struct.Struct("<8sIIQQ")
+# monotonic ns, task id, task cycles, event, state code, trap code
+RECORD = struct.Struct("<qIIBBH")
+EVENTS = ("created", "running", "suspended", "terminated")
+CREATED, RUNNING, SUSPENDED, TERMINATED = range(len(EVENTS))
+
+
+def write_dump(path, buffer, capacity, count, meta):
+    """Write the ring buffer (bytes-like of capacity records, count written in total) and meta to a mmap'd file."""
+    meta_bytes = json.dumps(meta).encode("utf8")
+    header = HEADER.pack(MAGIC, RECORD.size, len(meta_bytes), capacity, count)
+    size = len(header) + len(meta_bytes) + len(buffer)
+    with open(path, "w+b") as f:
+        f.truncate(size)
+        with mmap.mmap(f.fileno(), size) as m:
+            m[:len(header)] = header
+            m[len(header):len(header) + len(meta_bytes)] = meta_bytes
+            m[len(header) + len(meta_bytes):] = buffer
+            m.flush()
+    return Path(path)
+
+
+def read_dump(path):
+    """Return (records in chronological order, meta) from a dump written by write_dump."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        magic, record_size, meta_len, capacity, count = HEADER.unpack_from(m)
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError(f"'{path}' is not a curiousksp scheduling trace dump")
+        meta = json.loads(m[HEADER.size:HEADER.size + meta_len])
+        ring = m[HEADER.size + meta_len:HEADER.size + meta_len + capacity * RECORD.size]
+    records = list(RECORD.iter_unpack(ring))
+    if count <= capacity:
+        # the ring hadn't wrapped around yet
+        return records[:count], meta
+    head = count % capacity
+    return records[head:] + records[:head], meta
+
+
+def timelines(records, meta):
+    """Return {task id: [(kind, start ns, end ns, detail), ...]} of the run/wait spans of each task.
+
+    A run span goes from a task's running record to its suspended one, a wait span from suspended to the next running,
+    with the state it was waiting in (e.g. 'TIME_SLEEP') as the detail.
+    """
+    states, traps = meta["states"], meta["traps"]
+    spans = defaultdict(list)
+    # task id -> (event, ns, state) of its last running/suspended record
+    last = {}
+    for ns, task_id, cycles, event, state, trap in records:
+        if event == RUNNING:
+            if (prev := last.get(task_id)) and prev[0] == SUSPENDED:
+                spans[task_id].append(("wait", prev[1], ns, states[prev[2]]))
+            last[task_id] = (RUNNING, ns, state)
+        elif event == SUSPENDED:
+            if (prev := last.get(task_id)) and prev[0] == RUNNING:
+                spans[task_id].append(("run", prev[1], ns, traps[trap]))
+            last[task_id] = (SUSPENDED, ns, state)
+    return dict(spans)
+
+
+def summary(records, meta):
+    """Return a list of per-task summary dicts (cycles, run/wait totals and the longest run) sorted by run time."""
+    names = meta["names"]
+    rows = []
+    for task_id, spans in timelines(records, meta).items():
+        runs = [end - start for kind, start, end, _ in spans if kind == "run"]
+        waits = [end - start for kind, start, end, _ in spans if kind == "wait"]
+        rows.append({"id": task_id, "name": names.get(str(task_id), "?"), "cycles": len(runs),
+                     "run_total": sum(runs) / 1e9, "run_max": max(runs, default=0) / 1e9,
+                     "run_mean": sum(runs) / len(runs) / 1e9 if runs else 0.0, "wait_total": sum(waits) / 1e9})
+    return sorted(rows, key=lambda r: r["run_total"], reverse=True)
+
+
+def format_summary(rows):
+    """Render summary rows as a plain text table."""
+    lines = [f"{'id':>5} {'task':<40} {'cycles':>8} {'run (s)':>10} {'mean (ms)':>10} {'max (ms)':>10} "
+             f"{'wait (s)':>10}"]
+    for r in rows:
+        lines.append(f"{r['id']:>5} {r['name'][:40]:<40} {r['cycles']:>8} {r['run_total']:>10.4f} "
+                     f"{r['run_mean'] * 1e3:>10.3f} {r['run_max'] * 1e3:>10.3f} {r['wait_total']:>10.4f}")
+    return "\n".join(lines)
+
+
+def analyze(path):
+    """Return the summary table for the dump at path, with the span of time it covers."""
+    records, meta = read_dump(path)
+    if not records:
+        return f"'{path}' holds no records"
+    duration = (records[-1][0] - records[0][0]) / 1e9
+    header = f"{len(records)} records over {duration:.3f}s from '{path}'"
+    return f"{header}\n{format_summary(summary(records, meta))}"
@@ -0,0 +1,46 @@
+"""Fast human formatting of quantities with SI prefixes - pint's `to_compact()` + `~P` output at a fraction of the cost.
+
+Building pint Quantities and calling `.to_compact()` on them per log line walks the registry's prefixes and unit
+containers every time. The kRPC status values are already in base units (seconds, bytes), so all that is really
+needed is a lookup of the prefix for the magnitude's power of 1000.
+"""
+import bisect
+import math
+from functools import lru_cache
+
+# SI prefix abbreviations (as pint's `~P` renders them) by power of 10
+SI_PREFIXES = {-30: "q", -27: "r", -24: "y", -21: "z", -18: "a", -15: "f", -12: "p", -9: "n", -6: "µ", -3: "m",
+               0: "", 3: "k", 6: "M", 9: "G", 12: "T", 15: "P", 18: "E", 21: "Z", 24: "Y", 27: "R", 30: "Q"}
+_POWERS = sorted(SI_PREFIXES)
+# exact (int) divisors/multipliers for each power so that scaling a float doesn't pick up 0.001-style error
+_SCALES = {p: (10 ** p, 1) if p >= 0 else (1, 10 ** -p) for p in _POWERS}
+
+
+def si_power(magnitude):
+    """Return the power of 10 (a multiple of 3) whose SI prefix pint's `to_compact()` would pick for magnitude."""
+    if magnitude == 0 or not math.isfinite(magnitude):
+        return 0
+    power = math.floor(math.log10(abs(magnitude)) / 3) * 3
+    # clamp to the smallest/largest prefix like pint does
+    index = bisect.bisect_left(_POWERS, power)
+    return _POWERS[index] if index < len(_POWERS) else _POWERS[-1]
+
+
+def compact(magnitude, symbol, spec=".1f"):
+    """Return magnitude (in base units of symbol, e.g. "s" or "B/s") formatted by spec with the best SI prefix."""
+    power = si_power(magnitude)
+    divisor, multiplier = _SCALES[power]
+    return f"{magnitude * multiplier / divisor:{spec}} {SI_PREFIXES[power]}{symbol}"
+
+
+@lru_cache(maxsize=256)
+def conversion_factor(from_unit, to_unit):
+    """Return (and cache) the factor converting a magnitude in from_unit to to_unit, e.g. ("km/h", "m/s")."""
+    # only touch pint the first time each pair of units is seen
+    from . import ureg
+    return ureg.Quantity(1.0, from_unit).to(to_unit).magnitude
+
+
+def convert(magnitude, from_unit, to_unit):
+    """Return magnitude converted from from_unit to to_unit using a cached conversion factor."""
+    return magnitude * conversion_factor(from_unit, to_unit)
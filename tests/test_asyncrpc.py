@@ -0,0 +1,68 @@
+"""[pytest] Tests for curiousksp.asyncrpc."""
+import threading
+import time
+from types import SimpleNamespace
+
+import curio
+import pytest
+
+from curiousksp.asyncrpc import AsyncClient
+
+
+class FakeConn:
+    """Stand-in for krpc.client.Client that records which thread its RPCs ran on."""
+
+    def __init__(self):
+        self.threads = set()
+        self.krpc = SimpleNamespace(get_status=self._get_status, paused=False)
+
+    def _get_status(self, delay=0):
+        self.threads.add(threading.get_ident())
+        time.sleep(delay)
+        return SimpleNamespace(rpcs_executed=42)
+
+
+def test_calls_run_off_the_kernel_thread():
+    """Check that reads, calls and sets all happen on the one executor thread while the kernel stays free."""
+    conn = FakeConn()
+
+    async def main():
+        aconn = AsyncClient(conn)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await curio.sleep(0.005)
+
+        ticker_task = await curio.spawn(ticker)
+        status = await aconn.krpc.get_status(delay=0.1)
+        await aconn.krpc.paused.set(True)
+        paused = await aconn.krpc.paused
+        await ticker_task.cancel()
+        await aconn.close()
+        return status, paused, ticks
+
+    status, paused, ticks = curio.run(main)
+    assert status.rpcs_executed == 42 and paused is True
+    assert threading.get_ident() not in conn.threads and len(conn.threads) == 1
+    # the ticker kept being scheduled while the slow RPC was in flight
+    assert ticks > 5
+
+
+def test_call_timeout_abandons_result():
+    """Check that a per-call timeout raises in the caller and is counted as abandoned."""
+    conn = FakeConn()
+
+    async def main():
+        aconn = AsyncClient(conn, timeout=0.01)
+        with pytest.raises(curio.TaskTimeout):
+            await aconn.krpc.get_status(delay=0.1)
+        # a longer per-call timeout overrides the default
+        await aconn.krpc.get_status(delay=0.05, timeout=1)
+        await aconn.close()
+        return aconn.executor
+
+    executor = curio.run(main)
+    assert executor.abandoned == 1 and executor.completed == 2
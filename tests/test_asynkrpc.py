@@ -0,0 +1,131 @@
+"""[pytest] Tests for curiousksp.asynkrpc against the curiousksp.standin server."""
+import curio
+import pytest
+from krpc.error import RPCError
+
+from curiousksp import asynkrpc
+from curiousksp.standin import StandInServer
+
+
+async def _slow_add(a, b):
+    await curio.sleep(0.001)
+    return a + b
+
+
+def _server():
+    server = StandInServer()
+    sint32 = server.types.sint32_type
+    server.add_procedure("Test", "Add", _slow_add, params=[sint32, sint32], return_type=sint32)
+    server.add_procedure("Test", "Fail", lambda: 1 / 0)
+    return server
+
+
+def test_handshake_services_and_status():
+    """Check the connection handshake, schema loading and a KRPC.GetStatus round trip."""
+    async def main():
+        server = await _server().start()
+        async with await asynkrpc.connect("test", rpc_port=server.port) as client:
+            status = await client.get_status()
+            assert ("Test", "Add") in client.procedures and len(client.client_id) == 16
+            with pytest.raises(RPCError, match="ZeroDivisionError"):
+                await client.invoke("Test", "Fail")
+            with pytest.raises(ValueError):
+                client.build_call("Test", "Missing")
+        await server.stop()
+        return status
+
+    assert curio.run(main).version == "standin"
+
+
+def test_pipelined_requests_resolve_in_order():
+    """Check that many concurrent requests share the one connection and each caller gets its own result."""
+    async def main():
+        server = await _server().start()
+        client = await asynkrpc.connect("test", rpc_port=server.port)
+        async with curio.TaskGroup() as g:
+            tasks = [await g.spawn(client.invoke, "Test", "Add", i, i) for i in range(50)]
+        results = [t.result for t in tasks]
+        await client.close()
+        await server.stop()
+        return client, server, results
+
+    client, server, results = curio.run(main)
+    assert results == [2 * i for i in range(50)]
+    assert server.connections == 1 and client.max_in_flight > 1
+
+
+def test_connect_refused():
+    """Check that a refused connection surfaces as ConnectionRefusedError for MissionControl to retry on."""
+    async def main():
+        sock = curio.network.tcp_server_socket("127.0.0.1", 0)
+        port = sock.getsockname()[1]
+        await sock.close()
+        await asynkrpc.connect("test", rpc_port=port)
+
+    with pytest.raises(ConnectionRefusedError):
+        curio.run(main)
+
+
+def test_batch_is_one_round_trip():
+    """Check that a batch of calls is sent as one request and each placeholder resolves to its own result."""
+    async def main():
+        server = await _server().start()
+        client = await asynkrpc.connect("test", rpc_port=server.port)
+        requests = server.requests
+        async with client.batch() as b:
+            sums = [b.add("Test", "Add", i, 1) for i in range(20)]
+            failed = b.add("Test", "Fail")
+            assert not failed.done and len(b) == 21
+        batch_requests = server.requests - requests
+        async with client.batch() as b:
+            pass
+        assert await b.values() == []
+        await client.close()
+        await server.stop()
+        return sums, failed, batch_requests
+
+    sums, failed, batch_requests = curio.run(main)
+    assert batch_requests == 1
+    assert [s.value for s in sums] == list(range(1, 21))
+    with pytest.raises(RPCError):
+        failed.value
+
+
+def test_request_fails_fast_on_a_failed_send_or_reader(monkeypatch):
+    """Check a failed send breaks the connection and a reader failing during the lock wait fails the request."""
+    async def main():
+        server = await _server().start()
+        client = await asynkrpc.connect("test", rpc_port=server.port)
+        send_message = asynkrpc.send_message
+
+        async def failing_send(stream, message):
+            monkeypatch.setattr(asynkrpc, "send_message", send_message)
+            raise OSError("send failed")
+
+        # a request in flight when the send fails is failed with it, nothing is sent after a half-written frame
+        in_flight = await curio.spawn(client.invoke, "Test", "Add", 2, 3)
+        await curio.sleep(0)
+        monkeypatch.setattr(asynkrpc, "send_message", failing_send)
+        with pytest.raises(OSError, match="send failed"):
+            await client.invoke("Test", "Add", 1, 2)
+        with pytest.raises(curio.TaskError) as failed:
+            await in_flight.join()
+        with pytest.raises(ConnectionError, match="failed send"):
+            await client.invoke("Test", "Add", 1, 1)
+        pending = client.in_flight
+        await client.close()
+        # the reader fails while a request waits for the write lock
+        client = await asynkrpc.connect("test", rpc_port=server.port)
+        async with client._write_lock:
+            waiting = await curio.spawn(client.invoke, "Test", "Add", 1, 1)
+            await curio.sleep(0.01)
+            client._error = ConnectionError("kRPC connection lost")
+        async with curio.timeout_after(1):
+            with pytest.raises(curio.TaskError) as e:
+                await waiting.join()
+        await client.close()
+        await server.stop()
+        return pending, failed.value.__cause__, e.value.__cause__
+
+    pending, failed, cause = curio.run(main)
+    assert pending == 0 and isinstance(failed, ConnectionError) and isinstance(cause, ConnectionError)
@@ -0,0 +1,65 @@
+"""[pytest] Tests for curiousksp.debug."""
+import json
+import pstats
+import time
+from types import SimpleNamespace
+
+import curio
+
+from curiousksp.debug import _source_location, schedtrace, taskprofile
+
+
+async def _mission():
+    return 42  # the line the fake Task is on
+
+
+def _fake_task(coro):
+    code = coro.cr_code
+    return SimpleNamespace(id=7, cycles=3, name="mission", daemon=False, coro=coro,
+                           where=lambda: (code.co_filename, code.co_firstlineno + 1))
+
+
+def test_pretty_repr_caches_source_lookups():
+    """Check that the Task repr shows its line of source and that repeat lookups are served from the cache."""
+    coro = _mission()
+    task = _fake_task(coro)
+    _source_location.cache_clear()
+    first = schedtrace._pretty_repr(task)
+    task.cycles = 4
+    second = schedtrace._pretty_repr(task)
+    coro.close()
+    assert first.startswith("[7|3] 'mission' @ `return 42  # the line the fake Task is on`[")
+    assert second.startswith("[7|4] 'mission'")
+    info = _source_location.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def _spin(seconds):
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+async def _busy():
+    for _ in range(5):
+        _spin(0.01)
+        await curio.sleep(0)
+
+
+def test_taskprofile_exports_pstats_and_flamegraphs(tmp_path):
+    """Check that taskprofile attributes CPU time and sampled stacks to the busy Task and exports all three formats."""
+    profiler = taskprofile(path=tmp_path / "run.prof", interval=0.001)
+
+    async def main():
+        await (await curio.spawn(_busy)).join()
+
+    curio.run(main, debug=[profiler])
+    profiler.stop()
+    location, cycles, cpu = profiler.tasks["_busy"]
+    assert cycles == 6 and cpu >= 0.05
+    assert any(frames[-1][2] == "_spin" for name, frames in profiler.samples if name == "_busy")
+    prof, folded, scope = profiler.dump()
+    stats = pstats.Stats(str(prof))
+    assert stats.stats[(location[0], location[1], "<task _busy>")][0] == 6
+    assert "_busy;_busy (test_debug.py:" in folded.read_text()
+    assert json.loads(scope.read_text())["profiles"]
@@ -0,0 +1,66 @@
+"""[pytest] Tests for curiousksp.fixedrate, driven by a simulated clock rather than the (maybe loaded) machine's."""
+import curio
+import pytest
+
+from curiousksp.fixedrate import CATCH_UP, SKIP, FixedRateLoop
+
+
+class SimulatedClock:
+    """Time that only passes when a Task sleeps - rates are powers of two so the deadlines are exact floats."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    async def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+        await curio.sleep(0)
+
+
+def _run(rate, work, ticks, **kwargs):
+    """Run a FixedRateLoop for ticks ticks, with work(index) periods of (blocking the Task) work per tick."""
+    time = SimulatedClock()
+    loop = FixedRateLoop(rate, clock=time.clock, sleep=time.sleep, **kwargs)
+
+    async def main():
+        indices = []
+        async for index in loop:
+            indices.append(index)
+            if len(indices) == ticks:
+                break
+            await time.sleep(work(index) * loop.period)
+        return indices
+
+    return loop, curio.run(main), time.now / loop.period
+
+
+def test_no_drift_with_work_in_the_loop():
+    """Check the loop keeps to its deadlines when the work takes a good part of the period."""
+    loop, indices, periods = _run(128, lambda i: 0.5, 21)
+    assert indices == list(range(21))
+    # sleeping a period after half a period of work would take 30 periods
+    assert periods == 20
+    assert loop.skipped == 0 and loop.missed == 0 and loop.ticks == 21 and loop.jitter.max == 0
+
+
+def test_skip_policy_drops_ticks_after_an_overrun():
+    """Check an overrun of 2.5 periods skips the tick a whole period behind and runs the next one late, at once."""
+    loop, indices, _ = _run(64, lambda i: 2.5 if i == 2 else 0, 6, policy=SKIP)
+    # tick 2 ends at 4.5 periods: tick 3 is skipped, tick 4 runs half a period late and then 5 is on time again
+    assert indices == [0, 1, 2, 4, 5, 6]
+    assert loop.skipped == 1 and loop.missed == 2
+    assert loop.jitter.max == pytest.approx(loop.period / 2, rel=0.05)
+
+
+def test_catch_up_policy_runs_every_tick():
+    """Check the catch-up policy runs the late ticks back to back, and skips once max_catch_up behind."""
+    loop, indices, periods = _run(64, lambda i: 2.5 if i == 2 else 0, 8, policy=CATCH_UP)
+    assert indices == list(range(8)) and loop.skipped == 0 and loop.missed == 2
+    # back on schedule: tick 7 at 7 periods
+    assert periods == 7
+    limited, indices, _ = _run(64, lambda i: 2.5 if i == 2 else 0, 5, policy=CATCH_UP, max_catch_up=1)
+    assert indices == [0, 1, 2, 4, 5] and limited.skipped == 1
+    with pytest.raises(ValueError):
+        FixedRateLoop(10, policy="whenever")
@@ -0,0 +1,28 @@
+"""[pytest] Tests for curiousksp.histogram and the longblock latency report."""
+import pytest
+
+from curiousksp.debug import longblock
+from curiousksp.histogram import LogHistogram
+
+
+def test_percentiles_within_bucket_resolution():
+    """Check that percentiles land within a bucket (25%) of the exact values and never exceed the max."""
+    h = LogHistogram()
+    values = [i * 1e-4 for i in range(1, 1001)]
+    for v in values:
+        h.record(v)
+    assert h.count == 1000 and h.mean == pytest.approx(sum(values) / 1000)
+    assert values[499] <= h.percentile(50) <= values[499] * 1.25
+    assert values[989] <= h.percentile(99) <= values[989] * 1.25
+    assert h.percentile(100) == h.max == values[-1]
+    assert LogHistogram().percentile(99) == 0.0
+
+
+def test_longblock_escalates_and_reports():
+    """Check that longblock escalates its level by overshoot and reports per-task percentiles."""
+    lb = longblock(level="WARNING", max_time=0.1)
+    assert [lb._level(d) for d in (0.2, 0.5, 2.0)] == ["WARNING", "ERROR", "CRITICAL"]
+    for d in (0.001, 0.002, 0.003):
+        lb.histograms["mission"].record(d)
+    report = lb.report()
+    assert "mission" in report and report.splitlines()[1].split()[1] == "3"
@@ -0,0 +1,88 @@
+"""[pytest] Tests for curiousksp.logsink."""
+import threading
+
+import curio
+from loguru import logger
+
+from curiousksp import logsink
+from curiousksp.logsink import BatchedSink
+from curiousksp.missioncontrol import MissionControl
+from curiousksp.standin import StandInServer
+
+
+class SlowStream:
+    """Stand-in for a console/file that records the thread and size of each write, blocking until released."""
+
+    def __init__(self):
+        self.batches, self.threads, self.release = [], set(), threading.Event()
+
+    def write(self, batch):
+        self.release.wait(5)
+        self.threads.add(threading.get_ident())
+        self.batches.append(batch)
+
+
+def test_batches_written_off_thread():
+    """Check that records are written in batches from the writer thread and flush waits for them."""
+    stream = SlowStream()
+    sink = BatchedSink(stream.write, name="test", interval=60)
+    handler_id = logger.add(sink, format="{message}")
+    logger.enable("tests")
+    try:
+        for i in range(10):
+            logger.info(f"record {i}")
+        # nothing written yet - the (blocked) writer thread has everything still to do
+        assert stream.batches == [] and sink.buffered == 10
+        stream.release.set()
+        assert sink.flush()
+    finally:
+        logger.remove(handler_id)
+        sink.close()
+    assert "".join(stream.batches) == "".join(f"record {i}\n" for i in range(10))
+    assert len(stream.batches) < 10 and threading.get_ident() not in stream.threads
+    assert sink.written == 10 and sink.dropped == 0
+
+
+def test_full_buffer_drops_and_reports():
+    """Check that a full buffer drops (and counts) messages, then reports the drops in the output."""
+    stream = SlowStream()
+    sink = BatchedSink(stream.write, name="test", maxsize=3, interval=60)
+    for i in range(5):
+        sink(f"{i}\n")
+    stream.release.set()
+    sink.close()
+    assert sink.dropped == 2 and sink.written == 3
+    assert "".join(stream.batches) == "0\n1\n2\n[test] 2 log messages dropped (buffer full)\n"
+
+
+def test_write_failures_go_to_stderr(capsys):
+    """Check a failing write is reported on stderr, not mixed into the (stdout) log output."""
+    def fail(message):
+        raise OSError("disk full")
+
+    sink = BatchedSink(fail, name="failing")
+    sink("a message\n")
+    sink.close()
+    captured = capsys.readouterr()
+    assert captured.out == "" and "[failing] failed to write 1 log messages" in captured.err
+
+
+def test_shutdown_from_the_signal_task_flushes_the_logs(monkeypatch):
+    """Check a shutdown run by the signal Task - which start's cleanup cancels - still gets the logs flushed."""
+    flushes = []
+    monkeypatch.setattr(logsink, "flush_all", lambda timeout=5.0: flushes.append(True))
+
+    async def free_port():
+        server = await StandInServer().start()
+        await server.stop()
+        return server.port
+
+    mc = MissionControl(krpc_port=curio.run(free_port), metrics_port=0)
+
+    async def sigint():
+        await curio.sleep(0.05)
+        await mc.shutdown()
+
+    monkeypatch.setattr(mc._signal_handler, "sigint", sigint)
+    assert curio.run(mc.start) == "cancelled"
+    assert flushes == [True]
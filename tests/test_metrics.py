@@ -0,0 +1,82 @@
+"""[pytest] Tests for curiousksp.metrics."""
+import curio
+from curio import socket
+
+from curiousksp.debug import longblock
+from curiousksp.histogram import LogHistogram
+from curiousksp.logsink import BatchedSink
+from curiousksp.metrics import Metrics, MetricsServer, family, kernel_tasks, render, summary
+
+
+def test_render_exposition_format():
+    """Check families render as Prometheus text: HELP/TYPE lines, escaped labels, summaries and special values."""
+    h = LogHistogram()
+    for value in (0.001, 0.002, 0.004):
+        h.record(value)
+    text = render([family("krpc_rpcs_total", "counter", "RPCs made", [("", {}, 42)]),
+                   family("queue_depth", "gauge", "Queued", [("", {"queue": 'a "b"\\c'}, 3.5)]),
+                   family("rate", "gauge", "Rate", [("", {}, float("nan")), ("", {"x": "1"}, float("inf"))]),
+                   summary("cycle_seconds", "Cycles", {"beat": h})])
+    lines = text.splitlines()
+    assert lines[:3] == ["# HELP krpc_rpcs_total RPCs made", "# TYPE krpc_rpcs_total counter", "krpc_rpcs_total 42"]
+    assert 'queue_depth{queue="a \\"b\\"\\\\c"} 3.5' in lines
+    assert "rate NaN" in lines and 'rate{x="1"} +Inf' in lines
+    assert "# TYPE cycle_seconds summary" in lines and 'cycle_seconds_count{task="beat"} 3' in lines
+    assert any(line.startswith('cycle_seconds{task="beat",quantile="0.99"} 0.004') for line in lines)
+    assert text.endswith("\n")
+
+
+def test_failing_collector_and_log_sinks():
+    """Check a failing collector is counted rather than breaking the scrape, and the log sinks are exposed."""
+    sink = BatchedSink(lambda message: None, name="test-sink", maxsize=1)
+    metrics = Metrics()
+    metrics.register(lambda: 1 / 0)
+    text = metrics.render()
+    sink.close()
+    assert "curiousksp_metrics_collector_errors_total 1" in text
+    assert 'curiousksp_log_records_dropped_total{sink="test-sink"} 0' in text
+
+
+async def _get(port, path="/metrics", method="GET"):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    async with sock:
+        await sock.connect(("127.0.0.1", port))
+        await sock.sendall(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = b""
+        while data := await sock.recv(65536):
+            response += data
+    head, body = response.decode().split("\r\n\r\n", 1)
+    return head.split("\r\n")[0], body
+
+
+def test_server_exposes_kernel_tasks():
+    """Check GET /metrics serves the kernel's Tasks and cycle times without stalling it, other requests are refused."""
+    debugger = longblock(max_time=10)
+    kernel = curio.Kernel(debug=[debugger])
+
+    async def ticker():
+        while True:
+            await curio.sleep(0.001)
+
+    async def main():
+        metrics = Metrics()
+        metrics.register(kernel_tasks(kernel, [debugger]))
+        server = await MetricsServer(metrics, port=0).start()
+        tick = await curio.spawn(ticker, daemon=True)
+        await curio.sleep(0.02)
+        responses = [await _get(server.port), await _get(server.port, "/other"),
+                     await _get(server.port, method="POST")]
+        await tick.cancel()
+        await server.stop()
+        return server, responses
+
+    with kernel:
+        server, ((status, body), (missing, _), (post, _)) = kernel.run(main)
+    assert status == "HTTP/1.1 200 OK" and missing == "HTTP/1.1 404 Not Found"
+    assert post == "HTTP/1.1 405 Method Not Allowed"
+    assert server.scrapes == 1 and server.refused == 2
+    name = "test_server_exposes_kernel_tasks.<locals>.ticker"
+    cycles = [line for line in body.splitlines() if line.startswith(f'curiousksp_task_cycles_total{{task="{name}"')]
+    assert len(cycles) == 1 and int(cycles[0].split()[-1]) > 5
+    assert f'curiousksp_task_cycle_seconds_count{{task="{name}"}}' in body
+    assert 'curiousksp_tasks{state="READY"}' in body or 'curiousksp_tasks{state="RUNNING"}' in body
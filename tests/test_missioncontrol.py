@@ -0,0 +1,35 @@
+"""[pytest] Tests for curiousksp.missioncontrol against the stand-in kRPC server."""
+import curio
+
+from curiousksp.missioncontrol import MissionControl
+from curiousksp.standin import StandInServer
+
+
+def test_telemetry_streams_move_to_a_new_connection_after_a_restart():
+    """Check the telemetry subscribers get updates again once KSP (the stand-in server) has been restarted."""
+    async def main():
+        server = await StandInServer().add_space_center().start()
+        mc = MissionControl(name="test", krpc_port=server.port, krpcs_port=server.stream_port, metrics_port=0)
+        mc._signal_handler.sigint = curio.Event().wait
+        start = await curio.spawn(mc.start)
+        while mc._telemetry is None:
+            await curio.sleep(0.01)
+        await mc._telemetry.register("test.status", "krpc.get_status", rate=50)
+        updates = mc._telemetry.subscribe("test.status")
+        first = mc._telemetry.conn
+        async with curio.timeout_after(2):
+            await updates.get()
+        await server.stop()
+        server = await StandInServer(port=server.port, stream_port=server.stream_port).add_space_center().start()
+        while not updates.empty():
+            await updates.get()
+        async with curio.timeout_after(5):
+            status = await updates.get()
+        second = mc._telemetry.conn
+        await start.cancel()
+        await server.stop()
+        return mc, status, first, second
+
+    mc, status, first, second = curio.run(main)
+    assert status.version == "standin" and second is not first
+    assert mc._link.connects == 2 and mc._pool.discarded >= 1
@@ -0,0 +1,79 @@
+"""[pytest] Tests for curiousksp.orbits, validated against the stand-in kRPC server's scalar propagation."""
+import math
+
+import curio
+import numpy as np
+
+from curiousksp import asynkrpc
+from curiousksp.orbits import Orbits, solve_kepler
+from curiousksp.standin import StandInServer
+
+KERBIN_MU = 3.5316e12
+
+
+def test_solve_kepler_and_conservation():
+    """Check the anomalies solve Kepler's equation and the propagated states keep their energy and momentum."""
+    m = np.linspace(-20, 20, 101)
+    for e in (0.0, 0.3, 0.95, 0.999):
+        anomaly = solve_kepler(m, e)
+        wrapped = np.remainder(m + np.pi, 2 * np.pi) - np.pi
+        assert np.allclose(anomaly - e * np.sin(anomaly), wrapped, atol=1e-10)
+    for e in (1.2, 3.0):
+        anomaly = solve_kepler(m, e)
+        assert np.allclose(e * np.sinh(anomaly) - anomaly, m, atol=1e-9)
+    # an inclined ellipse and an escape trajectory around Kerbin, over ten hours
+    orbits = Orbits([(900e3, 0.2, 0.5, 1.0, 2.0, 0.3, 0.0, KERBIN_MU),
+                     (-2e6, 1.5, 0.1, 0.0, 0.5, 0.0, 100.0, KERBIN_MU)])
+    positions, velocities = orbits.state(np.linspace(0, 36000, 500))
+    assert positions.shape == velocities.shape == (2, 500, 3)
+    r, v = np.linalg.norm(positions, axis=-1), np.linalg.norm(velocities, axis=-1)
+    energy = v ** 2 / 2 - KERBIN_MU / r
+    assert np.allclose(energy, -KERBIN_MU / (2 * orbits.elements["a"][:, None]), rtol=1e-9)
+    momentum = np.cross(positions, velocities)
+    assert np.allclose(momentum, momentum[:, :1], rtol=1e-9, atol=1e-9 * np.abs(momentum).max())
+    # a circular equatorial orbit comes back round after a period, moving in the x/z plane
+    circular = Orbits([(700e3, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, KERBIN_MU)])
+    period = 2 * math.pi * math.sqrt(700e3 ** 3 / KERBIN_MU)
+    start, end = circular.positions([0.0, period])[0]
+    assert np.allclose(start, [700e3, 0, 0]) and np.allclose(end, start, atol=1e-3)
+    assert np.allclose(circular.positions(np.linspace(0, period, 7))[0, :, 1], 0)
+
+
+def _server():
+    server = StandInServer().add_space_center()
+    sc = server.space_center
+    sc["bodies"][2] = {"name": "Mun", "mu": 6.5138398e10, "orbit": 2}
+    sc["orbits"][1].update(a=750e3, e=0.05, inc=0.4, lan=2.0, argp=1.0, m0=0.5, epoch=10.0)
+    sc["orbits"][2] = {"body": 1, "a": 12e6, "e": 0.0, "inc": 0.0, "lan": 0.0, "argp": 0.0, "m0": 1.7, "epoch": 0.0}
+    sc["orbits"][3] = {"body": 1, "a": 6e6, "e": 0.88, "inc": 0.05, "lan": 0.3, "argp": 0.2, "m0": -1.0, "epoch": 0.0}
+    sc["orbits"][4] = {"body": 2, "a": -300e3, "e": 1.4, "inc": 1.2, "lan": 4.0, "argp": 3.0, "m0": -2.0, "epoch": 5.0}
+    for v, orbit in ((2, 3), (3, 4)):
+        sc["vessels"][v] = dict(sc["vessels"][1], name=f"vessel {v}", orbit=orbit)
+    return server
+
+
+def test_fetch_and_validate_against_the_server():
+    """Check a batch of orbits is fetched in a few requests and propagates to the server's positions and speeds."""
+    async def main():
+        server = await _server().start()
+        client = await asynkrpc.connect("test", rpc_port=server.port)
+        requests = client.requests
+        vessels = await client.invoke("SpaceCenter", "get_Vessels")
+        orbits = await Orbits.of(client, vessels)
+        bodies = [client.remote_object("SpaceCenter", "CelestialBody", b) for b in (1, 2)]
+        moons = await Orbits.of(client, bodies, kind="CelestialBody")
+        fetch_requests = client.requests - requests
+        errors = await orbits.validate(client, np.linspace(0, 20000, 9))
+        moon_errors = await moons.validate(client, [0.0, 1e5])
+        await client.close()
+        await server.stop()
+        return orbits, moons, fetch_requests, errors, moon_errors
+
+    orbits, moons, fetch_requests, errors, moon_errors = curio.run(main)
+    assert orbits.names == ["Untitled Space Craft", "vessel 2", "vessel 3"] and moons.names == ["Mun"]
+    # the vessel list, then orbits and names, elements and the bodies' gravitational parameters for each batch
+    assert fetch_requests == 1 + 3 + 3
+    assert orbits.elements["mu"][2] == np.float32(6.5138398e10)
+    # kRPC sends gravitational parameters as floats: ~1e-8 relative error in the mean motion, 0.2 m after 5 h
+    assert errors["position"] < 1.0 and errors["speed"] < 1e-3
+    assert moon_errors["position"] < 1.0 and moon_errors["speed"] < 1e-3
@@ -0,0 +1,95 @@
+"""[pytest] Tests for curiousksp.tasks.parts against the stand-in kRPC server's parts model."""
+import curio
+
+from curiousksp import asynkrpc
+from curiousksp.standin import StandInServer
+from curiousksp.tasks import PartTree
+
+# part id -> (title, tag, stage, decouple stage, parent, modules, resources)
+CRAFT = {
+    10: ("Mk1 Pod", "pod", -1, -1, 0, ["ModuleCommand"], ["ElectricCharge"]),
+    11: ("Parachute", "", 0, -1, 10, ["ModuleParachute"], []),
+    12: ("Decoupler", "", 1, 1, 10, ["ModuleDecouple"], []),
+    13: ("FL-T400 Tank", "booster", -1, 1, 12, [], ["LiquidFuel", "Oxidizer"]),
+    14: ("LV-T45 Engine", "booster", 2, 1, 13, ["ModuleEnginesFX", "ModuleGimbal"], []),
+}
+
+
+def _server():
+    server = StandInServer().add_space_center()
+    sc = server.space_center
+    sc["vessels"][1]["stage"] = 3
+    modules = iter(range(100, 200))
+    for pid, (title, tag, stage, decouple, parent, mods, resources) in CRAFT.items():
+        ids = [next(modules) for _ in mods]
+        sc["modules"].update(zip(ids, mods))
+        sc["parts"][pid] = {"vessel": 1, "title": title, "name": title.lower(), "tag": tag, "stage": stage,
+                            "decouple_stage": decouple, "parent": parent, "modules": ids, "resources": resources}
+    return server
+
+
+def test_snapshot_indexes_and_staging():
+    """Check the snapshot takes a handful of requests, queries are local and staging patches the tree."""
+    async def main():
+        server = await _server().start()
+        client = await asynkrpc.connect("test", rpc_port=server.port)
+        vessel = client.remote_object("SpaceCenter", "Vessel", 1)
+        tree = PartTree(client, vessel)
+        requests = client.requests
+        await tree.refresh()
+        snapshot_requests = client.requests - requests
+        requests = client.requests
+        found = {
+            "engines in stage 2": [p.title for p in tree.find(module="ModuleEngines*", stage=2)],
+            "boosters": [p.title for p in tree.find(tag="booster")],
+            "fuel": [p.title for p in tree.find(resource="LiquidFuel")],
+            "decoupled at 1": [p.id for p in tree.find(decouple_stage=1)],
+            "below decoupler": sorted(p.id for p in tree.subtree(12)),
+            "root": tree.root.title,
+        }
+        query_requests = client.requests - requests
+        control = await client.invoke("SpaceCenter", "Vessel_get_Control", vessel)
+        for _ in range(2):
+            await client.invoke("SpaceCenter", "Control_ActivateNextStage", control)
+        await tree.refresh()
+        await client.close()
+        await server.stop()
+        return tree, snapshot_requests, query_requests, found
+
+    tree, snapshot_requests, query_requests, found = curio.run(main)
+    assert snapshot_requests == 4 and query_requests == 0
+    assert found == {"engines in stage 2": ["LV-T45 Engine"], "boosters": ["FL-T400 Tank", "LV-T45 Engine"],
+                     "fuel": ["FL-T400 Tank"], "decoupled at 1": [12, 13, 14], "below decoupler": [12, 13, 14],
+                     "root": "Mk1 Pod"}
+    # the booster was dropped, nothing was fetched again
+    assert sorted(p.id for p in tree) == [10, 11]
+    assert tree.find(tag="booster") == [] and "booster" not in tree.keys("tag")
+    assert tree[10].children == {11}
+    assert (tree.fetched, tree.added, tree.removed) == (5, 5, 3)
+
+
+def test_watch_patches_on_part_changes():
+    """Check watch patches the tree when staging drops parts and when a decouple does without advancing the stage."""
+    async def main():
+        server = await _server().start()
+        client = await asynkrpc.connect("test", rpc_port=server.port)
+        vessel = client.remote_object("SpaceCenter", "Vessel", 1)
+        tree = PartTree(client, vessel)
+        watch = await curio.spawn(tree.watch, 0.01, daemon=True)
+        await curio.sleep(0.05)
+        counts = [len(tree)]
+        server.space_center["vessels"][1]["stage"] = 1
+        del server.space_center["parts"][14]
+        await curio.sleep(0.05)
+        counts.append(len(tree))
+        # Decoupler.Decouple/DockingPort.Undock - parts leave, the current stage stays where it was
+        del server.space_center["parts"][13]
+        await curio.sleep(0.05)
+        counts.append(len(tree))
+        await watch.cancel()
+        await client.close()
+        await server.stop()
+        return tree, counts
+
+    tree, counts = curio.run(main)
+    assert counts == [5, 4, 3] and tree.refreshes == 3 and tree.fetched == 5
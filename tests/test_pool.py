@@ -0,0 +1,66 @@
+"""[pytest] Tests for curiousksp.pool."""
+from types import SimpleNamespace
+
+import curio
+
+from curiousksp.pool import ConnectionPool
+
+
+class FakeConn:
+    """Stand-in for krpc.client.Client that can be made to fail its health check."""
+
+    def __init__(self, name):
+        self.name, self.closed, self.healthy = name, False, True
+        self.krpc = SimpleNamespace(get_client_id=self._get_client_id)
+
+    def _get_client_id(self):
+        if not self.healthy:
+            raise ConnectionResetError("gone")
+        return b"id"
+
+    def close(self):
+        self.closed = True
+
+
+async def _fake_connect(name):
+    return FakeConn(name)
+
+
+def test_checkout_reuses_and_health_checks():
+    """Check that checked in connections are reused and unhealthy ones are replaced on checkout."""
+    pool = ConnectionPool(_fake_connect, maxsize=2, check_after=0)
+
+    async def main():
+        a = await pool.checkout()
+        await pool.checkin(a)
+        assert await pool.checkout() is a
+        a.conn.healthy = False
+        await pool.checkin(a)
+        b = await pool.checkout()
+        assert b is not a and a.conn.closed
+        # the checked out connections make their RPCs on their executor threads
+        assert await b.krpc.get_client_id() == b"id"
+        await pool.checkin(b)
+        await pool.close()
+        return a, b
+
+    a, b = curio.run(main)
+    assert (pool.opened, pool.reused, pool.discarded) == (2, 1, 1)
+    assert b.conn.closed and pool.idle == 0 and pool.in_use == 0
+    assert not a.executor._thread.is_alive() and not b.executor._thread.is_alive()
+
+
+def test_pool_is_bounded_and_reaps_idle():
+    """Check that checkout waits for a free slot and that long-idle connections are evicted."""
+    pool = ConnectionPool(_fake_connect, maxsize=1, max_idle=0)
+
+    async def main():
+        async with pool.connection() as a:
+            assert await curio.ignore_after(0.05, pool.checkout()) is None
+        assert pool.idle == 1
+        await curio.sleep(0.01)
+        await pool.reap()
+        return a
+
+    a = curio.run(main)
+    assert a.conn.closed and pool.idle == 0
@@ -0,0 +1,101 @@
+"""[pytest] Tests for curiousksp.propcache."""
+import time
+
+import curio
+
+from curiousksp.propcache import PropertyCache
+
+
+class FakeClient:
+    """A client whose invoke answers from a dict of procedure -> value, counting the RPCs made."""
+
+    def __init__(self, **values):
+        self.values = values
+        self.rpcs = []
+
+    async def invoke(self, service, procedure, *args):
+        self.rpcs.append(procedure)
+        await curio.sleep(0.001)
+        value = self.values[procedure]
+        return value(*args) if callable(value) else value
+
+
+def test_hits_misses_and_ttl(monkeypatch):
+    """Check cached reads are answered from memory until their TTL runs out, uncached reads always make an RPC."""
+    client = FakeClient(Vessel_get_Name=lambda v: f"vessel {v}", get_UT=1.0)
+    cache = PropertyCache(client)
+
+    async def main():
+        names = [await cache.invoke("SpaceCenter", "Vessel_get_Name", v) for v in (1, 1, 2, 1)]
+        for _ in range(3):
+            await cache.invoke("SpaceCenter", "get_UT")
+        # jump past the 10s TTL of the vessel name
+        now = time.monotonic() + 11
+        monkeypatch.setattr(time, "monotonic", lambda: now)
+        await cache.invoke("SpaceCenter", "Vessel_get_Name", 1)
+        return names
+
+    assert curio.run(main) == ["vessel 1", "vessel 1", "vessel 2", "vessel 1"]
+    assert client.rpcs.count("Vessel_get_Name") == 3 and client.rpcs.count("get_UT") == 3
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 3
+
+
+def test_lru_bound_and_shared_misses():
+    """Check the least recently used value is evicted at maxsize and concurrent misses share one RPC."""
+    client = FakeClient(CelestialBody_get_Mass=lambda b: b * 1e20)
+    cache = PropertyCache(client, maxsize=2)
+
+    async def main():
+        async with curio.TaskGroup(wait=all) as g:
+            for _ in range(5):
+                await g.spawn(cache.invoke, "SpaceCenter", "CelestialBody_get_Mass", 1)
+        for body in (2, 1, 3, 1, 2):
+            await cache.invoke("SpaceCenter", "CelestialBody_get_Mass", body)
+        return g.results
+
+    assert curio.run(main) == [1e20] * 5
+    # body 1 fetched once by 5 Tasks, 2 and 3 once, then 2 again after being evicted by 3
+    assert client.rpcs.count("CelestialBody_get_Mass") == 4
+    assert cache.evictions == 2 and len(cache) == 2
+
+
+def test_events_invalidate_dependent_values():
+    """Check staging through the cache drops the part lists but keeps the body constants and game mode."""
+    client = FakeClient(Parts_get_All=lambda p: ["engine", "tank"], CelestialBody_get_Mass=5.3e22,
+                        get_GameMode="career", Control_ActivateNextStage=lambda c: [])
+    cache = PropertyCache(client)
+
+    async def main():
+        for _ in range(2):
+            await cache.invoke("SpaceCenter", "Parts_get_All", 7)
+            await cache.invoke("SpaceCenter", "CelestialBody_get_Mass", 1)
+            await cache.invoke("SpaceCenter", "get_GameMode")
+            await cache.invoke("SpaceCenter", "Control_ActivateNextStage", 9)
+
+    curio.run(main)
+    assert client.rpcs.count("Parts_get_All") == 2
+    assert client.rpcs.count("CelestialBody_get_Mass") == client.rpcs.count("get_GameMode") == 1
+    # the part list, once per staging
+    assert cache.invalidations == 2
+
+
+def test_watch_invalidates_on_vessel_switch():
+    """Check watch notices the active vessel changing and drops the values that depend on it."""
+    client = FakeClient(get_CurrentGameScene=1, get_ActiveVessel=1, Vessel_get_Control=lambda v: v + 100,
+                        Control_get_CurrentStage=3, Vessel_get_Name=lambda v: f"vessel {v}",
+                        CelestialBody_get_Name="Kerbin")
+    cache = PropertyCache(client)
+
+    async def main():
+        watch = await curio.spawn(cache.watch, 0.01, daemon=True)
+        await cache.invoke("SpaceCenter", "Vessel_get_Name", 1)
+        await cache.invoke("SpaceCenter", "CelestialBody_get_Name", 1)
+        await curio.sleep(0.05)
+        assert len(cache) == 3
+        client.values["get_ActiveVessel"] = 2
+        await curio.sleep(0.05)
+        await watch.cancel()
+
+    curio.run(main)
+    # the vessel's name and control went, Kerbin's name and the new vessel's control are cached
+    assert cache.invalidations == 2 and len(cache) == 2
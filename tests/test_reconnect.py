@@ -0,0 +1,130 @@
+"""[pytest] Tests for curiousksp.reconnect against the stand-in kRPC server."""
+import curio
+import pytest
+
+from curiousksp import asynkrpc
+from curiousksp.reconnect import Backoff, Reconnector, dial, reachable
+from curiousksp.standin import StandInServer
+
+
+async def _free_port():
+    """Task: return a port that nothing is listening on (any more)."""
+    server = await StandInServer().start()
+    await server.stop()
+    return server.port
+
+
+def test_backoff_grows_to_its_cap_with_jitter():
+    """Check the delays double from initial up to maximum, jittered below the undrawn delay, and reset."""
+    backoff = Backoff(initial=0.01, maximum=0.05, jitter=0.5)
+    delays = [backoff.next() for _ in range(6)]
+    for delay, cap in zip(delays, [0.01, 0.02, 0.04, 0.05, 0.05, 0.05]):
+        assert cap * 0.5 <= delay <= cap
+    backoff.reset()
+    assert backoff.next() <= 0.01
+    assert Backoff(initial=0.01, jitter=0).next() == 0.01
+
+
+def test_dial_picks_up_a_server_that_starts_late():
+    """Check dial retries a refused port fast enough to connect within moments of the server starting."""
+    async def main():
+        port = await _free_port()
+
+        async def start_later():
+            await curio.sleep(0.2)
+            return await StandInServer(port=port).start(), await curio.clock()
+
+        starter = await curio.spawn(start_later)
+        assert not await reachable("127.0.0.1", port)
+        client = await dial(asynkrpc.connect, "test", rpc_port=port, backoff=Backoff(maximum=0.02))
+        connected = await curio.clock()
+        server, started = await starter.join()
+        await client.close()
+        await server.stop()
+        return connected - started
+
+    assert curio.run(main) < 0.1
+
+
+def test_dial_gives_up_after_attempts():
+    """Check dial raises the last error once it has made attempts attempts."""
+    async def main():
+        port = await _free_port()
+        await dial(asynkrpc.connect, "test", rpc_port=port, attempts=3, backoff=Backoff(initial=0.001))
+
+    with pytest.raises(ConnectionRefusedError):
+        curio.run(main)
+
+
+def test_reconnector_redials_after_the_server_restarts():
+    """Check calls through a Reconnector wait out a server restart and carry on, on the new connection."""
+    async def main():
+        server = await StandInServer().add_space_center().start()
+        link = await Reconnector("test", rpc_port=server.port, probe_interval=0.05).start()
+        first = await link.get()
+        funds = await link.invoke("SpaceCenter", "get_Funds")
+        await server.stop()
+        # the probe notices within an interval
+        await curio.sleep(0.2)
+        assert not link.connected
+        server = await StandInServer(port=server.port).add_space_center().start()
+        again = await link.invoke("SpaceCenter", "get_Funds")
+        second = await link.get()
+        await link.close()
+        await server.stop()
+        return link, funds, again, first is not second
+
+    link, funds, again, replaced = curio.run(main)
+    assert funds == again == 25000.0 and replaced
+    assert link.connects == 2 and link.probe_failures == 1
+    assert link.outages.count == 1 and link.outages.max < 1.0
+
+
+def test_reconnector_retries_calls_in_flight_on_a_hung_connection():
+    """Check a call stuck on a connection that fails its probe is retried on the new connection rather than hanging."""
+    calls = []
+
+    async def hangs_once():
+        calls.append(True)
+        if len(calls) == 1:
+            await curio.sleep(5)
+        return len(calls)
+
+    async def main():
+        server = StandInServer()
+        server.add_procedure("Test", "HangsOnce", hangs_once, return_type=server.types.sint32_type)
+        await server.start()
+        link = await Reconnector("test", rpc_port=server.port, probe_interval=0.05, probe_timeout=0.1).start()
+        async with curio.timeout_after(2):
+            value = await link.invoke("Test", "HangsOnce")
+        await link.close()
+        await server.stop()
+        return link, value
+
+    link, value = curio.run(main)
+    assert value == 2 and link.connects == 2 and link.probe_failures == 1
+
+
+def test_reconnector_redials_after_an_unexpected_error():
+    """Check a dial failing with an error other than a connection error is retried, not the end of the Reconnector."""
+    async def main():
+        server = await StandInServer().add_space_center().start()
+        get_services, *rest = server._procedures[("KRPC", "GetServices")]
+        calls = []
+
+        def fails_once():
+            calls.append(True)
+            if len(calls) == 1:
+                raise ValueError("schema unavailable")
+            return get_services()
+
+        server._procedures[("KRPC", "GetServices")] = (fails_once, *rest)
+        link = await Reconnector("test", rpc_port=server.port, backoff=Backoff(initial=0.001)).start()
+        async with curio.timeout_after(2):
+            funds = await link.invoke("SpaceCenter", "get_Funds")
+        await link.close()
+        await server.stop()
+        return link, funds, len(calls)
+
+    link, funds, calls = curio.run(main)
+    assert funds == 25000.0 and calls == 2 and link.connects == 1
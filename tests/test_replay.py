@@ -0,0 +1,116 @@
+"""[pytest] Tests for curiousksp.replay - recording a stand-in server session and replaying it."""
+import socket
+import struct
+
+import curio
+import pytest
+import krpc.schema.KRPC_pb2 as KRPC
+from krpc.error import RPCError
+
+from curiousksp import asynkrpc
+from curiousksp.asynkrpc import receive_frame, receive_message, send_message
+from curiousksp.replay import RPC, STREAM, TO_CLIENT, TO_SERVER, RecordingProxy, ReplayServer, SessionWriter, \
+    read_session
+from curiousksp.standin import StandInServer
+
+
+def test_record_then_replay_rpc_session(tmp_path):
+    """Check a session recorded through the proxy replays the same responses and client id without the server."""
+    path = tmp_path / "session.krpc"
+
+    async def record():
+        server = await StandInServer().start()
+        sint32 = server.types.sint32_type
+        server.add_procedure("Test", "Add", lambda a, b: a + b, params=[sint32, sint32], return_type=sint32)
+        proxy = await RecordingProxy(path, rpc_port=server.port).start()
+        async with await asynkrpc.connect("rec", rpc_port=proxy.rpc_port) as client:
+            recorded = (client.client_id, await client.invoke("Test", "Add", 2, 3), await client.get_status())
+        await proxy.stop()
+        await server.stop()
+        return recorded
+
+    async def replay():
+        server = await ReplayServer(path, speed=0).start()
+        async with await asynkrpc.connect("rec", rpc_port=server.rpc_port) as client:
+            replayed = (client.client_id, await client.invoke("Test", "Add", 2, 3), await client.get_status())
+            with pytest.raises(RPCError, match="not in the kRPC recording"):
+                await client.invoke("Test", "Add", 4, 5)
+        await server.stop()
+        return replayed, server.misses
+
+    recorded = curio.run(record)
+    assert {channel for _, _, channel, _, _ in read_session(path)} == {RPC}
+    replayed, misses = curio.run(replay)
+    assert replayed == recorded and misses == 1
+
+
+def test_replay_stream_updates_paced_by_speed(tmp_path):
+    """Check the stream updates of a client id are pushed at their recorded offsets divided by the speed."""
+    path = tmp_path / "stream.krpc"
+
+    async def write():
+        writer = SessionWriter(path)
+        writer.record(1, RPC, TO_SERVER, KRPC.ConnectionRequest(type=KRPC.ConnectionRequest.RPC).SerializeToString())
+        writer.record(1, RPC, TO_CLIENT, KRPC.ConnectionResponse(client_identifier=b"id").SerializeToString())
+        writer.record(2, STREAM, TO_SERVER, KRPC.ConnectionRequest(type=KRPC.ConnectionRequest.STREAM,
+                                                                   client_identifier=b"id").SerializeToString())
+        writer.record(2, STREAM, TO_CLIENT, KRPC.ConnectionResponse(client_identifier=b"id").SerializeToString())
+        await curio.sleep(0.2)
+        for i in range(3):
+            writer.record(2, STREAM, TO_CLIENT, KRPC.StreamUpdate().SerializeToString() + bytes([i]))
+        await writer.close()
+
+    async def replay():
+        server = await ReplayServer(path, speed=4).start()
+        sock = await curio.open_connection("127.0.0.1", server.stream_port)
+        async with sock:
+            stream = sock.as_stream()
+            await send_message(stream, KRPC.ConnectionRequest(type=KRPC.ConnectionRequest.STREAM,
+                                                              client_identifier=b"id"))
+            assert (await receive_message(stream, KRPC.ConnectionResponse)).client_identifier == b"id"
+            start = await curio.clock()
+            updates = [await receive_frame(stream) for _ in range(3)]
+            elapsed = await curio.clock() - start
+        await server.stop()
+        return updates, elapsed
+
+    curio.run(write)
+    updates, elapsed = curio.run(replay)
+    assert updates == [bytes([0]), bytes([1]), bytes([2])]
+    # recorded 0.2 s in, at 4x speed
+    assert 0.04 <= elapsed < 0.2
+
+
+def test_client_resetting_mid_replay_ends_its_session(tmp_path, caplog):
+    """Check a client resetting its connection mid-replay ends its session cleanly, others are still served."""
+    path = tmp_path / "session.krpc"
+
+    async def record():
+        server = await StandInServer().start()
+        proxy = await RecordingProxy(path, rpc_port=server.port).start()
+        async with await asynkrpc.connect("rec", rpc_port=proxy.rpc_port) as client:
+            await client.get_status()
+        await proxy.stop()
+        await server.stop()
+
+    async def replay():
+        server = await ReplayServer(path, speed=0).start()
+        sock = await curio.open_connection("127.0.0.1", server.rpc_port)
+        stream = sock.as_stream()
+        await send_message(stream, KRPC.ConnectionRequest(type=KRPC.ConnectionRequest.RPC, client_name="rec"))
+        await receive_message(stream, KRPC.ConnectionResponse)
+        request = KRPC.Request()
+        request.calls.add(service="KRPC", procedure="GetStatus")
+        await send_message(stream, request)
+        # close with a reset rather than a FIN
+        sock._socket.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        await sock.close()
+        await curio.sleep(0.05)
+        async with await asynkrpc.connect("rec", rpc_port=server.rpc_port) as client:
+            status = await client.get_status()
+        await server.stop()
+        return status
+
+    curio.run(record)
+    assert curio.run(replay).version == "standin"
+    assert not [r for r in caplog.records if "Task Crash" in r.getMessage()]
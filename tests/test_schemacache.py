@@ -0,0 +1,89 @@
+"""[pytest] Tests for curiousksp.schemacache against the stand-in kRPC server."""
+import os
+import time
+
+import curio
+import krpc.schema.KRPC_pb2 as KRPC
+
+from curiousksp import asynkrpc, schemacache
+from curiousksp.schemacache import SchemaCache
+from curiousksp.standin import StandInServer
+
+
+def _counting_server():
+    """Return a stand-in server (not started) and the list its KRPC.GetServices calls are appended to."""
+    server = StandInServer().add_space_center(["get_UT"])
+    fetches = []
+    get_services = server._get_services
+
+    def counted():
+        fetches.append(True)
+        return get_services()
+
+    server.add_procedure("KRPC", "GetServices", counted, return_type=server.types.services_type)
+    return server, fetches
+
+
+def test_store_and_load(tmp_path):
+    """Check schemas round-trip per version, replace the version's stale file and expire after max_age."""
+    cache = SchemaCache(str(tmp_path))
+    old = KRPC.Services(services=[KRPC.Service(name="Old")])
+    new = KRPC.Services(services=[KRPC.Service(name="New")])
+    assert cache.load("1.0") == (None, None)
+    digest = cache.store("1.0", old)
+    cache.store("2.0", old)
+    assert cache.load("1.0") == (old, digest)
+    assert cache.store("1.0", new) != digest
+    assert cache.load("1.0")[0] == new and cache.load("2.0")[0] == old
+    assert len(os.listdir(tmp_path)) == 2
+    # an old file is ignored, a corrupt one too
+    path, = cache._files("2.0")
+    os.utime(path, (time.time() - 10, time.time() - 10))
+    assert SchemaCache(str(tmp_path), max_age=5).load("2.0") == (None, None)
+    with open(cache._files("1.0")[0], "wb") as f:
+        f.write(b"\xff\xff")
+    assert cache.load("1.0") == (None, None)
+
+
+def test_native_connect_uses_the_cache(tmp_path):
+    """Check a native client downloads the schema once, then loads it from the cache - refreshed if it changed."""
+    async def main():
+        server, fetches = _counting_server()
+        await server.start()
+        cache = SchemaCache(str(tmp_path))
+        for _ in range(3):
+            client = await asynkrpc.connect("test", rpc_port=server.port, schema_cache=cache)
+            assert await client.invoke("SpaceCenter", "get_UT") >= 0
+            await client.close()
+        cached = len(fetches)
+        # a new session against a server whose schema changed: served from the cache, then refreshed
+        server.add_space_center(["get_Funds"])
+        client = await asynkrpc.connect("test", rpc_port=server.port, schema_cache=SchemaCache(str(tmp_path)))
+        assert ("SpaceCenter", "get_Funds") not in client.procedures
+        await curio.sleep(0.05)
+        funds = await client.invoke("SpaceCenter", "get_Funds")
+        await client.close()
+        await server.stop()
+        return cache, cached, fetches, funds
+
+    cache, cached, fetches, funds = curio.run(main)
+    assert cached == 1 and cache.hits == 2 and cache.misses == 1
+    assert len(fetches) == 2 and funds == 25000.0
+
+
+def test_stock_connect_uses_the_cache(tmp_path):
+    """Check the stock krpc client of schemacache.connect downloads the schema once, then loads it from the cache."""
+    async def main():
+        server, fetches = _counting_server()
+        await server.start()
+        cache = SchemaCache(str(tmp_path))
+        for _ in range(2):
+            conn = await curio.run_in_thread(lambda: schemacache.connect("test", rpc_port=server.port,
+                                                                         stream_port=server.stream_port, cache=cache))
+            ut = await curio.run_in_thread(lambda: conn.space_center.ut)
+            await curio.run_in_thread(conn.close)
+        await server.stop()
+        return cache, fetches, ut
+
+    cache, fetches, ut = curio.run(main)
+    assert len(fetches) == 1 and cache.hits == 1 and ut >= 0
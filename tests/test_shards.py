@@ -0,0 +1,94 @@
+"""[pytest] Tests for curiousksp.shards - the worker processes connect to a stand-in kRPC server."""
+import os
+
+import curio
+
+from curiousksp.shards import ShardSupervisor, shard_of
+from curiousksp.standin import StandInServer
+
+
+async def vessel_name(manager):
+    """Return the name of the manager's vessel and the pid of the worker running it."""
+    name = await manager.conn.invoke("SpaceCenter", "Vessel_get_Name", manager.vessel)
+    await manager.publish("name", name)
+    return name, os.getpid()
+
+
+async def nap(manager):
+    """Take longer than the caller is willing to wait."""
+    await curio.sleep(0.5)
+
+
+async def crash(manager):
+    """Kill the worker process."""
+    os._exit(3)
+
+
+def _server():
+    server = StandInServer().add_space_center()
+    server.space_center["vessels"] = {v: {"name": f"vessel {v}", "mass": 1.0, "thrust": 0.0} for v in range(1, 5)}
+    return server
+
+
+def test_shard_of_spreads_vessels():
+    """Check vessels are spread evenly over the shards."""
+    assert [shard_of(v, 2) for v in range(1, 5)] == [1, 0, 1, 0]
+
+
+def test_commands_run_in_the_vessels_worker():
+    """Check commands run on the VesselManager of their vessel in its shard's worker process, publishing telemetry."""
+    async def main():
+        server = await _server().start()
+        supervisor = await ShardSupervisor(2, rpc_port=server.port).start()
+        await supervisor.assign(1, 2, 3, 4)
+        await supervisor.wait_ready()
+        results = {v: await supervisor.command(v, vessel_name) for v in range(1, 5)}
+        updates = [await supervisor.updates.get() for _ in range(4)]
+        await supervisor.stop()
+        await server.stop()
+        return supervisor, results, updates
+
+    supervisor, results, updates = curio.run(main)
+    assert {v: name for v, (name, _) in results.items()} == {v: f"vessel {v}" for v in range(1, 5)}
+    pids = {v: pid for v, (_, pid) in results.items()}
+    assert pids[1] == pids[3] != pids[2] == pids[4] and os.getpid() not in pids.values()
+    assert sorted(updates) == [(v, "name", f"vessel {v}") for v in range(1, 5)]
+    assert supervisor.restarts == 0
+    assert not any(shard.process.is_alive() for shard in supervisor.shards)
+
+
+def test_crashed_worker_is_restarted():
+    """Check a worker that crashes fails its command and is restarted with its vessels reassigned."""
+    async def main():
+        server = await _server().start()
+        supervisor = await ShardSupervisor(1, rpc_port=server.port, restart_delay=0).start()
+        await supervisor.assign(1)
+        try:
+            await supervisor.command(1, crash)
+        except RuntimeError as e:
+            error = e
+        name, _ = await supervisor.command(1, vessel_name)
+        await supervisor.stop()
+        await server.stop()
+        return supervisor, error, name
+
+    supervisor, error, name = curio.run(main)
+    assert "exited" in str(error)
+    assert name == "vessel 1"
+    assert supervisor.restarts == 1 and supervisor.shards[0].restarts == 1
+
+
+def test_abandoned_command_is_forgotten():
+    """Check a command whose caller gives up on it leaves nothing pending for its shard."""
+    async def main():
+        server = await _server().start()
+        supervisor = await ShardSupervisor(1, rpc_port=server.port).start()
+        await supervisor.assign(1)
+        await supervisor.wait_ready()
+        abandoned = await curio.ignore_after(0.1, supervisor.command(1, nap))
+        pending = len(supervisor.shards[0].pending)
+        await supervisor.stop()
+        await server.stop()
+        return abandoned, pending
+
+    assert curio.run(main) == (None, 0)
@@ -0,0 +1,105 @@
+"""[pytest] Tests for curiousksp.signalling - the Ctrl-C shutdown prompt mustn't block the kernel."""
+import os
+import signal
+
+import curio
+import pytest
+
+from curiousksp.signalling import ConsoleReader, SignalHandler
+
+
+@pytest.fixture
+def console():
+    """Yield a ConsoleReader of a pipe and the fd to type into it, restoring the SIGINT handler afterwards."""
+    r, w = os.pipe()
+    stream = open(r, encoding="utf8")
+    reader = ConsoleReader(stream)
+    yield reader, w
+    # end the stream for the reader thread before closing it
+    os.close(w)
+    if reader._thread:
+        reader._thread.join()
+    stream.close()
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+
+def _run(handler, script):
+    """Run handler.sigint alongside script(handler) and a ticker, returning the ticks counted while script ran."""
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await curio.sleep(0.005)
+            ticks += 1
+
+    async def main():
+        sigint = await curio.spawn(handler.sigint, daemon=True)
+        tick = await curio.spawn(ticker, daemon=True)
+        await script(handler)
+        await tick.cancel()
+        await sigint.cancel()
+        return ticks
+
+    return curio.run(main)
+
+
+def test_prompt_keeps_the_kernel_running(console):
+    """Check other Tasks are scheduled while the prompt waits, and a yes shuts down."""
+    reader, w = console
+    shutdowns = []
+
+    async def shutdown():
+        shutdowns.append(True)
+
+    async def script(handler):
+        os.write(w, b"typed before the prompt\n")
+        await curio.sleep(0.01)
+        handler._handle_sigint(signal.SIGINT, None)
+        await curio.sleep(0.1)
+        assert not shutdowns
+        os.write(w, b"Yes\n")
+        await curio.sleep(0.05)
+
+    ticks = _run(SignalHandler(shutdown, console=reader), script)
+    assert shutdowns == [True]
+    assert ticks > 10
+
+
+def test_prompt_declines_after_timeout(console):
+    """Check an unanswered prompt declines the shutdown after confirm_timeout, and a no declines it too."""
+    reader, w = console
+    shutdowns = []
+
+    async def shutdown():
+        shutdowns.append(True)
+
+    async def script(handler):
+        handler._handle_sigint(signal.SIGINT, None)
+        await curio.sleep(0.1)
+        handler._handle_sigint(signal.SIGINT, None)
+        await curio.sleep(0.01)
+        os.write(w, b"n\n")
+        await curio.sleep(0.05)
+
+    _run(SignalHandler(shutdown, confirm_timeout=0.05, console=reader), script)
+    assert shutdowns == []
+
+
+@pytest.mark.parametrize("mode, shutdowns", [("ask soft", [True]), ("ask", [])])
+def test_second_ctrl_c_at_the_prompt(console, mode, shutdowns):
+    """Check a second Ctrl-C while the prompt is open shuts down in 'ask soft' mode only."""
+    reader, _ = console
+    done = []
+
+    async def shutdown():
+        done.append(True)
+
+    async def script(handler):
+        handler._handle_sigint(signal.SIGINT, None)
+        await curio.sleep(0.02)
+        handler._handle_sigint(signal.SIGINT, None)
+        await curio.sleep(0.02)
+
+    _run(SignalHandler(shutdown, shutdown_mode=mode, console=reader), script)
+    assert done == shutdowns
@@ -0,0 +1,73 @@
+"""[pytest] Tests for curiousksp.standin with the stock krpc client, which MissionControl's pool and telemetry use."""
+import time
+
+import curio
+
+from curiousksp import asynkrpc
+from curiousksp.missioncontrol import MissionControl
+from curiousksp.standin import StandInServer
+
+
+def test_space_center_and_streams_with_stock_client():
+    """Check krpc.connect works against the stand-in, including SpaceCenter classes and a pushed status stream."""
+    def use(conn):
+        sc = conn.space_center
+        values = (sc.active_vessel.name, [v.mass for v in sc.vessels], sc.funds)
+        stream = conn.add_stream(conn.krpc.get_status)
+        stream.rate = 100
+        updates = []
+        stream.add_callback(updates.append)
+        stream.start()
+        time.sleep(0.1)
+        stream.remove()
+        return values, updates
+
+    async def main():
+        server = await StandInServer().add_space_center().start()
+        mc = MissionControl(krpc_port=server.port, krpcs_port=server.stream_port)
+        conn = await mc.connect("test")
+        values, updates = await curio.run_in_thread(use, conn)
+        await curio.run_in_thread(conn.close)
+        await server.stop()
+        return values, updates
+
+    values, updates = curio.run(main)
+    assert values == ("Untitled Space Craft", [5000.0], 25000.0)
+    assert len(updates) >= 3 and updates[-1].version == "standin"
+
+
+def test_injected_latency():
+    """Check the server-wide latency delays calls, and that a procedure's own latency overrides it."""
+    async def main():
+        server = await StandInServer(latency=0.05).add_space_center(["get_UT"]).start()
+        server.add_procedure("Test", "Fast", lambda: None, latency=0)
+        client = await asynkrpc.connect("test", rpc_port=server.port)
+        start = await curio.clock()
+        await client.get_status()
+        slow = await curio.clock() - start
+        start = await curio.clock()
+        await client.invoke("Test", "Fast")
+        fast = await curio.clock() - start
+        await client.close()
+        await server.stop()
+        return slow, fast
+
+    slow, fast = curio.run(main)
+    assert slow >= 0.05 and fast < 0.05
+
+
+def test_concurrent_clients_are_served_as_themselves():
+    """Check calls of several clients served at once - each sleeping out the latency - answer for their own client."""
+    async def main():
+        server = await StandInServer(latency=0.02).start()
+        clients = [await asynkrpc.connect(f"test{i}", rpc_port=server.port) for i in range(3)]
+        async with curio.TaskGroup() as g:
+            tasks = [await g.spawn(client.invoke, "KRPC", "GetClientID") for client in clients]
+        ids = [task.result for task in tasks]
+        for client in clients:
+            await client.close()
+        await server.stop()
+        return [client.client_id for client in clients], ids
+
+    expected, ids = curio.run(main)
+    assert ids == expected and len(set(ids)) == 3
@@ -0,0 +1,35 @@
+"""[pytest] Import-time benchmark for curiousksp startup, measured with `python -X importtime` in a new interpreter."""
+import subprocess
+import sys
+
+# modules the cli must not pay for at import - they are only needed once a MissionControl runs
+HEAVY_MODULES = {"pint", "krpc", "curio", "curio.monitor", "numpy"}
+# generous budget (seconds) for importing the cli, the point is to catch an eager import of a heavy module sneaking back
+CLI_IMPORT_BUDGET = 1.0
+
+
+def _importtime(code):
+    """Return {module: cumulative import seconds} for running code in a fresh interpreter with -X importtime."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def test_cli_import_time(record_property):
+    """Check that importing the cli skips the heavy modules and stays within its budget."""
+    times = _importtime("import curiousksp.cli")
+    record_property("curiousksp.cli import seconds", times["curiousksp.cli"])
+    assert not HEAVY_MODULES & set(times)
+    assert times["curiousksp.cli"] < CLI_IMPORT_BUDGET
+
+
+def test_unit_registry_is_built_on_first_use():
+    """Check that pint is only imported when `curiousksp.ureg` is first used."""
+    assert "pint" not in _importtime("import curiousksp")
+    assert "pint" in _importtime("import curiousksp; curiousksp.ureg.second")
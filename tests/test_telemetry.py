@@ -0,0 +1,78 @@
+"""[pytest] Tests for curiousksp.telemetry."""
+import threading
+from functools import partial
+
+import curio
+
+from curiousksp.asyncrpc import AsyncClient
+from curiousksp.telemetry import Telemetry
+
+
+class FakeStream:
+    """Stand-in for krpc.stream.Stream that lets a test push updates from its own thread."""
+
+    def __init__(self):
+        self.callbacks, self.rate, self.started, self.removed = [], 0, False, False
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def start(self, wait=True):
+        self.started = True
+
+    def remove(self):
+        self.removed = True
+
+    def push(self, value):
+        for callback in self.callbacks:
+            callback(value)
+
+
+class FakeConn:
+    """Stand-in for krpc.client.Client that records the streams added to it."""
+
+    def __init__(self):
+        self.streams = []
+
+    def add_stream(self, func, *args):
+        self.streams.append(stream := FakeStream())
+        return stream
+
+
+def test_fan_out_from_stream_thread():
+    """Check that updates pushed from a foreign thread reach every subscriber and registering is idempotent."""
+    conn = FakeConn()
+
+    async def main():
+        telemetry = Telemetry(AsyncClient(conn))
+        # registrations racing for the same key add a single stream
+        async with curio.TaskGroup() as g:
+            for _ in range(3):
+                await g.spawn(partial(telemetry.register, "alt", len, rate=10))
+        stream = await telemetry.register("alt", len)
+        assert all(task.result is stream for task in g.tasks)
+        a, b = telemetry.subscribe("alt"), telemetry.subscribe("alt")
+        pusher = threading.Thread(target=lambda: [stream.push(v) for v in (1, 2)])
+        pusher.start()
+        received = [await a.get(), await a.get(), await b.get(), await b.get()]
+        pusher.join()
+        await telemetry.close()
+        await telemetry.conn.close()
+        return telemetry, stream, received
+
+    telemetry, stream, received = curio.run(main)
+    assert len(conn.streams) == 1 and stream.rate == 10 and stream.started and stream.removed
+    assert received == [1, 2, 1, 2]
+    assert telemetry.latest("alt") == 2
+
+
+def test_full_subscriber_drops_updates():
+    """Check that a subscriber that is not keeping up has updates dropped instead of blocking the publisher."""
+    telemetry = Telemetry(None, maxsize=2)
+    q = telemetry.subscribe("alt")
+    for v in range(5):
+        telemetry._publish("alt", v)
+    assert q.qsize() == 2 and telemetry.dropped == 3
+    telemetry.unsubscribe("alt", q)
+    telemetry._publish("alt", 5)
+    assert q.qsize() == 2 and telemetry.latest("alt") == 5
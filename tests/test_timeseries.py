@@ -0,0 +1,52 @@
+"""[pytest] Tests for curiousksp.timeseries."""
+import numpy as np
+
+from curiousksp.timeseries import TimeSeriesStore
+
+
+def test_downsampling_and_ring_wraparound():
+    """Check the 1 s buckets aggregate the raw samples and that the raw ring keeps only the newest capacity rows."""
+    store = TimeSeriesStore(resolutions={0: 8, 1: 4})
+    for i in range(20):
+        # 4 samples per second: t = 100.0, 100.25, ...
+        store.record("rate", i, t=100 + i / 4)
+    raw = store.query("rate")
+    assert list(raw["mean"]) == list(range(12, 20))
+    store.flush()
+    buckets = store.query("rate", resolution=1)
+    # 5 buckets of 4 samples in a ring of 4: the first one has been overwritten
+    assert list(buckets["t"]) == [101, 102, 103, 104]
+    assert list(buckets["mean"]) == [5.5, 9.5, 13.5, 17.5]
+    assert list(buckets["min"]) == [4, 8, 12, 16] and list(buckets["n"]) == [4] * 4
+    assert list(store.query("rate", resolution=1, start=102, end=104)["t"]) == [102, 103]
+
+
+def test_flush_then_more_samples_updates_the_open_bucket(tmp_path):
+    """Check a flushed open bucket is rewritten, not duplicated, and that the rings persist across reopening."""
+    store = TimeSeriesStore(tmp_path / "tsdb", resolutions={0: 16, 60: 4})
+    store.record("krpc.status.rpc_rate", 1.0, t=0)
+    store.flush()
+    store.record("krpc.status.rpc_rate", 3.0, t=30)
+    store.close()
+    reopened = TimeSeriesStore(tmp_path / "tsdb", resolutions={0: 16, 60: 4})
+    assert reopened.names == ["krpc.status.rpc_rate"]
+    minutes = reopened.query("krpc.status.rpc_rate", resolution=60)
+    assert len(minutes) == 1 and minutes["mean"][0] == 2.0 and minutes["n"][0] == 2
+    # the reopened raw ring carries on after the newest row
+    reopened.record("krpc.status.rpc_rate", 5.0, t=45)
+    assert np.array_equal(reopened.query("krpc.status.rpc_rate")["mean"], [1.0, 3.0, 5.0])
+
+
+def test_reopened_store_carries_on_the_open_bucket(tmp_path):
+    """Check samples recorded after reopening fold into the bucket the last session left open, not a second row."""
+    store = TimeSeriesStore(tmp_path / "tsdb", resolutions={0: 16, 60: 4})
+    for t, value in ((0, 1.0), (10, 3.0)):
+        store.record("rate", value, t=t)
+    store.close()
+    reopened = TimeSeriesStore(tmp_path / "tsdb", resolutions={0: 16, 60: 4})
+    reopened.record("rate", 8.0, t=20)
+    reopened.record("rate", 10.0, t=70)
+    reopened.flush()
+    minutes = reopened.query("rate", resolution=60)
+    assert list(minutes["t"]) == [0, 60] and list(minutes["n"]) == [3, 1]
+    assert list(minutes["mean"]) == [4.0, 10.0] and minutes["min"][0] == 1.0 and minutes["max"][0] == 8.0
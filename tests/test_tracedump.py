@@ -0,0 +1,41 @@
+"""[pytest] Tests for curiousksp.debug.schedrecord and the curiousksp.tracedump analyzer."""
+import curio
+
+from curiousksp import tracedump
+from curiousksp.debug import schedrecord
+
+
+async def _napper():
+    for _ in range(3):
+        await curio.sleep(0.01)
+
+
+async def _main():
+    task = await curio.spawn(_napper)
+    await task.join()
+
+
+def test_record_dump_and_analyze(tmp_path):
+    """Check that a kernel run is recorded, dumped and rebuilt into per-task run/wait timelines."""
+    recorder = schedrecord(path=tmp_path / "run.trace")
+    with curio.Kernel(debug=[recorder]) as kernel:
+        kernel.run(_main)
+    records, meta = tracedump.read_dump(recorder.dump())
+    assert len(records) == recorder.count
+    rows = {r["name"]: r for r in tracedump.summary(records, meta)}
+    napper = next(r for name, r in rows.items() if name.endswith("_napper"))
+    # 3 sleeps + the final cycle that returns
+    assert napper["cycles"] == 4 and napper["wait_total"] >= 0.03
+    spans = tracedump.timelines(records, meta)[napper["id"]]
+    assert {detail for kind, _, _, detail in spans if kind == "wait"} == {"TIME_SLEEP"}
+    assert "_napper" in tracedump.analyze(recorder.path)
+
+
+def test_ring_wraps_oldest_first(tmp_path):
+    """Check that once the ring wraps, only the newest capacity records are read back, in order."""
+    recorder = schedrecord(path=tmp_path / "small.trace", capacity=8)
+    with curio.Kernel(debug=[recorder]) as kernel:
+        kernel.run(_main)
+    records, _ = tracedump.read_dump(recorder.dump())
+    assert recorder.count > 8 and len(records) == 8
+    assert [r[0] for r in records] == sorted(r[0] for r in records)
@@ -0,0 +1,19 @@
+"""[pytest] Tests for curiousksp.units."""
+import pytest
+
+from curiousksp import ureg
+from curiousksp.units import compact, convert
+
+
+@pytest.mark.parametrize("magnitude", [0, 1.5e-7, 3e-5, 0.00123, 0.001, 0.5, 2.5, 999, 999.96, 12345,
+                                       123456, 12345678901, 1e30, 1e-33, -0.02])
+@pytest.mark.parametrize("symbol,unit", [("s", "second"), ("B", "byte"), ("B/s", "byte / second")])
+def test_compact_matches_pint(magnitude, symbol, unit):
+    """Check that compact renders the same string as pint's `to_compact()` with `~P.1f`."""
+    assert compact(magnitude, symbol) == f"{ureg.Quantity(magnitude, unit).to_compact():~P.1f}"
+
+
+def test_convert():
+    """Check conversions through the cached conversion factors."""
+    assert convert(36, "km/h", "m/s") == pytest.approx(10)
+    assert convert(2, "kB", "B") == pytest.approx(2000)
@@ -0,0 +1,107 @@
+"""[pytest] Tests for curiousksp.tasks.vessel."""
+import curio
+import pytest
+
+from curiousksp.standin import StandInServer
+from curiousksp.tasks import BULK, FLIGHT_CONTROL, HIGH, NORMAL, VesselManager
+
+
+def test_jobs_run_by_priority_then_deadline():
+    """Check queued jobs run most urgent first: by priority, then by earliest deadline, then in submission order."""
+    order = []
+
+    async def job(manager, label):
+        order.append(label)
+        await curio.sleep(0)
+
+    async def main():
+        manager = VesselManager(conn=None)
+        # occupy the only slot with a job that can't be preempted while the rest queue up
+        blocker = await manager.submit(job, "blocker", priority=HIGH)
+        jobs = [await manager.submit(job, "bulk", priority=BULK),
+                await manager.submit(job, "normal late", priority=NORMAL, deadline=10),
+                await manager.submit(job, "normal", priority=NORMAL),
+                await manager.submit(job, "normal soon", priority=NORMAL, deadline=1)]
+        for j in [blocker, *jobs]:
+            await j.wait()
+        return manager
+
+    manager = curio.run(main)
+    assert order == ["blocker", "normal soon", "normal late", "normal", "bulk"]
+    assert manager.completed == 5 and manager.preempted == 0
+
+
+def test_flight_control_preempts_bulk_work():
+    """Check a due flight control job preempts running bulk work, which is then restarted and completes."""
+    events = []
+    started = curio.Event()
+
+    async def collect_science(manager):
+        events.append("science start")
+        await started.set()
+        await curio.sleep(0.05)
+        events.append("science done")
+        return "science"
+
+    async def landing_burn(manager):
+        events.append("burn")
+        return "landed"
+
+    async def main():
+        manager = VesselManager(conn=None)
+        science = await manager.submit(collect_science, priority=BULK)
+        await started.wait()
+        # preempting goes by priority alone, the deadline only counts a late start - leave it room on a loaded machine
+        burn = await manager.submit(landing_burn, priority=FLIGHT_CONTROL, deadline=60)
+        return manager, await burn.wait(), await science.wait(), science
+
+    manager, burn, science, job = curio.run(main)
+    assert (burn, science) == ("landed", "science")
+    assert events == ["science start", "burn", "science start", "science done"]
+    assert manager.preempted == 1 and job.preemptions == 1 and manager.missed == 0
+
+
+def test_failures_and_close():
+    """Check a failing job raises from wait() and that closing fails queued jobs and refuses new ones."""
+    async def fail(manager):
+        raise ValueError("no fuel")
+
+    async def hold(manager):
+        await curio.sleep(1)
+
+    async def main():
+        manager = VesselManager(conn=None)
+        with pytest.raises(ValueError, match="no fuel"):
+            await manager.run(fail, priority=HIGH)
+        running = await manager.submit(hold, priority=HIGH)
+        queued = await manager.submit(hold, priority=HIGH)
+        await manager.close()
+        for job in (running, queued):
+            with pytest.raises(RuntimeError):
+                await job.wait()
+        with pytest.raises(RuntimeError, match="closed"):
+            await manager.submit(fail)
+        return manager
+
+    assert curio.run(main).failed == 1
+
+
+def test_close_closes_an_owned_connection():
+    """Check closing a manager that opened its own connection closes it, but not a connection it was given."""
+    async def status(manager):
+        return await manager.conn.get_status()
+
+    async def main():
+        server = await StandInServer().add_space_center().start()
+        owner = await VesselManager.connect(1, rpc_port=server.port)
+        shared = VesselManager(owner.conn, owner.vessel, name="shared")
+        value = await owner.run(status)
+        await shared.close()
+        await shared.conn.get_status()
+        await owner.close()
+        with pytest.raises(ConnectionError):
+            await owner.conn.get_status()
+        await server.stop()
+        return value
+
+    assert curio.run(main).version == "standin"